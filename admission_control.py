@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+語音請求准入控制模組
+同時處理的對話數有上限，其餘請求在有界佇列中等待；佇列已滿時立即拒絕（429），
+排隊逾時則返回 503，兩者都附上依近期處理時間估算的 Retry-After 秒數。
+另提供非同步工作（job）登記，讓用戶端取得 job ID 後輪詢結果，不必佔住 HTTP 連線。
+
+多 worker 部署時，處理中與排隊中的數量放在 fork 前建立的共享記憶體（shared_counters），
+所有 worker 共用同一組上限；工作狀態則存在 MongoDB（MongoJobStore），任一 worker 都能查詢。
+"""
+
+import math
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta, timezone
+
+from shared_counters import SharedCounters
+
+
+class AdmissionRejected(Exception):
+    """請求未獲准入（status 為建議的 HTTP 狀態碼，retry_after 為建議重試秒數）"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    有界佇列 + 並行上限
+    reserve() 佔用一個排隊位置（佇列滿時立即拒絕），acquire() 等待處理名額，release() 歸還名額
+    shared=True 時計數跨行程共用（須在 fork 前建立），其餘統計仍為各行程各自累計
+    """
+
+    def __init__(self, max_active=8, max_queue=32, queue_timeout=60.0, shared=False):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._counters = SharedCounters(('active', 'queued'), shared=shared)
+        self._cond = threading.Condition()  # 本行程內的統計與等待通知
+
+        # 統計
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.peak_queued = 0
+        self.total_wait = 0.0
+        self._avg_service_time = None  # 處理時間的指數移動平均
+
+    @property
+    def active(self):
+        return self._counters.get('active')
+
+    @property
+    def queued(self):
+        return self._counters.get('queued')
+
+    def reclaim(self, pid):
+        """扣回已結束 worker 仍佔用的名額（由 gunicorn 主行程在 child_exit 呼叫）"""
+        return self._counters.reclaim(pid)
+
+    def retry_after(self, position=None):
+        """估算排在第 position 位的請求需要等待的秒數（至少 1 秒）"""
+        service_time = self._avg_service_time or 5.0
+        position = self.queued + 1 if position is None else position
+        return max(1, math.ceil(service_time * position / max(1, self.max_active)))
+
+    def reserve(self):
+        """佔用一個排隊位置；處理中與排隊中的數量已達上限時拋出 AdmissionRejected(429)"""
+        with self._cond:
+            with self._counters.lock:
+                full = self.active + self.queued >= self.max_active + self.max_queue
+                if not full:
+                    self._counters.add('queued', 1)
+                    self.peak_queued = max(self.peak_queued, self.queued)
+            if full:
+                self.rejected_full += 1
+                raise AdmissionRejected('伺服器忙碌中，請稍後再試', 429, self.retry_after())
+
+    def acquire(self, timeout=None):
+        """
+        以已佔用的排隊位置等待處理名額，返回開始處理的時間（交給 release 計算處理時間）
+        timeout 預設為 queue_timeout，0 表示不限時；逾時拋出 AdmissionRejected(503)
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.time()
+        with self._cond:
+            while True:
+                with self._counters.lock:
+                    if self.active < self.max_active:
+                        self._counters.add('queued', -1)
+                        self._counters.add('active', 1)
+                        break
+                remaining = None if not timeout else timeout - (time.time() - start)
+                if remaining is not None and remaining <= 0:
+                    with self._counters.lock:
+                        self._counters.add('queued', -1)
+                    self.rejected_timeout += 1
+                    raise AdmissionRejected('排隊等待逾時，請稍後再試', 503, self.retry_after())
+                self._cond.wait(self._counters.wait_timeout(remaining))
+            self.admitted += 1
+            self.total_wait += time.time() - start
+        return time.time()
+
+    def release(self, started_at=None):
+        """歸還處理名額，並以本次處理時間更新平均值"""
+        with self._cond:
+            with self._counters.lock:
+                self._counters.add('active', -1)
+            if started_at is not None:
+                elapsed = time.time() - started_at
+                if self._avg_service_time is None:
+                    self._avg_service_time = elapsed
+                else:
+                    self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+            self._cond.notify()
+
+    def cancel(self):
+        """放棄已佔用但尚未開始處理的排隊位置"""
+        with self._counters.lock:
+            self._counters.add('queued', -1)
+
+    def stats(self):
+        """返回佇列深度與拒絕統計"""
+        with self._cond:
+            return {
+                'active': self.active,
+                'queued': self.queued,
+                'max_active': self.max_active,
+                'max_queue': self.max_queue,
+                'peak_queued': self.peak_queued,
+                'admitted': self.admitted,
+                'rejected_full': self.rejected_full,
+                'rejected_timeout': self.rejected_timeout,
+                'avg_wait': (self.total_wait / self.admitted) if self.admitted else 0.0,
+                'avg_service_time': self._avg_service_time,
+                'retry_after_estimate': self.retry_after(),
+            }
+
+
+class JobStore:
+    """非同步工作登記表（記憶體內，完成的工作保留 ttl 秒後清除；只有建立工作的行程查得到）"""
+
+    shared = False
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self):
+        """登記新工作，返回 job ID"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._purge_locked()
+            self._jobs[job_id] = {'status': 'queued', 'created': time.time(), 'updated': time.time()}
+        return job_id
+
+    def update(self, job_id, status, result=None, http_status=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['status'] = status
+            job['updated'] = time.time()
+            if result is not None:
+                job['result'] = result
+                job['http_status'] = http_status
+
+    def get(self, job_id):
+        """返回工作狀態的複本，不存在（或已過期）時返回 None"""
+        with self._lock:
+            self._purge_locked()
+            job = self._jobs.get(job_id)
+            return dict(job, job_id=job_id) if job else None
+
+    def _purge_locked(self):
+        now = time.time()
+        expired = [k for k, job in self._jobs.items()
+                   if job['status'] in ('done', 'failed') and now - job['updated'] > self.ttl]
+        for k in expired:
+            del self._jobs[k]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+
+def _utcnow():
+    """MongoDB 以不帶時區的 UTC 時間比較 TTL"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class MongoJobStore:
+    """
+    非同步工作登記表（MongoDB，多 worker 共用，任一 worker 都能查詢工作狀態）
+    完成的工作保留 ttl 秒；排隊或處理中的工作最多保留 pending_ttl 秒（worker 異常結束時不會永久殘留），
+    過期文件由 expire_at 的 TTL 索引清除，TTL 清除前查詢時也視為不存在
+    """
+
+    shared = True
+
+    def __init__(self, collection, ttl=600, pending_ttl=86400):
+        self.collection = collection
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+
+    def ensure_indexes(self):
+        try:
+            self.collection.create_index('expire_at', expireAfterSeconds=0)
+            return True
+        except Exception as e:
+            print(f"⚠️ 非同步工作 TTL 索引建立失敗: {e}")
+            return False
+
+    def create(self):
+        """登記新工作，返回 job ID"""
+        job_id = uuid.uuid4().hex
+        now = _utcnow()
+        self.collection.insert_one({
+            '_id': job_id,
+            'status': 'queued',
+            'created': time.time(),
+            'updated': time.time(),
+            'expire_at': now + timedelta(seconds=self.pending_ttl),
+        })
+        return job_id
+
+    def update(self, job_id, status, result=None, http_status=None):
+        fields = {'status': status, 'updated': time.time()}
+        if status in ('done', 'failed'):
+            fields['expire_at'] = _utcnow() + timedelta(seconds=self.ttl)
+        if result is not None:
+            fields['result'] = result
+            fields['http_status'] = http_status
+        self.collection.update_one({'_id': job_id}, {'$set': fields})
+
+    def get(self, job_id):
+        """返回工作狀態，不存在（或已過期）時返回 None"""
+        job = self.collection.find_one({'_id': job_id})
+        if job is None or job.get('expire_at', datetime.max) <= _utcnow():
+            return None
+        job.pop('expire_at', None)
+        job['job_id'] = job.pop('_id')
+        return job
+
+    def stats(self):
+        counts = {}
+        for row in self.collection.aggregate([
+            {'$match': {'expire_at': {'$gt': _utcnow()}}},
+            {'$group': {'_id': '$status', 'count': {'$sum': 1}}},
+        ]):
+            counts[row['_id']] = row['count']
+        return counts
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+台語語音對話服務 (ASGI 非同步版)
+與 app_local.py 提供相同的路由（/process_audio、/tts、/tts_stream、/generate_flashcard、/health），
+STT 與 Ollama 兩個上游改用 httpx.AsyncClient，等待辨識與模型回應時不佔用執行緒，
+單一行程即可同時服務大量連線；解碼、靜音裁切、品質檢查、資料庫與檔案寫入等阻塞工作交給共用執行緒池。
+
+標音（含快取與相同文字的請求合併）、TTS（分段並行合成、串流播放）與准入控制
+直接呼叫 app_local 的實作，設定與環境變數也與 Flask 版相同。
+
+啟動:
+    hypercorn app_asgi:app --bind 0.0.0.0:5050
+    python app_asgi.py
+"""
+
+import os
+import time
+import asyncio
+import threading
+from functools import partial
+from urllib.parse import quote, urlencode
+
+import httpx
+from quart import Quart, Response, request, jsonify
+
+import app_local as core
+import audio_vad
+import wav_utils
+from admission_control import AdmissionRejected
+from http_clients import upstream_policy
+from audio_decoder import decode_audio_bytes, TARGET_SAMPLE_RATE
+
+ASGI_PORT = int(os.getenv('ASGI_PORT', '5050'))
+
+# 各上游的逾時（秒）與 Flask 版相同
+UPSTREAM_TIMEOUTS = {'stt': 60, 'ollama': 30}
+
+app = Quart(__name__)
+
+# 非同步 HTTP 用戶端（啟動時建立，每個上游一個連線池）
+clients = {}
+
+debug_print = core.debug_print
+
+
+async def run_blocking(func, *args, **kwargs):
+    """將阻塞工作交給共用執行緒池"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(core.pipeline_executor, partial(func, *args, **kwargs))
+
+
+def _create_client(upstream, timeout):
+    policy = upstream_policy(upstream)
+    return httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=policy['pool_size'], max_keepalive_connections=policy['pool_size']),
+        transport=httpx.AsyncHTTPTransport(retries=policy['retries']),
+        headers={'User-Agent': 'TaiwaneseVoiceChat/1.0'},
+    )
+
+
+@app.before_serving
+async def startup():
+    """初始化共用資源與非同步 HTTP 用戶端"""
+    await run_blocking(core.init_services)
+    for upstream, timeout in UPSTREAM_TIMEOUTS.items():
+        clients[upstream] = _create_client(upstream, timeout)
+    print(f"🚀 ASGI 服務已準備就緒: http://0.0.0.0:{ASGI_PORT}")
+
+
+@app.after_serving
+async def shutdown():
+    for client in clients.values():
+        await client.aclose()
+    clients.clear()
+
+
+@app.after_request
+async def add_cors_headers(response):
+    """與 Flask 版的 CORS(app) 相同，允許跨來源請求"""
+    response.headers.setdefault('Access-Control-Allow-Origin', '*')
+    response.headers.setdefault('Access-Control-Allow-Headers', 'Content-Type')
+    response.headers.setdefault('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+    return response
+
+
+# ===== 准入控制 =====
+
+async def acquire_admission():
+    """
+    以已佔用的排隊位置等待處理名額（與 Flask 版共用 core.admission），返回開始處理的時間
+    等待在 job_executor 中進行（容量為處理中 + 排隊上限），不佔用 pipeline 執行緒池；
+    等待中用戶端斷線時，取得名額後立即歸還
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(core.job_executor, core.admission.acquire)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(lambda f: f.exception() is None and core.admission.release())
+        raise
+
+
+def admission_rejected_response(error):
+    """未獲准入的回應（429 / 503），附 Retry-After 標頭"""
+    response = jsonify(core.admission_rejected_body(error))
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+# ===== 上游呼叫 =====
+
+async def upload_audio_for_transcription(wav_bytes, filename='recording.wav'):
+    """上傳 WAV 至 STT 服務，返回辨識文字（失敗返回空字串）"""
+    try:
+        response = await clients['stt'].post(
+            f"{core.REMOTE_STT_URL}/transcribe",
+            files={'audio': (filename, wav_bytes, 'audio/wav')},
+        )
+        if response.status_code != 200:
+            debug_print(f"遠端 STT 服務錯誤: {response.status_code} {response.text[:200]}")
+            return ""
+        result = response.json()
+        if result.get('success'):
+            return result.get('transcription', '')
+        debug_print(f"遠端 STT 辨識失敗: {result.get('error', '未知錯誤')}")
+        return ""
+    except Exception as e:
+        debug_print(f"遠端 STT 服務連線失敗: {e}")
+        return ""
+
+
+async def transcribe_audio_chunks(chunk_wavs):
+    """各段同時上傳 STT，依原順序合併辨識結果"""
+    if len(chunk_wavs) == 1:
+        return await upload_audio_for_transcription(chunk_wavs[0])
+    texts = await asyncio.gather(*[
+        upload_audio_for_transcription(wav, f'recording_part{i}.wav') for i, wav in enumerate(chunk_wavs)
+    ])
+    return ' '.join(t for t in texts if t)
+
+
+async def chat_with_ollama(text, session_id=None):
+    """呼叫 Ollama 產生回應（失敗時返回預設回應）；指定 session_id 時帶入最近幾輪的上下文"""
+    try:
+        # 快取未命中時可能讀取一次資料庫，放到執行緒池
+        prompt, extra = await run_blocking(core.prepare_llm_request, text, session_id)
+        response = await clients['ollama'].post(
+            f"{core.LOCAL_OLLAMA_URL}/api/generate",
+            json={'model': core.LLM_MODEL, 'prompt': prompt, 'stream': False,
+                  'keep_alive': core.OLLAMA_KEEP_ALIVE, **extra},
+        )
+        if response.status_code == 200:
+            result = response.json()
+            reply = result.get('response', '').strip()
+            if reply:
+                core.remember_llm_reply(text, session_id, reply, prompt, extra, result.get('context'))
+            return reply or "好的！"
+        debug_print(f"本地 LLM API 失敗: {response.status_code}")
+    except Exception as e:
+        debug_print(f"本地 LLM 對話失敗: {e}")
+    return "好的！"
+
+
+async def pronounce_and_convert(text, step_times):
+    """台語標音 + 羅馬拼音轉數字調（app_local 的實作：本地詞庫 → 標音快取 → 意傳 API，相同文字只呼叫一次）"""
+    return await run_blocking(core.pronounce_and_convert, text, step_times)
+
+
+async def synthesize_speech(pronounced):
+    """TTS 合成（多句時分段並行合成），返回音檔路徑（失敗返回 None）"""
+    if not core.remote_tts_service:
+        return None
+    return await run_blocking(core.synthesize_speech, pronounced['numeric_tone_text'], pronounced['numeric_tone_chunks'])
+
+
+class AsyncSpeechStream:
+    """
+    將 RemoteTtsService.open_speech_stream 的串流包成非同步迭代器，每個區塊在執行緒池讀取
+    Quart 送完回應、用戶端斷線或 HEAD 請求時都會呼叫 aclose()（即使從未開始迭代），關閉上游並釋放 TTS 名額
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._chunks = iter(stream)
+        # 讀取中的區塊仍在執行緒中時，關閉須等它結束（產生器執行中不能關閉）
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            return next(self._chunks, None)
+
+    def _close(self):
+        with self._lock:
+            self._stream.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await run_blocking(self._next)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    async def aclose(self):
+        # 不等待結果：請求被取消時關閉仍會在執行緒池中完成
+        core.pipeline_executor.submit(self._close)
+
+
+# ===== 語音對話流程 =====
+
+def prepare_audio(audio_data):
+    """（執行緒池）解碼、裁切靜音並切段，返回 (vad 結果, 各段 WAV)"""
+    pcm = decode_audio_bytes(audio_data, ffmpeg_path=core.ffmpeg_path)
+    vad = audio_vad.trim_and_split(
+        pcm, TARGET_SAMPLE_RATE,
+        trim=core.VAD_TRIM_ENABLED, split=core.VAD_SPLIT_LONG, max_seconds=core.STT_MAX_CHUNK_SECONDS
+    )
+    chunk_wavs = [wav_utils.write_wav_bytes(chunk, TARGET_SAMPLE_RATE) for chunk in vad['chunks']]
+    return vad, chunk_wavs
+
+
+async def handle_voice_request(audio_data, content_type, options, step_times, total_start_time):
+    """非同步處理一段錄音，返回 (回應內容, HTTP 狀態碼)"""
+    core.archive_upload(audio_data, content_type)
+
+    step_start = time.time()
+    try:
+        vad, chunk_wavs = await run_blocking(prepare_audio, audio_data)
+    except Exception as e:
+        debug_print(f"音檔解碼失敗: {e}")
+        return {'error': '音檔格式轉換失敗'}, 400
+    step_times['音檔格式轉換'] = time.time() - step_start
+
+    # 品質檢查與 STT 上傳同時進行；品質不合格時取消上傳
+    step_start = time.time()
+    stt_task = asyncio.ensure_future(transcribe_audio_chunks(chunk_wavs))
+    verdict = await run_blocking(core.analyze_audio_quality, vad['pcm'], TARGET_SAMPLE_RATE)
+    step_times['音訊品質檢查'] = time.time() - step_start
+    if not verdict['ok']:
+        stt_task.cancel()
+        return {'error': '無法辨識台語語音內容', 'audio_qc': verdict}, 400
+    recognized_text = await stt_task
+    step_times['語音辨識'] = time.time() - step_start
+    if not recognized_text:
+        return {'error': '無法辨識台語語音內容', 'audio_qc': verdict}, 400
+
+    step_start = time.time()
+    if options['skip_llm']:
+        ai_response = "跳過 LLM 對話"
+    else:
+        # 回應快取命中時不呼叫模型
+        ai_response = (core.cached_llm_reply(recognized_text, options['session_id'])
+                       or await chat_with_ollama(recognized_text, options['session_id']))
+    step_times['LLM對話'] = time.time() - step_start
+
+    # 資料庫保存與標音同時進行
+    async def save():
+        if options['skip_db']:
+            return True, False
+        start = time.time()
+        saved = await run_blocking(
+            core.save_chat_history, options['session_id'], options['user_id'],
+            options['chat_choose_id'], options['title'], recognized_text, ai_response
+        )
+        step_times['資料庫保存'] = time.time() - start
+        return saved
+
+    (_, is_max_turns), pronounced = await asyncio.gather(save(), pronounce_and_convert(ai_response, step_times))
+    if is_max_turns:
+        ai_response = core.MAX_TURNS_MESSAGE
+        pronounced = await pronounce_and_convert(ai_response, step_times)
+
+    audio_file_path = None
+    audio_stream_url = None
+    if options['skip_tts']:
+        pass
+    elif options['stream_tts']:
+        audio_stream_url = f"/voice-service/tts_stream?{urlencode({'numeric': pronounced['numeric_tone_text']})}"
+    else:
+        step_start = time.time()
+        audio_file_path = await synthesize_speech(pronounced)
+        step_times['語音合成'] = time.time() - step_start
+
+    total_time = time.time() - total_start_time
+    return {
+        'success': True,
+        'transcription': recognized_text,
+        'ai_response': ai_response,
+        'romanization': pronounced['romanization'],
+        'numeric_tone_text': pronounced['numeric_tone_text'],
+        'segmented': pronounced['segmented'],
+        'kiatko_count': len(pronounced['kiatko']),
+        'audio_url': f"/voice-service/{audio_file_path}" if audio_file_path else None,
+        'audio_segments': None,
+        'audio_stream_url': audio_stream_url,
+        'api_info': f"使用遠端 STT: {core.REMOTE_STT_URL}, 遠端 LLM: {core.LOCAL_OLLAMA_URL} (ASGI)",
+        'chat_status': {
+            'session_id': options['session_id'],
+            'is_finished': is_max_turns,
+            'max_turns_reached': is_max_turns
+        },
+        'performance_stats': {
+            'total_time': total_time,
+            'step_times': step_times,
+            'bottleneck': max(step_times, key=step_times.get) if step_times else None,
+            'audio_qc': verdict,
+            'original_audio_duration': vad['original_duration'],
+            'trimmed_audio_duration': vad['trimmed_duration'],
+            'stt_chunks': len(chunk_wavs)
+        }
+    }, 200
+
+
+# ===== 路由 =====
+
+@app.route('/health')
+async def health():
+    """健康檢查端點"""
+    return jsonify({
+        "status": "healthy",
+        "server": "asgi",
+        "timestamp": time.time(),
+        "admission": core.admission.stats(),
+        "tts_cache": core.remote_tts_service.audio_cache.stats() if core.remote_tts_service and core.remote_tts_service.audio_cache else None,
+        "pronunciation_cache": core.pronunciation_cache.stats() if core.pronunciation_cache else None,
+        "local_pronunciation": core.local_pronunciation_engine.stats() if core.local_pronunciation_engine else None,
+        "http_clients": core.get_http_client_stats(),
+    })
+
+
+@app.route('/process_audio', methods=['POST'])
+async def process_audio():
+    """處理語音檔案"""
+    total_start_time = time.time()
+    step_times = {}
+    try:
+        files = await request.files
+        if 'audio' not in files:
+            return jsonify({'error': '沒有收到音檔'}), 400
+        audio_file = files['audio']
+        if audio_file.filename == '':
+            return jsonify({'error': '音檔名稱為空'}), 400
+
+        audio_data = audio_file.read()
+        if len(audio_data) == 0:
+            return jsonify({'error': '音檔數據為空'}), 400
+
+        options = core.read_pipeline_options(await request.form)
+
+        # 准入控制：佇列已滿時立即拒絕，不再對上游發出任何請求
+        try:
+            core.admission.reserve()
+        except AdmissionRejected as e:
+            debug_print(f"拒絕請求: {e}")
+            return admission_rejected_response(e)
+
+        step_start = time.time()
+        try:
+            started_at = await acquire_admission()
+        except AdmissionRejected as e:
+            debug_print(f"排隊逾時: {e}")
+            return admission_rejected_response(e)
+        step_times['排隊等待'] = time.time() - step_start
+        try:
+            result, status = await handle_voice_request(
+                audio_data, audio_file.content_type or 'audio/webm', options, step_times, total_start_time
+            )
+        finally:
+            core.admission.release(started_at)
+        return jsonify(result), status
+    except Exception as e:
+        debug_print(f"處理錯誤: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+async def _text_to_speech_result(require_audio):
+    data = await request.get_json()
+    if not data or 'text' not in data:
+        return jsonify({'success': False, 'error': '請求缺少文字內容'}), 400
+    text = data['text'].strip()
+    if not text:
+        return jsonify({'success': False, 'error': '文字內容不可為空'}), 400
+
+    pronounced = await pronounce_and_convert(text, {})
+    if not pronounced['romanization']:
+        return jsonify({'success': False, 'error': '無法取得羅馬拼音'}), 500
+    if require_audio and not core.remote_tts_service:
+        return jsonify({'success': False, 'error': 'TTS服務未初始化'}), 500
+
+    audio_file_path = await synthesize_speech(pronounced)
+    if require_audio and not audio_file_path:
+        return jsonify({'success': False, 'error': '語音合成失敗'}), 500
+    return jsonify({
+        'success': True,
+        'original_text': text,
+        'romanization': pronounced['romanization'],
+        'numeric_tone_text': pronounced['numeric_tone_text'],
+        'audio_url': f'/voice-service/{audio_file_path}' if audio_file_path else None
+    })
+
+
+@app.route('/tts', methods=['POST'])
+async def tts():
+    """台語文字轉語音 API"""
+    try:
+        return await _text_to_speech_result(require_audio=True)
+    except Exception as e:
+        debug_print(f"TTS 處理失敗: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/tts_stream', methods=['GET', 'POST'])
+async def tts_stream():
+    """
+    串流台語語音 API（與 Flask 版相同）：參數 text（漢字，先標音）或 numeric（已轉好的數字調文字），
+    GET 查詢字串或 POST JSON 皆可
+    """
+    try:
+        data = (await request.get_json(silent=True)) or request.args
+        text = (data.get('text') or '').strip()
+        numeric_tone_text = (data.get('numeric') or '').strip()
+        if not text and not numeric_tone_text:
+            return jsonify({'success': False, 'error': '請求缺少文字內容'}), 400
+        if not core.remote_tts_service:
+            return jsonify({'success': False, 'error': 'TTS服務未初始化'}), 500
+
+        if not numeric_tone_text:
+            pronounced = await pronounce_and_convert(text, {})
+            if not pronounced['romanization']:
+                return jsonify({'success': False, 'error': '無法取得羅馬拼音'}), 500
+            numeric_tone_text = pronounced['numeric_tone_text']
+
+        stream = await run_blocking(core.remote_tts_service.open_speech_stream, numeric_tone_text)
+        if not stream:
+            return jsonify({'success': False, 'error': '語音合成失敗'}), 502
+
+        chunks, content_type = stream
+        return Response(
+            AsyncSpeechStream(chunks),
+            mimetype=content_type,
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+                'X-Numeric-Tone-Text': quote(numeric_tone_text),
+            }
+        )
+    except Exception as e:
+        debug_print(f"串流 TTS 處理失敗: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/generate_flashcard', methods=['POST'])
+async def generate_flashcard():
+    """產生字母卡的後端 API"""
+    try:
+        return await _text_to_speech_result(require_audio=False)
+    except Exception as e:
+        debug_print(f"字母卡產生失敗: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+if __name__ == '__main__':
+    try:
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+        config = Config()
+        config.bind = [f"0.0.0.0:{ASGI_PORT}"]
+        asyncio.run(serve(app, config))
+    except ImportError:
+        app.run(host='0.0.0.0', port=ASGI_PORT)
@@ -7,26 +7,44 @@
 
 import os
 import time
+import atexit
+import threading
+import queue
 import tempfile
 import subprocess
 import re
+import json
 import numpy as np
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Blueprint, render_template, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 # 載入 .env 檔案
 from dotenv import load_dotenv
 load_dotenv()
-import requests
 from urllib.parse import urlencode, quote
 import glob
 
 # 匯入 TTS 服務和格式轉換器
 from remote_tts_service import RemoteTtsService
 from romanization_converter import RomanizationConverter
+from pronunciation_cache import PronunciationCache, SqlitePronunciationStore, MongoPronunciationStore
+from local_pronunciation import LocalPronunciationEngine
+import wav_utils
+from stage_graph import StageGraph, StopPipeline
+from http_clients import (get_session, get_http_client_stats, reset_sessions, reclaim_shared_slots,
+                          upstream_policy, UPSTREAM_QUEUE_TIMEOUT)
+from audio_decoder import decode_audio_bytes, decoder_backend, TARGET_SAMPLE_RATE
+import audio_qc
+import audio_vad
+from admission_control import AdmissionController, AdmissionRejected, JobStore, MongoJobStore
+from ollama_scheduler import OllamaBatchScheduler
+from chat_history_store import ChatHistoryWriter, ChatTurnStore, chat_turn_entries, chat_turn_pipeline
+from conversation_context import ConversationContextCache, estimate_tokens, pair_history
+from reply_cache import ReplyCache
 
 # 本地服務配置（原遠端服務現在運行在本地）
 REMOTE_STT_URL = os.getenv('REMOTE_STT_URL', 'http://localhost:5001')
@@ -35,93 +53,218 @@ REMOTE_OLLAMA_URL = os.getenv('REMOTE_OLLAMA_URL', 'http://localhost:11434')
 LOCAL_OLLAMA_URL = os.getenv('LOCAL_OLLAMA_URL', 'http://localhost:11434')
 LLM_MODEL = os.getenv('LLM_MODEL', 'gemma3:4b')
 USE_LOCAL_OLLAMA = True  # 使用本地 Ollama 服務
+# 串流模式：邊生成邊依子句送標音與 TTS（可由請求參數 stream_llm 覆寫）
+OLLAMA_STREAMING = os.getenv('OLLAMA_STREAMING', 'false').lower() == 'true'
+# Ollama 微批次排程：收集視窗（毫秒）、每批上限、並行數（建議與 Ollama 的 OLLAMA_NUM_PARALLEL 相同）與模型常駐時間
+OLLAMA_BATCHING = os.getenv('OLLAMA_BATCHING', 'true').lower() == 'true'
+OLLAMA_BATCH_WINDOW_MS = float(os.getenv('OLLAMA_BATCH_WINDOW_MS', '20'))
+OLLAMA_BATCH_MAX = int(os.getenv('OLLAMA_BATCH_MAX', '16'))
+OLLAMA_PARALLEL = int(os.getenv('OLLAMA_PARALLEL', '4'))
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+OLLAMA_WARM_UP = os.getenv('OLLAMA_WARM_UP', 'true').lower() == 'true'
+# 多輪對話上下文：帶入最近幾輪（0 表示停用）並限制 token 預算；可沿用時以 Ollama 返回的 context 接續
+LLM_CONTEXT_TURNS = int(os.getenv('LLM_CONTEXT_TURNS', '4'))
+LLM_CONTEXT_TOKEN_BUDGET = int(os.getenv('LLM_CONTEXT_TOKEN_BUDGET', '512'))
+LLM_CONTEXT_SESSIONS = int(os.getenv('LLM_CONTEXT_SESSIONS', '2000'))
+LLM_CONTEXT_TTL = float(os.getenv('LLM_CONTEXT_TTL', '1800'))
+LLM_REUSE_OLLAMA_CONTEXT = os.getenv('LLM_REUSE_OLLAMA_CONTEXT', 'true').lower() == 'true'
+# LLM 回應快取：常見短句直接使用先前的回應，每句最多保留 LLM_REPLY_CACHE_VARIANTS 種回應輪流使用
+LLM_REPLY_CACHE = os.getenv('LLM_REPLY_CACHE', 'true').lower() == 'true'
+LLM_REPLY_CACHE_SIZE = int(os.getenv('LLM_REPLY_CACHE_SIZE', '1000'))
+LLM_REPLY_CACHE_TTL = float(os.getenv('LLM_REPLY_CACHE_TTL', '3600'))
+LLM_REPLY_CACHE_VARIANTS = int(os.getenv('LLM_REPLY_CACHE_VARIANTS', '1'))
+LLM_REPLY_CACHE_MAX_CHARS = int(os.getenv('LLM_REPLY_CACHE_MAX_CHARS', '20'))
+STREAM_TTS_WORKERS = int(os.getenv('STREAM_TTS_WORKERS', '3'))
+# 分段 TTS：長回應依句號類停頓切段後並行合成再合併
+TTS_CHUNKED = os.getenv('TTS_CHUNKED', 'true').lower() == 'true'
+# 連讀變調：送往 TTS 的數字調文字依片語套用變調（預設關閉），腔調 chang（漳腔）/ chuan（泉腔）
+TONE_SANDHI_ENABLED = os.getenv('TONE_SANDHI_ENABLED', 'false').lower() == 'true'
+TONE_SANDHI_VARIANT = os.getenv('TONE_SANDHI_VARIANT', 'chang').lower()
+# 處理階段共用執行緒池大小
+PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', '16'))
+
+# 准入控制（多 worker 部署時所有 worker 合計）：同時處理的對話數上限、排隊上限與排隊逾時
+ADMISSION_MAX_ACTIVE = int(os.getenv('ADMISSION_MAX_ACTIVE', '8'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '32'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '60'))
+ASYNC_JOB_TTL = int(os.getenv('ASYNC_JOB_TTL', '600'))  # 非同步工作結果保留秒數
+# worker 數（由 gunicorn.conf.py 設定）；多 worker 時非同步工作狀態須存在 MongoDB，輪詢才不會落到別的 worker
+SERVICE_WORKERS = int(os.getenv('VOICE_SERVICE_WORKERS', '1'))
 
 # MongoDB 配置
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017')
 DATABASE_NAME = os.getenv('DATABASE_NAME', 'taiwanese_learning')
 
-app = Flask(__name__)
-CORS(app)  # 啟用 CORS 支援
+# 錄音封存（預設不寫入磁碟，開啟後於背景非同步保存原始錄音）
+ARCHIVE_UPLOADS = os.getenv('ARCHIVE_UPLOADS', 'false').lower() == 'true'
+UPLOAD_ARCHIVE_DIR = os.getenv('UPLOAD_ARCHIVE_DIR', 'uploads/archive')
+
+# 上傳 STT 前裁掉前後靜音；超過 STT_MAX_CHUNK_SECONDS 的語句切段後並行辨識
+VAD_TRIM_ENABLED = os.getenv('VAD_TRIM_ENABLED', 'true').lower() == 'true'
+VAD_SPLIT_LONG = os.getenv('VAD_SPLIT_LONG', 'true').lower() == 'true'
+STT_MAX_CHUNK_SECONDS = float(os.getenv('STT_MAX_CHUNK_SECONDS', '30'))
+STT_CHUNK_WORKERS = int(os.getenv('STT_CHUNK_WORKERS', '3'))
+
+# 對話輪數設定
+MAX_TURNS = 5  # 對話最大輪數
+
+# 對話紀錄延後寫入：請求不等待 MongoDB，背景依筆數或時間批次寫入，無法連線時暫存於本地檔案
+CHAT_HISTORY_WRITE_BEHIND = os.getenv('CHAT_HISTORY_WRITE_BEHIND', 'true').lower() == 'true'
+CHAT_HISTORY_QUEUE_SIZE = int(os.getenv('CHAT_HISTORY_QUEUE_SIZE', '10000'))
+CHAT_HISTORY_BATCH_SIZE = int(os.getenv('CHAT_HISTORY_BATCH_SIZE', '100'))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv('CHAT_HISTORY_FLUSH_INTERVAL', '0.5'))
+CHAT_HISTORY_SPILL_DIR = os.getenv('CHAT_HISTORY_SPILL_DIR', 'data/chat_history_spill')
+# 對話紀錄儲存方式: embedded（ChatHistory 單一文件內的 history 陣列）/ turns（ChatSessions 摘要 + ChatTurns 每輪一份文件）
+CHAT_HISTORY_LAYOUT = os.getenv('CHAT_HISTORY_LAYOUT', 'embedded').lower()
+MAX_TURNS_MESSAGE = "對話已達到最大輪數（5輪），感謝您的參與！請重新選擇對話主題，我們可以開始新的對話！"
+
+# 標音快取配置（持久層可選: sqlite / mongo / none）
+PRONUNCIATION_CACHE_SIZE = int(os.getenv('PRONUNCIATION_CACHE_SIZE', '4096'))
+PRONUNCIATION_CACHE_BACKEND = os.getenv('PRONUNCIATION_CACHE_BACKEND', 'sqlite').lower()
+PRONUNCIATION_CACHE_DB = os.getenv('PRONUNCIATION_CACHE_DB', 'pronunciation_cache.sqlite3')
+PRONUNCIATION_PREWARM_MAX_WORKERS = int(os.getenv('PRONUNCIATION_PREWARM_MAX_WORKERS', '4'))  # 預載同時呼叫意傳 API 的上限
+
+# 本地標音詞庫配置（詞庫外文字才調用意傳 API）
+LOCAL_PRONUNCIATION_ENABLED = os.getenv('LOCAL_PRONUNCIATION_ENABLED', 'true').lower() == 'true'
+LOCAL_LEXICON_PATHS = [p for p in os.getenv('LOCAL_LEXICON_PATHS', 'data/taiwanese_lexicon.tsv').split(',') if p]
+LOCAL_LEXICON_LEARN = os.getenv('LOCAL_LEXICON_LEARN', 'false').lower() == 'true'
+LOCAL_LEXICON_LEARNED_PATH = os.getenv('LOCAL_LEXICON_LEARNED_PATH', 'data/learned_lexicon.tsv')
+
+# 路由集中在 Blueprint，由 create_app() 建立應用程式時註冊
+voice_bp = Blueprint('voice', __name__)
 
 # 全域變數
-CLEANUP_FILES = False  # 是否清理臨時檔案（暫時關閉以便調試）
 remote_tts_service = None
 romanization_converter = None
+pronunciation_cache = None
+local_pronunciation_engine = None
+ollama_scheduler = None
 ffmpeg_path = None  # FFmpeg 路徑
 mongo_client = None
 db = None
+chat_history_unique_index = False  # ChatHistory.session_id 唯一索引是否可用（啟動時建立）
+chat_history_writer = None
+chat_turn_store = None  # CHAT_HISTORY_LAYOUT=turns 時使用
+_shared_initialized = False
+pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix='pipeline')
+archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive')
+stt_chunk_executor = ThreadPoolExecutor(max_workers=STT_CHUNK_WORKERS, thread_name_prefix='stt-chunk')
+# 計數放在共享記憶體，須在 fork 之前（模組載入時）建立
+admission = AdmissionController(ADMISSION_MAX_ACTIVE, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT, shared=True)
+job_store = JobStore(ttl=ASYNC_JOB_TTL)  # MongoDB 可用時於 init_worker_resources 換成 MongoJobStore
+reply_cache = ReplyCache(
+    max_entries=LLM_REPLY_CACHE_SIZE, ttl=LLM_REPLY_CACHE_TTL,
+    variants=LLM_REPLY_CACHE_VARIANTS, max_text_chars=LLM_REPLY_CACHE_MAX_CHARS
+) if LLM_REPLY_CACHE else None
+llm_context = ConversationContextCache(
+    max_turns=LLM_CONTEXT_TURNS, token_budget=LLM_CONTEXT_TOKEN_BUDGET, max_sessions=LLM_CONTEXT_SESSIONS,
+    ttl=LLM_CONTEXT_TTL, reuse_ollama_context=LLM_REUSE_OLLAMA_CONTEXT,
+    loader=lambda session_id, turns: load_recent_turns(session_id, turns)
+)
+# 非同步工作各自在執行緒中排隊等待名額，執行緒數需容納處理中與排隊中的全部工作
+job_executor = ThreadPoolExecutor(max_workers=ADMISSION_MAX_ACTIVE + ADMISSION_MAX_QUEUE, thread_name_prefix='voice-job')
 
 def debug_print(message):
     """調試輸出函數"""
     print(f"[DEBUG] {message}")
 
+def ensure_chat_history_indexes():
+    """建立 ChatHistory 的 session_id 唯一索引（已存在時不做任何事）"""
+    global chat_history_unique_index
+    chat_history_unique_index = False
+    if db is None:
+        return False
+    try:
+        db.ChatHistory.create_index("session_id", unique=True)
+        chat_history_unique_index = True
+    except Exception as e:
+        # 既有重複資料或同名但非唯一的索引：保留現狀，save_chat_history 改用不依賴唯一索引的寫法
+        print(f"⚠️ 建立 ChatHistory.session_id 唯一索引失敗: {e}")
+    return chat_history_unique_index
+
+def _save_chat_history_without_unique_index(session_id, new_chat, pipeline, max_turns):
+    """
+    沒有唯一索引時不可對「輪數未滿」的篩選條件 upsert（輪數已滿時會另建一份重複文件）：
+    先只更新既有文件，篩選不到時再以 session_id 為條件 $setOnInsert 新增對話
+    """
+    chat_history = db.ChatHistory.find_one_and_update(
+        {"session_id": session_id, "turn": {"$lt": max_turns}},
+        pipeline,
+        projection={"turn": 1, "finished": 1, "_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if chat_history is not None:
+        return True, chat_history.get('finished', False)
+    
+    result = db.ChatHistory.update_one({"session_id": session_id}, {"$setOnInsert": new_chat}, upsert=True)
+    if result.upserted_id is not None:
+        debug_print(f"創建新對話紀錄: session_id={session_id}")
+        return True, False
+    
+    debug_print(f"對話已達到最大輪數 {max_turns}，標記為結束")
+    db.ChatHistory.update_one({"session_id": session_id}, {"$set": {"finished": True}})
+    return True, True
+
 def save_chat_history(session_id, user_id, chat_choose_id, title, user_text, ai_response):
-    """保存對話紀錄到 MongoDB"""
+    """
+    保存對話紀錄到 MongoDB
+    以單一 find_one_and_update（upsert）在伺服器端完成「檢查輪數 → 附加對話 → 更新輪數與結束狀態」，
+    同一 session 的並行請求也不會超過最大輪數
+    """
     try:
-        if not db:
+        if chat_history_writer:
+            # 延後寫入：只同步遞增輪數（一次往返），對話內容由背景執行緒批次寫入
+            return chat_history_writer.record_turn(session_id, user_id, chat_choose_id, title, user_text, ai_response)
+        
+        if chat_turn_store:
+            return chat_turn_store.append_turn(session_id, user_id, chat_choose_id, title, user_text, ai_response)
+        
+        if db is None:
             debug_print("資料庫連接未初始化")
             return False, False  # 返回 (成功狀態, 是否達到最大輪數)
-            
-        # 查找現有的對話紀錄
-        chat_history = db.ChatHistory.find_one({"session_id": session_id})
         
-        if chat_history:
-            # 檢查是否已達到最大輪數
-            current_turn = chat_history.get('turn', 0)
-            max_turns = 5  # 設定最大輪數為5
-            
-            if current_turn >= max_turns:
+        max_turns = MAX_TURNS  # 設定最大輪數
+        entries = chat_turn_entries(user_text, ai_response)
+        pipeline = chat_turn_pipeline(user_id, chat_choose_id, title, entries, max_turns)
+        
+        if not chat_history_unique_index:
+            new_chat = {
+                "userId": user_id,
+                "chatChooseId": chat_choose_id,
+                "title": title,
+                "score": 0,
+                "turn": 1,
+                "finished": False,
+                "history": entries
+            }
+            return _save_chat_history_without_unique_index(session_id, new_chat, pipeline, max_turns)
+        
+        # 第一次的重複鍵錯誤可能是兩個請求同時新增同一 session，重試一次即可分辨
+        for attempt in range(2):
+            try:
+                chat_history = db.ChatHistory.find_one_and_update(
+                    {"session_id": session_id, "turn": {"$lt": max_turns}},
+                    pipeline,
+                    upsert=True,
+                    projection={"turn": 1, "finished": 1, "_id": 0},
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                if attempt == 0:
+                    continue
+                # session 已存在但輪數已滿（篩選不到文件，upsert 又撞到唯一索引）
                 debug_print(f"對話已達到最大輪數 {max_turns}，標記為結束")
-                # 標記對話為結束
                 db.ChatHistory.update_one(
-                    {"session_id": session_id},
+                    {"session_id": session_id, "finished": {"$ne": True}},
                     {"$set": {"finished": True}}
                 )
                 return True, True  # 成功保存，但達到最大輪數
             
-            # 更新現有紀錄
-            new_turn = current_turn + 1
-            is_finished = new_turn >= max_turns
-            
-            db.ChatHistory.update_one(
-                {"session_id": session_id},
-                {
-                    "$push": {
-                        "history": {
-                            "$each": [
-                                {"role": "user", "text": user_text, "ts": datetime.now()},
-                                {"role": "assistant", "text": ai_response, "ts": datetime.now()}
-                            ]
-                        }
-                    },
-                    "$inc": {"turn": 1},
-                    "$set": {"finished": is_finished}
-                }
-            )
-            debug_print(f"更新對話紀錄: session_id={session_id}, turn={new_turn}, finished={is_finished}")
-            
+            is_finished = chat_history.get('finished', False)
+            debug_print(f"保存對話紀錄: session_id={session_id}, turn={chat_history.get('turn')}, finished={is_finished}")
             if is_finished:
                 debug_print(f"對話已達到最大輪數 {max_turns}，標記為結束")
-            
             return True, is_finished
-        else:
-            # 創建新的對話紀錄
-            new_chat = {
-                "session_id": session_id,
-                "userId": user_id,
-                "chatChooseId": chat_choose_id,
-                "title": title,
-                "score": 0,
-                "turn": 1,
-                "finished": False,
-                "history": [
-                    {"role": "user", "text": user_text, "ts": datetime.now()},
-                    {"role": "assistant", "text": ai_response, "ts": datetime.now()}
-                ]
-            }
-            db.ChatHistory.insert_one(new_chat)
-            debug_print(f"創建新對話紀錄: session_id={session_id}")
-            return True, False
         
     except Exception as e:
         debug_print(f"保存對話紀錄失敗: {e}")
@@ -150,65 +293,6 @@ def performance_timer(func_name):
         return wrapper
     return decorator
 
-def convert_webm_with_ffmpeg(webm_file):
-    """使用 FFmpeg 將 webm 轉換為 wav"""
-    global ffmpeg_path
-    
-    if not ffmpeg_path:
-        debug_print("FFmpeg 不可用")
-        return None
-    
-    try:
-        debug_print(f"使用 FFmpeg 轉換: {webm_file}")
-        
-        # 檢查輸入檔案
-        if not os.path.exists(webm_file):
-            debug_print(f"輸入檔案不存在: {webm_file}")
-            return None
-            
-        # 建立臨時檔案
-        temp_wav = os.path.join(
-            os.path.dirname(webm_file),
-            f"temp_{int(time.time()*1000)}.wav"
-        )
-        
-        # FFmpeg 命令
-        cmd = [
-            ffmpeg_path,
-            '-y',  # 覆寫輸出檔案
-            '-i', webm_file,  # 輸入
-            '-acodec', 'pcm_s16le',  # 音訊編碼
-            '-ar', '16000',  # 採樣率
-            '-ac', '1',  # 單聲道
-            '-hide_banner',  # 隱藏橫幅
-            '-loglevel', 'error',  # 只顯示錯誤
-            temp_wav  # 輸出
-        ]
-        
-        debug_print(f"執行命令: {' '.join(cmd)}")
-        
-        # 執行轉換
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode == 0:
-            if os.path.exists(temp_wav) and os.path.getsize(temp_wav) > 0:
-                debug_print(f"FFmpeg 轉換成功: {temp_wav}")
-                return temp_wav
-            else:
-                debug_print("轉換後的檔案無效")
-                return None
-        else:
-            debug_print(f"FFmpeg 轉換失敗: {result.stderr}")
-            return None
-            
-    except Exception as e:
-        debug_print(f"FFmpeg 轉換出錯: {e}")
-        return None
-
 def cleanup_temp_files():
     """清理 static 和 uploads 目錄中的臨時音檔"""
     print("🧹 開始清理臨時音檔...")
@@ -244,61 +328,63 @@ def log_step_time(step_name, duration, details=""):
     """記錄步驟執行時間"""
     print(f"📊 【{step_name}】耗時: {duration:.3f}秒 {details}")
 
-def transcribe_taiwanese_audio_remote(audio_file_path):
-    """使用遠端 STT 服務進行台語語音辨識"""
+def analyze_audio_quality(audio_source, sample_rate=16000):
+    """
+    檢查音訊長度和品質，返回 audio_qc 判定結果（ok 為 False 表示不應送出辨識）
+    audio_source 可為已解碼的 int16 PCM 陣列、WAV 位元組，或音檔路徑
+    """
     try:
-        debug_print(f"使用遠端 STT 服務辨識: {audio_file_path}")
-        
-        if not os.path.exists(audio_file_path):
-            debug_print("音檔不存在")
-            return ""
-        
-        # 檢查檔案資訊
-        file_size = os.path.getsize(audio_file_path)
-        debug_print(f"音檔大小: {file_size} bytes")
+        if isinstance(audio_source, np.ndarray):
+            verdict = audio_qc.analyze_pcm(audio_source, sample_rate)
+        else:
+            if isinstance(audio_source, (bytes, bytearray)):
+                data = bytes(audio_source)
+            else:
+                with open(audio_source, 'rb') as f:
+                    data = f.read()
+            if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+                verdict = audio_qc.analyze_wav_bytes(data)
+            else:
+                verdict = audio_qc.analyze_pcm(decode_audio_bytes(data, ffmpeg_path=ffmpeg_path), TARGET_SAMPLE_RATE)
         
-        # 使用 librosa 檢查音訊長度和品質
-        try:
-            import librosa
-            audio_data, sr = librosa.load(audio_file_path, sr=16000, mono=True)
-            duration = len(audio_data) / sr
-            
-            # 計算音訊能量（音量）
-            rms = np.sqrt(np.mean(audio_data**2))
-            max_amplitude = np.max(np.abs(audio_data))
+        debug_print(f"音訊時長: {verdict['duration']:.2f}秒 ({verdict['samples']} 樣本, {verdict['sample_rate']}Hz)")
+        debug_print(f"音訊能量 (RMS): {verdict['rms']:.6f}")
+        debug_print(f"最大振幅: {verdict['peak']:.6f}")
+        debug_print(f"削波比例: {verdict['clipping_ratio']:.4f}, 語音比例: {verdict['speech_ratio']:.2f}")
+        for warning in verdict['warnings']:
+            debug_print(f"⚠️ {warning}，可能影響辨識效果")
+        if not verdict['ok']:
+            debug_print(f"⚠️ {verdict['reason']}，不送出辨識")
+        return verdict
             
-            debug_print(f"音訊時長: {duration:.2f}秒 ({len(audio_data)} 樣本, {sr}Hz)")
-            debug_print(f"音訊能量 (RMS): {rms:.6f}")
-            debug_print(f"最大振幅: {max_amplitude:.6f}")
-            
-            if duration < 0.5:
-                debug_print("⚠️ 音訊太短（< 0.5秒），可能影響辨識效果")
-                return ""  # 直接返回空字串，避免發送太短的音檔
-            elif duration > 30:
-                debug_print("⚠️ 音訊太長（> 30秒），可能影響辨識效果")
-            elif rms < 0.001:
-                debug_print("⚠️ 音訊太安靜（RMS < 0.001），可能影響辨識效果")
-                return ""  # 直接返回空字串，避免發送太安靜的音檔
-            elif max_amplitude < 0.01:
-                debug_print("⚠️ 音訊振幅太小（< 0.01），可能影響辨識效果")
-                return ""  # 直接返回空字串，避免發送振幅太小的音檔
-                
-        except Exception as e:
-            debug_print(f"無法分析音訊: {e}")
-            # 如果無法分析音訊，仍然嘗試發送，但記錄警告
-        
+    except Exception as e:
+        debug_print(f"無法分析音訊: {e}")
+        # 如果無法分析音訊，仍然嘗試發送，但記錄警告
+        return {'ok': True, 'reason': None, 'warnings': [f"無法分析音訊: {e}"]}
+
+def upload_audio_for_transcription(audio_source, filename='recording.wav'):
+    """
+    將音訊上傳到遠端 STT 服務，返回辨識文字（失敗返回空字串）
+    audio_source 可為記憶體中的 WAV 位元組，或音檔路徑
+    """
+    try:
         # 準備上傳的檔案
-        with open(audio_file_path, 'rb') as f:
-            files = {'audio': (os.path.basename(audio_file_path), f, 'audio/wav')}
-            
-            debug_print(f"發送到: {REMOTE_STT_URL}/transcribe")
-            
-            # 發送到遠端 STT 服務
-            response = requests.post(
-                f"{REMOTE_STT_URL}/transcribe",
-                files=files,
-                timeout=60
-            )
+        if isinstance(audio_source, (bytes, bytearray)):
+            wav_bytes = audio_source
+        else:
+            filename = os.path.basename(audio_source)
+            with open(audio_source, 'rb') as f:
+                wav_bytes = f.read()
+        files = {'audio': (filename, wav_bytes, 'audio/wav')}
+        
+        debug_print(f"發送到: {REMOTE_STT_URL}/transcribe")
+        
+        # 發送到遠端 STT 服務
+        response = get_session('stt').post(
+            f"{REMOTE_STT_URL}/transcribe",
+            files=files,
+            timeout=60
+        )
         
         debug_print(f"STT 回應狀態碼: {response.status_code}")
         if response.status_code != 200:
@@ -321,6 +407,33 @@ def transcribe_taiwanese_audio_remote(audio_file_path):
         debug_print(f"遠端 STT 服務連線失敗: {e}")
         return ""
 
+def transcribe_audio_chunks(chunk_wavs):
+    """長語句切段後並行上傳 STT，依原順序合併辨識結果"""
+    if len(chunk_wavs) == 1:
+        return upload_audio_for_transcription(chunk_wavs[0])
+    futures = [
+        stt_chunk_executor.submit(upload_audio_for_transcription, wav, f'recording_part{i}.wav')
+        for i, wav in enumerate(chunk_wavs)
+    ]
+    texts = [f.result() for f in futures]
+    return ' '.join(t for t in texts if t)
+
+def transcribe_taiwanese_audio_remote(audio_file_path):
+    """使用遠端 STT 服務進行台語語音辨識（先檢查音訊品質再上傳）"""
+    debug_print(f"使用遠端 STT 服務辨識: {audio_file_path}")
+    
+    if not os.path.exists(audio_file_path):
+        debug_print("音檔不存在")
+        return ""
+    
+    # 檢查檔案資訊
+    file_size = os.path.getsize(audio_file_path)
+    debug_print(f"音檔大小: {file_size} bytes")
+    
+    if not analyze_audio_quality(audio_file_path)['ok']:
+        return ""
+    return upload_audio_for_transcription(audio_file_path)
+
 def clean_transcription_result(text):
     """清理辨識結果文字"""
     if not text:
@@ -348,37 +461,61 @@ ITHUAN_API = {
     }
 }
 
+ITHUAN_TIMEOUT = 15  # 意傳 API 單次請求逾時秒數
+
+def ithuan_worst_case_seconds():
+    """意傳 API 一次查詢最長可能耗時：每次嘗試逾時 ×（重試次數 + 1）+ 重試退避 + 等待並行名額"""
+    policy = upstream_policy('ithuan')
+    backoff = sum(policy['backoff'] * 2 ** i for i in range(1, policy['retries'] + 1))
+    queue_wait = UPSTREAM_QUEUE_TIMEOUT if policy['max_concurrency'] else 0
+    return ITHUAN_TIMEOUT * (policy['retries'] + 1) + backoff + queue_wait
+
+# 相同文字合併查詢時，其餘請求等待帶頭請求的最長秒數（需涵蓋帶頭請求的最壞情況，否則會提早放棄而改用原文）
+PRONUNCIATION_COALESCE_WAIT = ithuan_worst_case_seconds() + 1
+
 # API使用限制
 API_LIMITS = {
     "文字長度限制": 200   # 建議單次查詢不超過200字
 }
 
-@performance_timer("台語標音轉換")
-def get_taiwanese_pronunciation(text):
-    """調用意傳科技標音 API"""
-    try:
-        debug_print(f"獲取台語標音: '{text}'")
-        
-        if len(text) > API_LIMITS["文字長度限制"]:
-            debug_print("文字過長，截斷處理")
-            text = text[:API_LIMITS["文字長度限制"]]
+def parse_pronunciation_result(result, text):
+    """解析意傳標音 API 回應，返回 (羅馬拼音, 分詞, kiatko)，無法解析時返回 None"""
+    if 'kiatko' in result and result['kiatko']:
+        romanization_parts = []
+        for item in result['kiatko']:
+            if 'KIP' in item and item['KIP']:
+                romanization_parts.append(item['KIP'])
         
+        if romanization_parts:
+            romanization = ' '.join(romanization_parts)
+            debug_print(f"羅馬拼音: {romanization}")
+            return romanization, result.get('分詞', text), result['kiatko']
+    
+    if '分詞' in result:
+        segmented = result['分詞']
+        debug_print(f"分詞結果: {segmented}")
+        return segmented, segmented, []
+    return None
+
+def fetch_taiwanese_pronunciation(text):
+    """調用意傳科技標音 API，失敗時返回 None"""
+    try:
         api_config = ITHUAN_API["標音服務"]
         url = f"{api_config['網域']}{api_config['端點']}"
         
-        data = {'taibun': text.strip()}
+        data = {'taibun': text}
         
         debug_print(f"API 請求: {url}")
         
         api_start = time.time()
-        response = requests.post(
+        response = get_session('ithuan').post(
             url,
             data=data,
             headers={
                 'Content-Type': api_config['內容類型'],
                 'User-Agent': 'TaiwaneseVoiceChat/1.0'
             },
-            timeout=15
+            timeout=ITHUAN_TIMEOUT
         )
         api_time = time.time() - api_start
         log_step_time("　├─ 意傳標音API", api_time, f"狀態: {response.status_code}")
@@ -386,67 +523,155 @@ def get_taiwanese_pronunciation(text):
         debug_print(f"回應狀態: {response.status_code}")
         
         if response.status_code == 200:
-            result = response.json()
-            
-            if 'kiatko' in result and result['kiatko']:
-                romanization_parts = []
-                for item in result['kiatko']:
-                    if 'KIP' in item and item['KIP']:
-                        romanization_parts.append(item['KIP'])
-                
-                if romanization_parts:
-                    romanization = ' '.join(romanization_parts)
-                    debug_print(f"羅馬拼音: {romanization}")
-                    return romanization, result.get('分詞', text), result['kiatko']
-            
-            if '分詞' in result:
-                segmented = result['分詞']
-                debug_print(f"分詞結果: {segmented}")
-                return segmented, segmented, []
+            parsed = parse_pronunciation_result(response.json(), text)
+            if parsed:
+                return parsed
         
         debug_print("API 返回異常")
-        return text, text, []
+        return None
         
     except Exception as e:
         debug_print(f"標音 API 失敗: {e}")
+        return None
+
+def fetch_and_learn_pronunciation(text):
+    """調用意傳 API，並將結果加入本地學習詞庫（若啟用）"""
+    result = fetch_taiwanese_pronunciation(text)
+    if result and LOCAL_LEXICON_LEARN and local_pronunciation_engine:
+        learned = local_pronunciation_engine.learn(result[2])
+        if learned:
+            debug_print(f"本地詞庫新增 {learned} 筆")
+    return result
+
+@performance_timer("台語標音轉換")
+def get_taiwanese_pronunciation(text):
+    """取得台語標音（優先查詢快取，未命中才調用意傳科技標音 API）"""
+    debug_print(f"獲取台語標音: '{text}'")
+    
+    if len(text) > API_LIMITS["文字長度限制"]:
+        debug_print("文字過長，截斷處理")
+        text = text[:API_LIMITS["文字長度限制"]]
+    text = text.strip()
+    
+    # 優先使用本地詞庫
+    if local_pronunciation_engine:
+        result = local_pronunciation_engine.lookup(text)
+        if result:
+            debug_print(f"本地詞庫標音: {result[0]}")
+            return result
+    
+    if pronunciation_cache:
+        result = pronunciation_cache.get_or_fetch(text, fetch_and_learn_pronunciation,
+                                                  timeout=PRONUNCIATION_COALESCE_WAIT)
+    else:
+        result = fetch_and_learn_pronunciation(text)
+    
+    if result is None:
         return text, text, []
+    return result
+
+def prewarm_pronunciations(texts, max_workers=4):
+    """批次預先載入詞彙表的標音結果"""
+    if not pronunciation_cache:
+        return {'error': '標音快取未初始化'}
+    texts = [t[:API_LIMITS["文字長度限制"]] for t in texts if isinstance(t, str)]
+    return pronunciation_cache.prewarm(texts, fetch_and_learn_pronunciation, max_workers=max_workers)
+
+LLM_PROMPT_TEMPLATE = "請用繁體中文一句話簡單回應，回答不要超過20字：{text}"
+
+def build_llm_prompt(text, history=None):
+    """組合送給 LLM 的提示詞；history 為最近幾輪的 (使用者, 助理) 列表"""
+    prompt = LLM_PROMPT_TEMPLATE.format(text=text)
+    if not history:
+        return prompt
+    lines = ["先前的對話："]
+    for user_text, ai_response in history:
+        lines.append(f"學生：{user_text}")
+        lines.append(f"你：{ai_response}")
+    lines.append(prompt)
+    return "\n".join(lines)
+
+def load_recent_turns(session_id, turns):
+    """對話上下文快取未命中時，從資料庫讀取最近幾輪（每個 worker 每個 session 最多一次）"""
+    if chat_turn_store:
+        return pair_history(chat_turn_store.recent_history(session_id, turns))
+    if db is None:
+        return []
+    doc = db.ChatHistory.find_one({"session_id": session_id}, {"history": {"$slice": -turns * 2}, "_id": 0})
+    return pair_history((doc or {}).get('history'))
+
+def prepare_llm_request(text, session_id=None):
+    """組出本輪的提示詞與額外請求欄位（可沿用時帶入上一輪的 Ollama context）"""
+    prompt = build_llm_prompt(text)
+    if not session_id:
+        return prompt, {}
+    history, context = llm_context.prompt_context(session_id, reserve_tokens=estimate_tokens(prompt))
+    if context:
+        return prompt, {'context': context}
+    return build_llm_prompt(text, history), {}
+
+def cached_llm_reply(text, session_id=None):
+    """回應快取命中時返回快取的回應（並記入對話上下文），未命中時返回 None"""
+    if not reply_cache:
+        return None
+    reply = reply_cache.get(text, LLM_MODEL, LLM_PROMPT_TEMPLATE)
+    if reply:
+        llm_context.record(session_id, text, reply)
+    return reply
+
+def remember_llm_reply(text, session_id, reply, prompt, extra, context=None):
+    """記錄模型的回應：加入對話上下文；未帶先前對話生成的回應才放入回應快取（不會把別的對話內容帶給其他人）"""
+    llm_context.record(session_id, text, reply, context)
+    if reply_cache and not extra and prompt == build_llm_prompt(text):
+        reply_cache.put(text, LLM_MODEL, LLM_PROMPT_TEMPLATE, reply)
 
 @performance_timer("LLM智能對話")
-def chat_with_ollama_local(text):
+def chat_with_ollama_local(text, session_id=None):
     """
-    使用本地 Ollama LLM 進行對話
+    使用本地 Ollama LLM 進行對話；指定 session_id 時帶入同一對話最近幾輪的上下文
     """
     try:
         if USE_LOCAL_OLLAMA:
             debug_print(f"使用本地 LLM 對話處理: '{text}'")
             
             api_start = time.time()
+            prompt, extra = prepare_llm_request(text, session_id)
             
-            # 發送到本地 Ollama API
-            response = requests.post(
-                f"{LOCAL_OLLAMA_URL}/api/generate",
-                json={
-                    'model': LLM_MODEL,
-                    'prompt': f"請用繁體中文一句話簡單回應，回答不要超過20字：{text}",
-                    'stream': False
-                },
-                timeout=30
-            )
+            if ollama_scheduler:
+                # 經由微批次排程送出（與同時到達的請求合併、控制並行數）
+                result = ollama_scheduler.generate(prompt, **extra)
+                status_code = 200
+            else:
+                # 發送到本地 Ollama API
+                response = get_session('ollama').post(
+                    f"{LOCAL_OLLAMA_URL}/api/generate",
+                    json={
+                        'model': LLM_MODEL,
+                        'prompt': prompt,
+                        'stream': False,
+                        'keep_alive': OLLAMA_KEEP_ALIVE,
+                        **extra
+                    },
+                    timeout=30
+                )
+                status_code = response.status_code
+                result = response.json() if status_code == 200 else None
             
             api_time = time.time() - api_start
             log_step_time("　├─ 本地 Ollama API請求", api_time)
             
-            if response.status_code == 200:
-                result = response.json()
+            if status_code == 200:
                 if 'response' in result:
                     final_reply = result['response'].strip()
                     debug_print(f"本地 LLM 回應: '{final_reply}'")
+                    if final_reply:
+                        remember_llm_reply(text, session_id, final_reply, prompt, extra, result.get('context'))
                     return final_reply if final_reply else "好的！"
                 else:
                     debug_print(f"本地 LLM 回應格式異常: {result}")
                     return "好的！"
             else:
-                debug_print(f"本地 LLM API 失敗: {response.status_code}")
+                debug_print(f"本地 LLM API 失敗: {status_code}")
                 return "好的！"
         else:
             # 備用：使用遠端服務
@@ -466,7 +691,7 @@ def chat_with_ollama_remote(text):
         api_start = time.time()
         
         # 發送到遠端 Ollama 服務
-        response = requests.post(
+        response = get_session('ollama').post(
             f"{REMOTE_OLLAMA_URL}/api/generate",
             json={
                 'model': LLM_MODEL,
@@ -496,7 +721,388 @@ def chat_with_ollama_remote(text):
         debug_print(f"遠端 LLM 對話失敗: {e}")
         return "好的！"
 
-@app.route('/')
+# 子句切分標點（句末與子句停頓）
+CLAUSE_BREAK_PATTERN = re.compile(r'[^。！？!?，,；;：:、\n]*[。！？!?，,；;：:、\n]+')
+MIN_CLAUSE_CHARS = 2  # 太短的子句併入下一段，避免產生過碎的音檔
+
+def split_complete_clauses(buffer):
+    """從緩衝區切出已完成的子句，返回 (子句列表, 剩餘文字)"""
+    clauses = []
+    consumed = 0
+    pending = ''
+    for m in CLAUSE_BREAK_PATTERN.finditer(buffer):
+        pending += m.group(0)
+        consumed = m.end()
+        if len(pending.strip()) >= MIN_CLAUSE_CHARS:
+            clauses.append(pending.strip())
+            pending = ''
+    return clauses, pending + buffer[consumed:]
+
+def stream_ollama_clauses(text, session_id=None):
+    """
+    以串流模式呼叫本地 Ollama，逐行讀取 NDJSON，
+    每完成一個子句就 yield 出來
+    """
+    prompt, extra = prepare_llm_request(text, session_id)
+    response = get_session('ollama').post(
+        f"{LOCAL_OLLAMA_URL}/api/generate",
+        json={
+            'model': LLM_MODEL,
+            'prompt': prompt,
+            'stream': True,
+            'keep_alive': OLLAMA_KEEP_ALIVE,
+            **extra
+        },
+        stream=True,
+        timeout=30
+    )
+    try:
+        if response.status_code != 200:
+            raise RuntimeError(f"本地 LLM 串流 API 失敗: {response.status_code}")
+        
+        buffer = ''
+        reply = ''
+        context = None
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            chunk = json.loads(line)
+            buffer += chunk.get('response', '')
+            reply += chunk.get('response', '')
+            clauses, buffer = split_complete_clauses(buffer)
+            for clause in clauses:
+                yield clause
+            if chunk.get('done'):
+                # 最後一個區塊附帶本輪的 context
+                context = chunk.get('context')
+                break
+        
+        if buffer.strip():
+            yield buffer.strip()
+        if reply.strip():
+            remember_llm_reply(text, session_id, reply.strip(), prompt, extra, context)
+    finally:
+        response.close()
+
+def convert_numeric_tone(romanization, kiatko_data=None):
+    """
+    羅馬拼音轉數字調，返回 (整段文字, 依句切段的列表)
+    TONE_SANDHI_ENABLED 時套用連讀變調：有 kiatko 斷詞結果時依片語分組，否則只依標點分組
+    """
+    if not romanization_converter:
+        return romanization, None
+    if not TONE_SANDHI_ENABLED:
+        return (romanization_converter.convert_to_numeric_tone(romanization),
+                romanization_converter.convert_to_numeric_tone_chunks(romanization))
+    sandhi = romanization_converter.sandhi
+    if kiatko_data:
+        chunks = sandhi.apply_kiatko_chunks(kiatko_data, TONE_SANDHI_VARIANT)
+    else:
+        chunks = [sandhi.apply(s, TONE_SANDHI_VARIANT) for s in romanization_converter.split_sentences(romanization)]
+        chunks = [c for c in chunks if c]
+    return ' '.join(chunks), chunks
+
+def synthesize_clause(clause, synthesize=True):
+    """單一子句的 標音 → 數字調轉換 → TTS"""
+    romanization, segmented, kiatko_data = get_taiwanese_pronunciation(clause)
+    numeric_tone_text, _ = convert_numeric_tone(romanization, kiatko_data)
+    
+    audio_file_path = None
+    if synthesize and remote_tts_service:
+        audio_file_path = remote_tts_service.generate_speech(numeric_tone_text)
+    
+    return {
+        'text': clause,
+        'romanization': romanization,
+        'segmented': segmented,
+        'kiatko': kiatko_data,
+        'numeric_tone_text': numeric_tone_text,
+        'audio_file_path': audio_file_path,
+        'ready_at': time.time()
+    }
+
+@performance_timer("LLM串流對話與語音合成")
+def chat_and_speak_streaming(text, synthesize=True, session_id=None, on_segment=None):
+    """
+    串流取得 LLM 回應，每個子句完成後立即在背景進行標音與 TTS，
+    模型仍在生成時即可開始合成語音
+    on_segment(index, segment) 依子句順序在各子句完成時呼叫（前面的子句都完成後才輪到），
+    用於在整段回應完成前先送出已合成的子句
+    """
+    start_time = time.time()
+    futures = []
+    delivered = [0]
+    deliver_lock = threading.Lock()
+    
+    def deliver_ready(_=None):
+        with deliver_lock:
+            while delivered[0] < len(futures) and futures[delivered[0]].done():
+                future = futures[delivered[0]]
+                if future.exception() is not None:
+                    return  # 由下方 result() 拋出
+                try:
+                    on_segment(delivered[0], future.result())
+                except Exception as e:
+                    debug_print(f"子句送出失敗: {e}")
+                delivered[0] += 1
+    
+    try:
+        with ThreadPoolExecutor(max_workers=STREAM_TTS_WORKERS) as executor:
+            for clause in stream_ollama_clauses(text, session_id):
+                debug_print(f"LLM 子句完成 ({time.time() - start_time:.3f}秒): '{clause}'")
+                with deliver_lock:
+                    future = executor.submit(synthesize_clause, clause, synthesize)
+                    futures.append(future)
+                if on_segment:
+                    future.add_done_callback(deliver_ready)
+            llm_time = time.time() - start_time
+            segments = [f.result() for f in futures]
+    except Exception as e:
+        debug_print(f"本地 LLM 串流失敗: {e}")
+        return None
+    
+    if not segments:
+        return None
+    
+    # 依序合併各子句音檔
+    segment_paths = [seg['audio_file_path'] for seg in segments if seg['audio_file_path']]
+    audio_file_path = None
+    if len(segment_paths) == 1:
+        audio_file_path = segment_paths[0]
+    elif segment_paths:
+        os.makedirs("static", exist_ok=True)
+        audio_file_path = wav_utils.concat_wav_files(
+            segment_paths, f"static/stream_reply_{uuid.uuid4().hex}.wav"
+        )
+    
+    numeric_tone_text = ' '.join(seg['numeric_tone_text'] for seg in segments)
+    if segment_paths and not audio_file_path:
+        # 子句音檔無法合併時，改為整句重新合成
+        audio_file_path = remote_tts_service.generate_speech(numeric_tone_text)
+    
+    ready_times = [seg['ready_at'] for seg in segments if seg['audio_file_path']]
+    return {
+        'ai_response': ''.join(seg['text'] for seg in segments),
+        'romanization': ' '.join(seg['romanization'] for seg in segments),
+        'segmented': ' '.join(seg['segmented'] for seg in segments),
+        'kiatko': [item for seg in segments for item in seg['kiatko']],
+        'numeric_tone_text': numeric_tone_text,
+        'audio_file_path': audio_file_path,
+        'segment_paths': segment_paths,
+        'llm_time': llm_time,
+        'first_audio_time': (ready_times[0] - start_time) if ready_times else None
+    }
+
+def read_pipeline_options(form):
+    """讀取處理選項（在請求執行緒中讀取，階段執行緒無法存取 request）"""
+    stream_response = form.get('stream_response', 'false').lower() == 'true'
+    return {
+        # 檢查是否需要跳過某些步驟（用於單字挑戰等）
+        'skip_llm': form.get('skip_llm', 'false').lower() == 'true',
+        'skip_tts': form.get('skip_tts', 'false').lower() == 'true',
+        'skip_db': form.get('skip_db', 'false').lower() == 'true',
+        'stream_llm': form.get('stream_llm', str(OLLAMA_STREAMING or stream_response)).lower() == 'true',
+        # 串流播放：不等待合成完成，改返回 /tts_stream 網址讓瀏覽器邊收邊播
+        'stream_tts': form.get('stream_tts', 'false').lower() == 'true',
+        'session_id': form.get('session_id', str(uuid.uuid4())),
+        'user_id': form.get('user_id', 'default_user'),
+        'chat_choose_id': form.get('chat_choose_id', 'default_chat_choose'),
+        'title': form.get('title', '台語語音對話'),
+        # 非同步模式：立即返回 job ID，結果以 /jobs/<job_id> 輪詢
+        'async_job': form.get('async', 'false').lower() == 'true',
+        # 串流回應（NDJSON）：每個子句合成完成即送出，最後一行為完整結果；未指定 stream_llm 時一併開啟
+        'stream_response': stream_response,
+        'on_segment': None,
+    }
+
+def synthesize_speech(numeric_tone_text, numeric_tone_chunks=None):
+    """TTS 合成；多句時以分段模式並行合成"""
+    if TTS_CHUNKED and numeric_tone_chunks and len(numeric_tone_chunks) > 1:
+        return remote_tts_service.generate_speech_chunked(numeric_tone_chunks)
+    return remote_tts_service.generate_speech(numeric_tone_text)
+
+def pronounce_and_convert(text, step_times):
+    """台語標音轉換 + 羅馬拼音轉數字調"""
+    step_start = time.time()
+    romanization, segmented, kiatko_data = get_taiwanese_pronunciation(text)
+    step_times['標音轉換'] = time.time() - step_start
+    log_step_time("台語標音轉換", step_times['標音轉換'], f"羅馬拼音: '{romanization}'")
+    
+    step_start = time.time()
+    numeric_tone_text, numeric_tone_chunks = convert_numeric_tone(romanization, kiatko_data)
+    if romanization_converter:
+        debug_print(f"格式轉換: '{romanization}' -> '{numeric_tone_text}'")
+    else:
+        debug_print(f"跳過格式轉換: '{romanization}'")
+    step_times['格式轉換'] = time.time() - step_start
+    log_step_time("羅馬拼音格式轉換", step_times['格式轉換'], f"數字調格式: '{numeric_tone_text}'")
+    
+    return {
+        'romanization': romanization,
+        'segmented': segmented,
+        'kiatko': kiatko_data,
+        'numeric_tone_text': numeric_tone_text,
+        'numeric_tone_chunks': numeric_tone_chunks,
+    }
+
+def run_conversation_pipeline(audio, options):
+    """
+    以 DAG 排程 辨識 → 對話 → 保存/標音 → 合成（audio 為已解碼的 pcm / wav_bytes）：
+    - 音訊品質檢查與 STT 上傳同時進行
+    - 資料庫保存與 LLM 回應的標音轉換同時進行
+    """
+    step_times = {}
+    qc_results = {}
+    graph = StageGraph(pipeline_executor)
+    
+    def stage_audio_qc(_):
+        step_start = time.time()
+        verdict = analyze_audio_quality(audio['pcm'], audio['sample_rate'])
+        step_times['音訊品質檢查'] = time.time() - step_start
+        qc_results['audio_qc'] = verdict
+        if not verdict['ok']:
+            raise StopPipeline('無法辨識台語語音內容')
+        return verdict
+    
+    def stage_stt_upload(_):
+        step_start = time.time()
+        text = transcribe_audio_chunks(audio['chunk_wavs'])
+        step_times['語音辨識'] = time.time() - step_start
+        log_step_time("台語語音辨識", step_times['語音辨識'], f"辨識結果: '{text}'")
+        return text
+    
+    def stage_recognize(inputs):
+        if not inputs['stt_upload']:
+            raise StopPipeline('無法辨識台語語音內容')
+        return inputs['stt_upload']
+    
+    def stage_llm(inputs):
+        recognized_text = inputs['recognize']
+        debug_print(f"跳過選項: LLM={options['skip_llm']}, TTS={options['skip_tts']}, DB={options['skip_db']}")
+        step_start = time.time()
+        streamed = None
+        cached_reply = None if options['skip_llm'] else cached_llm_reply(recognized_text, options['session_id'])
+        if options['skip_llm']:
+            ai_response = "跳過 LLM 對話"
+            debug_print("跳過 LLM 對話處理")
+        elif cached_reply:
+            ai_response = cached_reply
+            debug_print("LLM 回應快取命中，跳過模型呼叫")
+        elif options['stream_llm']:
+            # 串流模式：子句完成即送標音與 TTS，與模型生成重疊進行
+            streamed = chat_and_speak_streaming(
+                recognized_text, synthesize=not options['skip_tts'], session_id=options['session_id'],
+                on_segment=options['on_segment']
+            )
+            ai_response = streamed['ai_response'] if streamed else chat_with_ollama_local(recognized_text, options['session_id'])
+        else:
+            ai_response = chat_with_ollama_local(recognized_text, options['session_id'])
+        step_times['LLM對話'] = time.time() - step_start
+        log_step_time("LLM智能對話", step_times['LLM對話'], f"AI回應: '{ai_response}'")
+        return {'ai_response': ai_response, 'streamed': streamed}
+    
+    def stage_db_save(inputs):
+        if options['skip_db']:
+            debug_print("跳過資料庫保存")
+            return True, False
+        step_start = time.time()
+        saved = save_chat_history(
+            options['session_id'], options['user_id'], options['chat_choose_id'], options['title'],
+            inputs['recognize'], inputs['llm']['ai_response']
+        )
+        step_times['資料庫保存'] = time.time() - step_start
+        return saved
+    
+    def stage_pronounce(inputs):
+        streamed = inputs['llm']['streamed']
+        if streamed:
+            # 串流模式已完成標音與格式轉換
+            pronounced = {key: streamed[key] for key in ('romanization', 'segmented', 'kiatko', 'numeric_tone_text')}
+            pronounced['numeric_tone_chunks'] = None
+            return pronounced
+        return pronounce_and_convert(inputs['llm']['ai_response'], step_times)
+    
+    def stage_tts(inputs):
+        ai_response = inputs['llm']['ai_response']
+        streamed = inputs['llm']['streamed']
+        _, is_max_turns = inputs['db_save']
+        pronounced = inputs['pronounce']
+        
+        # 如果達到最大輪數，改用固定回應並重新標音
+        if is_max_turns:
+            ai_response = MAX_TURNS_MESSAGE
+            debug_print("對話已達到最大輪數，修改 AI 回應")
+            pronounced = pronounce_and_convert(ai_response, step_times)
+            streamed = None
+        
+        segment_paths = []
+        audio_stream_url = None
+        if streamed:
+            audio_file_path = streamed['audio_file_path']
+            segment_paths = streamed['segment_paths']
+            if streamed['first_audio_time'] is not None:
+                step_times['首段語音就緒'] = streamed['first_audio_time']
+                log_step_time("首段語音就緒", streamed['first_audio_time'], f"子句音檔數: {len(segment_paths)}")
+        else:
+            # 步驟7: 文字轉語音（使用遠端 TTS 服務）
+            step_start = time.time()
+            audio_file_path = None
+            if options['skip_tts']:
+                debug_print("跳過 TTS 語音合成")
+            elif options['stream_tts']:
+                audio_stream_url = f"/voice-service/tts_stream?{urlencode({'numeric': pronounced['numeric_tone_text']})}"
+                debug_print(f"串流播放模式，合成延後至: {audio_stream_url}")
+            else:
+                print(f"\n🔊 步驟6: 台語語音合成")
+                if remote_tts_service:
+                    print(f"使用遠端 TTS 服務 ({remote_tts_service.base_url})")
+                    audio_file_path = synthesize_speech(pronounced['numeric_tone_text'], pronounced['numeric_tone_chunks'])
+                else:
+                    print("⚠️ 遠端TTS服務未初始化，無法進行語音合成。")
+            step_times['語音合成'] = time.time() - step_start
+            log_step_time("台語語音合成", step_times['語音合成'], f"音檔: {audio_file_path if audio_file_path else '跳過'}")
+        
+        if audio_file_path:
+            print(f"🔊 TTS 成功: {audio_file_path}")
+        else:
+            print("⚠️ TTS 失敗")
+        
+        return {
+            **pronounced,
+            'ai_response': ai_response,
+            'is_max_turns': is_max_turns,
+            'audio_file_path': audio_file_path,
+            'audio_stream_url': audio_stream_url,
+            'segment_paths': segment_paths,
+        }
+    
+    graph.add('audio_qc', stage_audio_qc)
+    graph.add('stt_upload', stage_stt_upload)
+    graph.add('recognize', stage_recognize, deps=('audio_qc', 'stt_upload'))
+    graph.add('llm', stage_llm, deps=('recognize',))
+    graph.add('db_save', stage_db_save, deps=('recognize', 'llm'))
+    graph.add('pronounce', stage_pronounce, deps=('llm',))
+    graph.add('tts', stage_tts, deps=('llm', 'db_save', 'pronounce'))
+    
+    results = graph.run()
+    pipeline = {
+        'step_times': step_times,
+        'stage_timeline': graph.timeline(),
+        'critical_path': graph.critical_path(),
+        'audio_qc': qc_results.get('audio_qc'),
+    }
+    if graph.stopped is not None:
+        pipeline['error'] = graph.stopped.value
+        return pipeline
+    
+    pipeline.update(results['tts'])
+    pipeline['transcription'] = results['recognize']
+    
+    critical = ' → '.join(f"{st['name']}({st['duration']:.3f}s)" for st in pipeline['critical_path']['stages'])
+    print(f"🧭 關鍵路徑: {critical}")
+    return pipeline
+
+@voice_bp.route('/')
 def index():
     """主頁面 - 返回服務狀態"""
     return jsonify({
@@ -505,34 +1111,263 @@ def index():
         "version": "1.0.0",
         "endpoints": {
             "process_audio": "/process_audio (POST)",
+            "jobs": "/jobs/<job_id> (GET)",
             "tts": "/tts (POST)",
+            "tts_stream": "/tts_stream (GET/POST)",
+            "pronunciation_prewarm": "/pronunciation/prewarm (POST)",
             "health": "/health (GET)"
         }
     })
 
-@app.route('/health')
+@voice_bp.route('/health')
 def health():
     """健康檢查端點"""
     return jsonify({
         "status": "healthy",
-        "timestamp": time.time()
+        "timestamp": time.time(),
+        "tts_cache": remote_tts_service.audio_cache.stats() if remote_tts_service and remote_tts_service.audio_cache else None,
+        "pronunciation_cache": pronunciation_cache.stats() if pronunciation_cache else None,
+        "local_pronunciation": local_pronunciation_engine.stats() if local_pronunciation_engine else None,
+        "http_clients": get_http_client_stats(),
+        "admission": admission.stats(),
+        "jobs": job_store.stats(),
+        "ollama_scheduler": ollama_scheduler.stats() if ollama_scheduler else None,
+        "chat_history_writer": chat_history_writer.stats() if chat_history_writer else None,
+        "chat_history_layout": 'turns' if chat_turn_store else 'embedded',
+        "llm_context": llm_context.stats(),
+        "reply_cache": reply_cache.stats() if reply_cache else None
     })
 
-@app.route('/static/<path:filename>')
+@voice_bp.route('/static/<path:filename>')
 def serve_static(filename):
     """提供靜態檔案服務"""
     return send_file(f'static/{filename}')
 
-@app.route('/flashcard')
+@voice_bp.route('/flashcard')
 def flashcard():
     """字母卡頁面"""
     return render_template('flashcard.html')
 
-@app.route('/process_audio', methods=['POST'])
+def guess_audio_suffix(content_type):
+    """依 content type 決定檔案副檔名"""
+    if 'webm' in content_type:
+        return '.webm'
+    elif 'wav' in content_type:
+        return '.wav'
+    elif 'mp3' in content_type:
+        return '.mp3'
+    return '.audio'
+
+def _write_upload_archive(audio_data, filename):
+    try:
+        os.makedirs(UPLOAD_ARCHIVE_DIR, exist_ok=True)
+        with open(filename, 'wb') as f:
+            f.write(audio_data)
+        debug_print(f"錄音已封存: {filename}")
+    except Exception as e:
+        debug_print(f"錄音封存失敗: {e}")
+
+def archive_upload(audio_data, content_type):
+    """非同步封存原始錄音（需開啟 ARCHIVE_UPLOADS），不阻塞請求處理"""
+    if not ARCHIVE_UPLOADS:
+        return None
+    # 加上隨機碼，避免同一毫秒內的並行請求檔名衝突
+    filename = f"{UPLOAD_ARCHIVE_DIR}/recording_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}{guess_audio_suffix(content_type)}"
+    archive_executor.submit(_write_upload_archive, audio_data, filename)
+    return filename
+
+def handle_voice_request(audio_data, content_type, options, step_times, total_start_time):
+    """
+    處理一段錄音（全程在記憶體中進行），返回 (回應內容, HTTP 狀態碼)
+    """
+    debug_print("開始台語語音對話處理")
+    archive_upload(audio_data, content_type)
+    
+    # 步驟2: 音檔解碼（在記憶體中轉為 16kHz 單聲道 PCM，品質檢查與 STT 共用同一份資料）
+    step_start = time.time()
+    try:
+        pcm = decode_audio_bytes(audio_data, ffmpeg_path=ffmpeg_path)
+    except Exception as e:
+        debug_print(f"音檔解碼失敗: {e}")
+        return {'error': '音檔格式轉換失敗'}, 400
+    step_times['音檔格式轉換'] = time.time() - step_start
+    log_step_time("音檔格式轉換", step_times['音檔格式轉換'], f"{len(pcm)} 樣本")
+    
+    # 裁掉前後靜音，過長語句切段（減少 STT 上傳量與運算量）
+    step_start = time.time()
+    vad = audio_vad.trim_and_split(
+        pcm, TARGET_SAMPLE_RATE,
+        trim=VAD_TRIM_ENABLED, split=VAD_SPLIT_LONG, max_seconds=STT_MAX_CHUNK_SECONDS
+    )
+    audio = {
+        'pcm': vad['pcm'],
+        'sample_rate': TARGET_SAMPLE_RATE,
+        'chunk_wavs': [wav_utils.write_wav_bytes(chunk, TARGET_SAMPLE_RATE) for chunk in vad['chunks']],
+    }
+    step_times['靜音裁切'] = time.time() - step_start
+    log_step_time("靜音裁切", step_times['靜音裁切'],
+                  f"{vad['original_duration']:.2f}秒 -> {vad['trimmed_duration']:.2f}秒，共 {len(vad['chunks'])} 段")
+    
+    # 步驟3~7: 語音辨識、LLM 對話、資料庫保存、標音轉換、語音合成（DAG 並行排程）
+    pipeline = run_conversation_pipeline(audio, options)
+    step_times.update(pipeline['step_times'])
+    
+    if 'error' in pipeline:
+        return {'error': pipeline['error'], 'audio_qc': pipeline['audio_qc']}, 400
+    
+    # 計算總耗時
+    total_time = time.time() - total_start_time
+    
+    # 步驟8: 返回結果
+    print(f"\n✅ 台語語音對話處理完成")
+    print(f"🎯 總處理時間: {total_time:.3f}秒")
+    print("📊 各步驟耗時統計:")
+    for step_name, duration in step_times.items():
+        percentage = (duration / total_time) * 100
+        print(f"   • {step_name}: {duration:.3f}秒 ({percentage:.1f}%)")
+    
+    result = {
+        'success': True,
+        'transcription': pipeline['transcription'],
+        'ai_response': pipeline['ai_response'],
+        'romanization': pipeline['romanization'],
+        'numeric_tone_text': pipeline['numeric_tone_text'],
+        'segmented': pipeline['segmented'],
+        'kiatko_count': len(pipeline['kiatko']),
+        'audio_url': f"/voice-service/{pipeline['audio_file_path']}" if pipeline['audio_file_path'] else None,
+        'audio_segments': [f'/voice-service/{p}' for p in pipeline['segment_paths']] if pipeline['segment_paths'] else None,
+        'audio_stream_url': pipeline['audio_stream_url'],
+        'api_info': f"使用遠端 STT: {REMOTE_STT_URL}, 遠端 LLM: {REMOTE_OLLAMA_URL}",
+        'chat_status': {
+            'session_id': options['session_id'],
+            'is_finished': pipeline['is_max_turns'],
+            'max_turns_reached': pipeline['is_max_turns']
+        },
+        'performance_stats': {
+            'total_time': total_time,
+            'step_times': step_times,
+            'bottleneck': max(step_times, key=step_times.get) if step_times else None,
+            'stage_timeline': pipeline['stage_timeline'],
+            'critical_path': pipeline['critical_path'],
+            'audio_qc': pipeline['audio_qc'],
+            'original_audio_duration': vad['original_duration'],
+            'trimmed_audio_duration': vad['trimmed_duration'],
+            'stt_chunks': len(vad['chunks'])
+        }
+    }
+    
+    debug_print("台語語音對話處理完成")
+    return result, 200
+
+def admission_rejected_body(error):
+    """未獲准入的回應內容（Flask 與 ASGI 版共用）"""
+    return {
+        'success': False,
+        'error': str(error),
+        'retry_after': error.retry_after,
+        'queue': admission.stats()
+    }
+
+def admission_rejected_response(error):
+    """未獲准入的回應（429 佇列已滿 / 503 排隊逾時），附 Retry-After 標頭"""
+    response = jsonify(admission_rejected_body(error))
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def run_admitted_voice_request(audio_data, content_type, options, step_times, total_start_time,
+                               queue_timeout=None, on_start=None):
+    """
+    等待處理名額後執行對話流程（呼叫前須已 reserve），返回 (回應內容, HTTP 狀態碼)
+    排隊逾時拋出 AdmissionRejected
+    """
+    step_start = time.time()
+    started_at = admission.acquire(queue_timeout)
+    step_times['排隊等待'] = time.time() - step_start
+    log_step_time("排隊等待", step_times['排隊等待'])
+    try:
+        if on_start:
+            on_start()
+        return handle_voice_request(audio_data, content_type, options, step_times, total_start_time)
+    finally:
+        admission.release(started_at)
+
+def run_voice_job(job_id, audio_data, content_type, options, step_times, total_start_time):
+    """非同步工作：排隊不限時，完成後將結果存入 job_store"""
+    try:
+        result, status = run_admitted_voice_request(
+            audio_data, content_type, options, step_times, total_start_time,
+            queue_timeout=0, on_start=lambda: job_store.update(job_id, 'running')
+        )
+        job_store.update(job_id, 'done' if status == 200 else 'failed', result, status)
+    except AdmissionRejected as e:
+        job_store.update(job_id, 'failed', {'success': False, 'error': str(e), 'retry_after': e.retry_after}, e.status)
+    except Exception as e:
+        debug_print(f"非同步工作失敗: {e}")
+        job_store.update(job_id, 'failed', {'success': False, 'error': str(e)}, 500)
+
+def stream_voice_response(audio_data, content_type, options, step_times, total_start_time):
+    """
+    串流回應（application/x-ndjson，呼叫前須已 reserve）：對話流程在背景執行緒執行，
+    每個子句的語音合成完成就送出一行 segment（依子句順序，附自請求開始的秒數），
+    用戶端可在其餘子句仍在生成或合成時先播放；最後一行 type=result 為與一般模式相同的完整結果
+    （status 為原本的 HTTP 狀態碼）。達到最大輪數時，result 的 audio_url 為結束訊息的語音。
+    """
+    events = queue.Queue()
+
+    def on_segment(index, segment):
+        events.put({
+            'type': 'segment',
+            'index': index,
+            'text': segment['text'],
+            'audio_url': f"/voice-service/{segment['audio_file_path']}" if segment['audio_file_path'] else None,
+            'elapsed': time.time() - total_start_time,
+        })
+
+    def run():
+        try:
+            result, status = run_admitted_voice_request(
+                audio_data, content_type, dict(options, on_segment=on_segment), step_times, total_start_time
+            )
+        except AdmissionRejected as e:
+            result, status = admission_rejected_body(e), e.status
+        except Exception as e:
+            debug_print(f"串流回應處理失敗: {e}")
+            result, status = {'success': False, 'error': str(e)}, 500
+        events.put({'type': 'result', 'status': status, **result})
+
+    try:
+        job_executor.submit(run)
+    except RuntimeError:
+        admission.cancel()
+        raise
+
+    def generate():
+        while True:
+            event = events.get()
+            yield json.dumps(event, ensure_ascii=False) + '\n'
+            if event['type'] == 'result':
+                return
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@voice_bp.route('/jobs/<job_id>')
+def get_job(job_id):
+    """查詢非同步語音工作狀態；完成後 result 為與同步模式相同的回應內容"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '找不到此工作或已過期'}), 404
+    response = jsonify(job)
+    if job['status'] in ('queued', 'running'):
+        response.headers['Retry-After'] = str(admission.retry_after(1))
+    return response
+
+@voice_bp.route('/process_audio', methods=['POST'])
 def process_audio():
     """處理語音檔案"""
-    global remote_tts_service, romanization_converter
-    
     # 總體計時開始
     total_start_time = time.time()
     print(f"🚀 開始處理語音請求 - {time.strftime('%Y-%m-%d %H:%M:%S')}")
@@ -553,25 +1388,9 @@ def process_audio():
         step_times['請求驗證'] = time.time() - step_start
         log_step_time("請求驗證", step_times['請求驗證'])
             
-        # 步驟1: 音檔保存
+        # 步驟1: 音檔讀取（保留在記憶體中，不寫入磁碟）
         step_start = time.time()
-        # 建立本地保存目錄
-        os.makedirs("uploads", exist_ok=True)
-        
-        # 決定檔案副檔名
         content_type = audio_file.content_type or 'audio/webm'
-        if 'webm' in content_type:
-            suffix = '.webm'
-        elif 'wav' in content_type:
-            suffix = '.wav'
-        elif 'mp3' in content_type:
-            suffix = '.mp3'
-        else:
-            suffix = '.audio'
-        
-        # 保存音檔
-        timestamp = int(time.time() * 1000)
-        local_filename = f"uploads/recording_{timestamp}{suffix}"
         
         audio_file.seek(0)
         audio_data = audio_file.read()
@@ -579,165 +1398,50 @@ def process_audio():
         if len(audio_data) == 0:
             return jsonify({'error': '音檔數據為空'}), 400
         
-        try:
-            with open(local_filename, 'wb') as f:
-                f.write(audio_data)
-            debug_print(f"音檔保存成功: {local_filename}")
-        except Exception as e:
-            debug_print(f"音檔保存失敗: {e}")
-            return jsonify({'error': '音檔保存失敗'}), 500
+        step_times['音檔讀取'] = time.time() - step_start
+        log_step_time("音檔讀取", step_times['音檔讀取'], f"檔案大小: {len(audio_data)} bytes")
         
-        if not os.path.exists(local_filename) or os.path.getsize(local_filename) == 0:
-            return jsonify({'error': '保存的音檔無效'}), 400
+        options = read_pipeline_options(request.form)
         
-        step_times['音檔保存'] = time.time() - step_start
-        log_step_time("音檔保存", step_times['音檔保存'], f"檔案大小: {len(audio_data)} bytes")
+        if options['async_job'] and not job_store.shared and SERVICE_WORKERS > 1:
+            # 記憶體內的工作只有本 worker 查得到，輪詢會落到其他 worker 而得到 404
+            return jsonify({'success': False, 'error': '多 worker 部署的非同步模式需要 MongoDB'}), 503
         
+        # 准入控制：佇列已滿時立即拒絕，不再對上游發出任何請求
         try:
-            debug_print("開始台語語音對話處理")
-            
-            # 步驟2: 音檔格式轉換（如果需要）
-            step_start = time.time()
-            audio_path = local_filename
-            if suffix != '.wav':
-                converted_path = convert_webm_with_ffmpeg(local_filename)
-                if converted_path:
-                    audio_path = converted_path
-                else:
-                    return jsonify({'error': '音檔格式轉換失敗'}), 400
-            step_times['格式轉換'] = time.time() - step_start
-            log_step_time("音檔格式轉換", step_times['格式轉換'])
-            
-            # 步驟3: 台語語音辨識（使用遠端服務）
-            step_start = time.time()
-            recognized_text = transcribe_taiwanese_audio_remote(audio_path)
-            step_times['語音辨識'] = time.time() - step_start
-            log_step_time("台語語音辨識", step_times['語音辨識'], f"辨識結果: '{recognized_text}'")
-            
-            if not recognized_text:
-                return jsonify({'error': '無法辨識台語語音內容'}), 400
-            
-            # 檢查是否需要跳過某些步驟（用於單字挑戰等）
-            skip_llm = request.form.get('skip_llm', 'false').lower() == 'true'
-            skip_tts = request.form.get('skip_tts', 'false').lower() == 'true'
-            skip_db = request.form.get('skip_db', 'false').lower() == 'true'
-            
-            debug_print(f"跳過選項: LLM={skip_llm}, TTS={skip_tts}, DB={skip_db}")
-            
-            # 步驟4: LLM 對話（使用本地 Ollama）
-            step_start = time.time()
-            if skip_llm:
-                ai_response = "跳過 LLM 對話"
-                debug_print("跳過 LLM 對話處理")
-            else:
-                ai_response = chat_with_ollama_local(recognized_text)
-            step_times['LLM對話'] = time.time() - step_start
-            log_step_time("LLM智能對話", step_times['LLM對話'], f"AI回應: '{ai_response}'")
-            
-            # 保存對話紀錄到資料庫
-            session_id = request.form.get('session_id', str(uuid.uuid4()))
-            user_id = request.form.get('user_id', 'default_user')
-            chat_choose_id = request.form.get('chat_choose_id', 'default_chat_choose')
-            title = request.form.get('title', '台語語音對話')
-            
-            save_success = True
-            is_max_turns = False
-            if skip_db:
-                debug_print("跳過資料庫保存")
-            else:
-                save_success, is_max_turns = save_chat_history(session_id, user_id, chat_choose_id, title, recognized_text, ai_response)
-            
-            # 如果達到最大輪數，修改 AI 回應
-            if is_max_turns:
-                ai_response = "對話已達到最大輪數（5輪），感謝您的參與！請重新選擇對話主題，我們可以開始新的對話！"
-                debug_print("對話已達到最大輪數，修改 AI 回應")
-            
-            # 步驟5: 台語標音轉換
-            step_start = time.time()
-            romanization, segmented, kiatko_data = get_taiwanese_pronunciation(ai_response)
-            step_times['標音轉換'] = time.time() - step_start
-            log_step_time("台語標音轉換", step_times['標音轉換'], f"羅馬拼音: '{romanization}'")
-            
-            # 步驟6: 格式轉換（羅馬拼音轉數字調）
-            step_start = time.time()
-            if romanization_converter:
-                numeric_tone_text = romanization_converter.convert_to_numeric_tone(romanization)
-                debug_print(f"格式轉換: '{romanization}' -> '{numeric_tone_text}'")
-            else:
-                numeric_tone_text = romanization
-                debug_print(f"跳過格式轉換: '{romanization}'")
-            step_times['格式轉換'] = time.time() - step_start
-            log_step_time("羅馬拼音格式轉換", step_times['格式轉換'], f"數字調格式: '{numeric_tone_text}'")
-            
-            # 步驟7: 文字轉語音（使用遠端 TTS 服務）
-            step_start = time.time()
-            audio_file_path = None
-            if skip_tts:
-                debug_print("跳過 TTS 語音合成")
-            else:
-                print(f"\n🔊 步驟6: 台語語音合成")
-                if remote_tts_service:
-                    print(f"使用遠端 TTS 服務 ({remote_tts_service.base_url})")
-                    audio_file_path = remote_tts_service.generate_speech(numeric_tone_text)
-                else:
-                    print("⚠️ 遠端TTS服務未初始化，無法進行語音合成。")
-            step_times['語音合成'] = time.time() - step_start
-            log_step_time("台語語音合成", step_times['語音合成'], f"音檔: {audio_file_path if audio_file_path else '跳過'}")
-            
-            if audio_file_path:
-                print(f"🔊 TTS 成功: {audio_file_path}")
-            else:
-                print("⚠️ TTS 失敗")
-            
-            # 計算總耗時
-            total_time = time.time() - total_start_time
-            
-            # 步驟8: 返回結果
-            print(f"\n✅ 台語語音對話處理完成")
-            print(f"🎯 總處理時間: {total_time:.3f}秒")
-            print("📊 各步驟耗時統計:")
-            for step_name, duration in step_times.items():
-                percentage = (duration / total_time) * 100
-                print(f"   • {step_name}: {duration:.3f}秒 ({percentage:.1f}%)")
-            
-            result = {
-                'success': True,
-                'transcription': recognized_text,
-                'ai_response': ai_response,
-                'romanization': romanization,
-                'numeric_tone_text': numeric_tone_text,
-                'segmented': segmented,
-                'kiatko_count': len(kiatko_data),
-                'audio_url': f'/voice-service/{audio_file_path}' if audio_file_path else None,
-                'api_info': f"使用遠端 STT: {REMOTE_STT_URL}, 遠端 LLM: {REMOTE_OLLAMA_URL}",
-                'chat_status': {
-                    'session_id': session_id,
-                    'is_finished': is_max_turns,
-                    'max_turns_reached': is_max_turns
-                },
-                'performance_stats': {
-                    'total_time': total_time,
-                    'step_times': step_times,
-                    'bottleneck': max(step_times, key=step_times.get) if step_times else None
-                }
-            }
-            
-            debug_print("台語語音對話處理完成")
-            return jsonify(result)
-            
-        finally:
-            # 清理臨時檔案
+            admission.reserve()
+        except AdmissionRejected as e:
+            debug_print(f"拒絕請求: {e}")
+            return admission_rejected_response(e)
+        
+        if options['async_job']:
+            job_id = job_store.create()
             try:
-                if CLEANUP_FILES:
-                    if os.path.exists(local_filename):
-                        os.unlink(local_filename)
-                        debug_print(f"清理本地檔案: {local_filename}")
-                    # 清理轉換後的 WAV 檔案
-                    if 'audio_path' in locals() and audio_path != local_filename and os.path.exists(audio_path):
-                        os.unlink(audio_path)
-                        debug_print(f"清理轉換檔案: {audio_path}")
-            except Exception as e:
-                debug_print(f"清理檔案失敗: {e}")
+                job_executor.submit(run_voice_job, job_id, audio_data, content_type, options, step_times, total_start_time)
+            except RuntimeError:
+                admission.cancel()
+                raise
+            response = jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f'/jobs/{job_id}',
+                'queue': admission.stats()['queued']
+            })
+            response.status_code = 202
+            response.headers['Location'] = f'/jobs/{job_id}'
+            response.headers['Retry-After'] = str(admission.retry_after())
+            return response
+        
+        if options['stream_response']:
+            return stream_voice_response(audio_data, content_type, options, step_times, total_start_time)
+        
+        try:
+            result, status = run_admitted_voice_request(audio_data, content_type, options, step_times, total_start_time)
+        except AdmissionRejected as e:
+            debug_print(f"排隊逾時: {e}")
+            return admission_rejected_response(e)
+        return jsonify(result), status
         
     except Exception as e:
         debug_print(f"處理錯誤: {e}")
@@ -746,7 +1450,7 @@ def process_audio():
             'error': str(e)
         }), 500
 
-@app.route('/tts', methods=['POST'])
+@voice_bp.route('/tts', methods=['POST'])
 def tts():
     """台語文字轉語音 API"""
     try:
@@ -766,15 +1470,12 @@ def tts():
             return jsonify({'success': False, 'error': '無法取得羅馬拼音'}), 500
 
         # 步驟2: 格式轉換（羅馬拼音轉數字調）
-        if romanization_converter:
-            numeric_tone_text = romanization_converter.convert_to_numeric_tone(romanization)
-        else:
-            numeric_tone_text = romanization
+        numeric_tone_text, numeric_tone_chunks = convert_numeric_tone(romanization, kiatko_data)
 
         # 步驟3: 文字轉語音
         audio_file_path = None
         if remote_tts_service:
-            audio_file_path = remote_tts_service.generate_speech(numeric_tone_text)
+            audio_file_path = synthesize_speech(numeric_tone_text, numeric_tone_chunks)
         else:
             print("⚠️ 遠端TTS服務未初始化，無法進行語音合成。")
             return jsonify({'success': False, 'error': 'TTS服務未初始化'}), 500
@@ -796,7 +1497,76 @@ def tts():
         debug_print(f"TTS 處理失敗: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/generate_flashcard', methods=['POST'])
+@voice_bp.route('/tts_stream', methods=['GET', 'POST'])
+def tts_stream():
+    """
+    串流台語語音 API：轉送 /bangtsam 的回應內容（chunked transfer），瀏覽器可在合成完成前開始播放
+    參數 text（漢字，先標音）或 numeric（已轉好的數字調文字），GET 查詢字串或 POST JSON 皆可
+    """
+    try:
+        data = request.get_json(silent=True) or request.args
+        text = (data.get('text') or '').strip()
+        numeric_tone_text = (data.get('numeric') or '').strip()
+        if not text and not numeric_tone_text:
+            return jsonify({'success': False, 'error': '請求缺少文字內容'}), 400
+        if not remote_tts_service:
+            return jsonify({'success': False, 'error': 'TTS服務未初始化'}), 500
+
+        if not numeric_tone_text:
+            romanization, _, kiatko_data = get_taiwanese_pronunciation(text)
+            if not romanization:
+                return jsonify({'success': False, 'error': '無法取得羅馬拼音'}), 500
+            numeric_tone_text, _ = convert_numeric_tone(romanization, kiatko_data)
+
+        print(f"🔊 串流 TTS 請求: '{numeric_tone_text}'")
+        stream = remote_tts_service.open_speech_stream(numeric_tone_text)
+        if not stream:
+            return jsonify({'success': False, 'error': '語音合成失敗'}), 502
+
+        chunks, content_type = stream
+        response = Response(
+            stream_with_context(chunks),
+            mimetype=content_type,
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',  # 避免反向代理緩衝整段回應
+                'X-Numeric-Tone-Text': quote(numeric_tone_text),
+            }
+        )
+        # stream_with_context 的產生器尚未開始迭代就被關閉時（HEAD、用戶端提早斷線）不會關閉內層串流，
+        # 回應結束時一律關閉，釋放 TTS 上游名額
+        response.call_on_close(chunks.close)
+        return response
+
+    except Exception as e:
+        debug_print(f"串流 TTS 處理失敗: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@voice_bp.route('/pronunciation/prewarm', methods=['POST'])
+def pronunciation_prewarm():
+    """批次預先載入詞彙標音 API"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('texts'), list):
+            return jsonify({'success': False, 'error': '請求缺少詞彙列表 texts'}), 400
+
+        try:
+            max_workers = int(data.get('max_workers', PRONUNCIATION_PREWARM_MAX_WORKERS))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'max_workers 必須是整數'}), 400
+        # 用戶端指定的並行數限制在 1 ~ PRONUNCIATION_PREWARM_MAX_WORKERS，避免對意傳 API 送出過多並行請求
+        max_workers = max(1, min(max_workers, PRONUNCIATION_PREWARM_MAX_WORKERS))
+
+        summary = prewarm_pronunciations(data['texts'], max_workers=max_workers)
+        if 'error' in summary:
+            return jsonify({'success': False, 'error': summary['error']}), 500
+        return jsonify({'success': True, **summary})
+
+    except Exception as e:
+        debug_print(f"標音預載失敗: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@voice_bp.route('/generate_flashcard', methods=['POST'])
 def generate_flashcard():
     """產生字母卡的後端 API"""
     try:
@@ -814,10 +1584,7 @@ def generate_flashcard():
             return jsonify({'success': False, 'error': '無法取得羅馬拼音'}), 500
 
         # 步驟2: 格式轉換（羅馬拼音轉數字調）
-        if romanization_converter:
-            numeric_tone_text = romanization_converter.convert_to_numeric_tone(romanization)
-        else:
-            numeric_tone_text = romanization
+        numeric_tone_text, _ = convert_numeric_tone(romanization, kiatko_data)
 
         # 步驟3: 文字轉語音
         audio_file_path = None
@@ -840,7 +1607,7 @@ def generate_flashcard():
         debug_print(f"產生字母卡失敗: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/test_api')
+@voice_bp.route('/test_api')
 def test_api():
     """測試遠端服務連線"""
     try:
@@ -853,14 +1620,14 @@ def test_api():
         
         # 測試遠端 STT 服務
         try:
-            stt_response = requests.get(f"{REMOTE_STT_URL}/health", timeout=5)
+            stt_response = get_session('stt').get(f"{REMOTE_STT_URL}/health", timeout=5)
             stt_status = "正常" if stt_response.status_code == 200 else f"錯誤 {stt_response.status_code}"
         except:
             stt_status = "連線失敗"
         
         # 測試遠端 Ollama 服務
         try:
-            ollama_response = requests.get(f"{REMOTE_OLLAMA_URL}/health", timeout=5)
+            ollama_response = get_session('ollama').get(f"{REMOTE_OLLAMA_URL}/health", timeout=5)
             ollama_status = "正常" if ollama_response.status_code == 200 else f"錯誤 {ollama_response.status_code}"
         except:
             ollama_status = "連線失敗"
@@ -883,26 +1650,18 @@ def test_api():
         return jsonify({'error': str(e), 'api_status': 'failed'})
 
 
-if __name__ == '__main__':
+def init_shared_resources():
+    """
+    初始化可在 fork 前建立、由各 worker 共用的資源：FFmpeg 路徑、TTS 服務、格式轉換器與本地標音詞庫
+    （只讀資料，fork 後以 copy-on-write 共享，不含任何網路連線或資料庫連線）
+    """
+    global ffmpeg_path, remote_tts_service, romanization_converter, local_pronunciation_engine, _shared_initialized
+    
     print("🎯 啟動台語語音對話 Web 應用程式 (遠端服務版)")
     print(f"🌐 使用遠端 STT 服務: {REMOTE_STT_URL}")
     print(f"🤖 使用遠端 Ollama 服務: {REMOTE_OLLAMA_URL}")
     print(f"📋 LLM 模型: {LLM_MODEL}")
     
-    # 初始化 MongoDB 連接
-    print("🔗 初始化 MongoDB 連接...")
-    try:
-        mongo_client = MongoClient(MONGODB_URI)
-        db = mongo_client[DATABASE_NAME]
-        # 測試連接
-        mongo_client.admin.command('ping')
-        print(f"✅ MongoDB 連接成功: {MONGODB_URI}/{DATABASE_NAME}")
-    except Exception as e:
-        print(f"❌ MongoDB 連接失敗: {e}")
-        print("⚠️ 對話紀錄將無法保存到資料庫")
-        mongo_client = None
-        db = None
-    
     # 初始化 FFmpeg 路徑
     ffmpeg_candidates = [
         "/opt/homebrew/bin/ffmpeg",  # macOS Homebrew 路徑
@@ -919,6 +1678,7 @@ if __name__ == '__main__':
             break
     else:
         debug_print("FFmpeg 未找到")
+    debug_print(f"音訊解碼方式: {decoder_backend(ffmpeg_path)}")
     
     # 在啟動時執行一次清理
     cleanup_temp_files()
@@ -947,9 +1707,146 @@ if __name__ == '__main__':
         print(f"❌ 羅馬拼音轉換器初始化失敗: {e}")
         romanization_converter = None
     
+    if LOCAL_PRONUNCIATION_ENABLED:
+        print("初始化本地標音詞庫...")
+        try:
+            local_pronunciation_engine = LocalPronunciationEngine(
+                lexicon_paths=LOCAL_LEXICON_PATHS,
+                learned_path=LOCAL_LEXICON_LEARNED_PATH
+            )
+            print(f"本地標音詞庫初始化成功 ({local_pronunciation_engine.trie.size} 詞)")
+        except Exception as e:
+            print(f"❌ 本地標音詞庫初始化失敗: {e}")
+            local_pronunciation_engine = None
+    
+    _shared_initialized = True
+
+def init_worker_resources():
+    """
+    初始化各行程自己的連線：MongoDB、標音快取（SQLite/Mongo 持久層）與上游 HTTP 連線池
+    pre-fork 伺服器須在 fork 之後於每個 worker 內呼叫（見 gunicorn.conf.py 的 post_fork）
+    """
+    global mongo_client, db, pronunciation_cache, ollama_scheduler, chat_history_writer, chat_turn_store, job_store
+    
+    # 子行程不可沿用父行程的 socket 與背景執行緒
+    reset_sessions()
+    chat_history_writer = None  # 父行程的寫入執行緒不會隨 fork 複製，改由本行程重新建立
+    chat_turn_store = None
+    if mongo_client is not None:
+        try:
+            mongo_client.close()
+        except Exception:
+            pass
+    
+    # 初始化 MongoDB 連接
+    print("🔗 初始化 MongoDB 連接...")
+    try:
+        mongo_client = MongoClient(MONGODB_URI)
+        db = mongo_client[DATABASE_NAME]
+        # 測試連接
+        mongo_client.admin.command('ping')
+        print(f"✅ MongoDB 連接成功: {MONGODB_URI}/{DATABASE_NAME}")
+        mongo_job_store = MongoJobStore(db.VoiceJobs, ttl=ASYNC_JOB_TTL)
+        if mongo_job_store.ensure_indexes():
+            job_store = mongo_job_store
+            print("✅ 非同步工作狀態存於 MongoDB（各 worker 共用）")
+        if CHAT_HISTORY_LAYOUT == 'turns':
+            store = ChatTurnStore(db, MAX_TURNS)
+            if store.ensure_indexes():
+                chat_turn_store = store
+                print("✅ 對話紀錄使用分輪儲存（ChatSessions + ChatTurns）")
+            else:
+                print("⚠️ 分輪儲存索引無法建立，改用 ChatHistory")
+        indexes_ready = chat_turn_store is not None or ensure_chat_history_indexes()
+        if indexes_ready:
+            print("✅ 對話紀錄唯一索引已就緒")
+            if CHAT_HISTORY_WRITE_BEHIND:
+                # 重送依賴唯一索引辨識已寫入的輪次，沒有索引時維持同步寫入
+                chat_history_writer = ChatHistoryWriter(
+                    chat_turn_store.sessions if chat_turn_store else db.ChatHistory, MAX_TURNS,
+                    max_queue=CHAT_HISTORY_QUEUE_SIZE,
+                    batch_size=CHAT_HISTORY_BATCH_SIZE,
+                    flush_interval=CHAT_HISTORY_FLUSH_INTERVAL,
+                    spill_dir=CHAT_HISTORY_SPILL_DIR,
+                    turn_store=chat_turn_store
+                ).start()
+                atexit.register(chat_history_writer.close)
+                print("✅ 對話紀錄延後寫入已啟用")
+    except Exception as e:
+        print(f"❌ MongoDB 連接失敗: {e}")
+        print("⚠️ 對話紀錄將無法保存到資料庫")
+        mongo_client = None
+        db = None
+    
+    print("初始化台語標音快取...")
+    try:
+        pronunciation_store = None
+        if PRONUNCIATION_CACHE_BACKEND == 'sqlite':
+            pronunciation_store = SqlitePronunciationStore(PRONUNCIATION_CACHE_DB)
+        elif PRONUNCIATION_CACHE_BACKEND == 'mongo' and db is not None:
+            pronunciation_store = MongoPronunciationStore(db.PronunciationCache)
+        pronunciation_cache = PronunciationCache(max_entries=PRONUNCIATION_CACHE_SIZE, store=pronunciation_store)
+        print(f"台語標音快取初始化成功 (持久層: {type(pronunciation_store).__name__ if pronunciation_store else '無'})")
+    except Exception as e:
+        print(f"❌ 台語標音快取初始化失敗: {e}")
+        pronunciation_cache = None
+    
+    if OLLAMA_BATCHING:
+        ollama_scheduler = OllamaBatchScheduler(
+            LOCAL_OLLAMA_URL, LLM_MODEL,
+            window_ms=OLLAMA_BATCH_WINDOW_MS, max_batch=OLLAMA_BATCH_MAX,
+            parallel=OLLAMA_PARALLEL, keep_alive=OLLAMA_KEEP_ALIVE
+        )
+        print(f"Ollama 微批次排程已啟用 (視窗 {OLLAMA_BATCH_WINDOW_MS:g}ms, 並行 {OLLAMA_PARALLEL})")
+        if OLLAMA_WARM_UP:
+            # 背景載入模型，不阻塞啟動
+            threading.Thread(target=ollama_scheduler.warm_up, name='ollama-warm-up', daemon=True).start()
+
+def shutdown_worker_resources():
+    """寫完延後寫入佇列中的對話紀錄（worker 結束時呼叫）"""
+    global chat_history_writer
+    if chat_history_writer is not None:
+        chat_history_writer.close()
+        chat_history_writer = None
+
+def reclaim_worker_slots(pid):
+    """
+    扣回已結束 worker 仍佔用的准入與上游名額（gunicorn 主行程在 child_exit 呼叫）
+    worker 正常結束時名額都已歸還；被強制終止時則由此處扣回，避免名額永久遺失
+    """
+    reclaimed = admission.reclaim(pid)
+    upstream = reclaim_shared_slots(pid)
+    if reclaimed or upstream:
+        print(f"♻️ 扣回 worker {pid} 未歸還的名額: 准入 {reclaimed}, 上游 {upstream}")
+    return reclaimed, upstream
+
+def init_services():
+    """初始化全部資源（單一行程執行時使用，Flask 與 ASGI 版共用）"""
+    init_shared_resources()
+    init_worker_resources()
+
+def create_app(init_worker=True):
+    """
+    建立 Flask 應用程式
+    共用資源只在第一次呼叫時初始化；pre-fork 伺服器以 init_worker=False 在主行程預先載入，
+    各 worker 的連線於 fork 後另外建立
+    """
+    if not _shared_initialized:
+        init_shared_resources()
+    if init_worker:
+        init_worker_resources()
+    
+    app = Flask(__name__)
+    CORS(app)  # 啟用 CORS 支援
+    app.register_blueprint(voice_bp)
+    return app
+
+if __name__ == '__main__':
+    app = create_app()
+    
     print("\n" + "="*50)
     print("🚀 本地服務已準備就緒！請點擊以下連結開始使用：")
     print("   👉 http://0.0.0.0:5050")
     print("="*50 + "\n")
 
-    app.run(host='0.0.0.0', port=5050, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5050, debug=True)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音訊解碼模組
+將上傳的 WebM/Opus、MP3、WAV 等位元組直接在記憶體中解碼為 16 kHz 單聲道 int16 PCM，
+不寫入暫存檔：
+- WAV：以 wav_utils 直接解析
+- 其他格式：優先使用 PyAV（行程內解碼，不需 fork）
+- 未安裝 PyAV 時：以 ffmpeg 管線（stdin → stdout）解碼
+"""
+
+import io
+import subprocess
+import numpy as np
+
+import wav_utils
+
+try:
+    import av
+except ImportError:
+    av = None
+
+TARGET_SAMPLE_RATE = 16000
+
+
+def _decode_with_av(data, target_rate):
+    """使用 PyAV 在行程內解碼並重新取樣"""
+    chunks = []
+    with av.open(io.BytesIO(data), mode='r') as container:
+        stream = container.streams.audio[0]
+        resampler = av.AudioResampler(format='s16', layout='mono', rate=target_rate)
+        for frame in container.decode(stream):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray().reshape(-1))
+        # 取出重新取樣器中剩餘的樣本
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray().reshape(-1))
+    if not chunks:
+        return np.zeros(0, dtype=np.int16)
+    return np.concatenate(chunks).astype(np.int16, copy=False)
+
+
+def _decode_with_ffmpeg_pipe(data, target_rate, ffmpeg_path):
+    """以 ffmpeg 管線解碼（輸入輸出皆經由管線，不產生暫存檔）"""
+    cmd = [
+        ffmpeg_path,
+        '-hide_banner',
+        '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-f', 's16le',
+        '-acodec', 'pcm_s16le',
+        '-ar', str(target_rate),
+        '-ac', '1',
+        'pipe:1',
+    ]
+    result = subprocess.run(cmd, input=data, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg 解碼失敗: {result.stderr.decode('utf-8', errors='ignore')}")
+    return np.frombuffer(result.stdout, dtype='<i2').astype(np.int16)
+
+
+def decode_audio_bytes(data, target_rate=TARGET_SAMPLE_RATE, ffmpeg_path=None):
+    """將音訊位元組解碼為一維 int16 PCM（target_rate、單聲道）"""
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        pcm, rate = wav_utils.read_wav_bytes(data)
+        return wav_utils.resample(wav_utils.to_mono(pcm), rate, target_rate)
+
+    if av is not None:
+        return _decode_with_av(data, target_rate)
+
+    if ffmpeg_path:
+        return _decode_with_ffmpeg_pipe(data, target_rate, ffmpeg_path)
+
+    raise RuntimeError("無可用的音訊解碼器（請安裝 PyAV 或 FFmpeg）")
+
+
+def decoder_backend(ffmpeg_path=None):
+    """返回目前使用的解碼方式（供啟動訊息顯示）"""
+    if av is not None:
+        return f"PyAV {av.__version__}"
+    if ffmpeg_path:
+        return f"FFmpeg 管線 ({ffmpeg_path})"
+    return "無（僅支援 WAV）"
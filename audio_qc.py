@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音訊品質檢查模組
+直接從 WAV 標頭與 PCM 緩衝區以 NumPy 一次向量化計算
+時長、RMS、峰值、削波比例與簡易 VAD 語音比例，並給出是否送出辨識的判定。
+"""
+
+import wave
+import io
+import numpy as np
+
+import audio_vad
+
+# 判定門檻（與原 librosa 檢查相同的時長、RMS、振幅門檻）
+QC_THRESHOLDS = {
+    'min_duration': 0.5,        # 秒，過短直接拒絕
+    'max_duration': 30.0,       # 秒，過長僅警告
+    'min_rms': 0.001,           # 太安靜直接拒絕
+    'min_peak': 0.01,           # 振幅太小直接拒絕
+    'clip_level': 0.999,        # 視為削波的振幅
+    'max_clipping_ratio': 0.01, # 削波比例過高僅警告
+    'min_speech_ratio': 0.05,   # 語音幀比例過低僅警告
+}
+
+
+def analyze_pcm(pcm, sample_rate, thresholds=None):
+    """
+    分析 PCM（int16 或 -1~1 浮點，一維單聲道），返回判定結果 dict：
+    ok、reason（拒絕原因）、warnings，以及 duration、rms、peak、clipping_ratio、speech_ratio
+    """
+    t = dict(QC_THRESHOLDS, **(thresholds or {}))
+    pcm = np.asarray(pcm)
+    if pcm.dtype == np.int16:
+        samples = pcm.astype(np.float32) * (1.0 / 32768.0)
+    else:
+        samples = pcm.astype(np.float32, copy=False)
+
+    n = len(samples)
+    duration = n / sample_rate if sample_rate else 0.0
+    if n:
+        abs_samples = np.abs(samples)
+        peak = float(abs_samples.max())
+        rms = float(np.sqrt(np.mean(samples ** 2)))
+        clipping_ratio = float(np.count_nonzero(abs_samples >= t['clip_level']) / n)
+        _, frame_rms, frame_zcr = audio_vad.frame_features(samples, sample_rate)
+        mask = audio_vad.speech_mask(frame_rms, frame_zcr, t['min_rms'])
+        speech_ratio = float(mask.mean()) if len(mask) else 0.0
+    else:
+        peak = rms = clipping_ratio = speech_ratio = 0.0
+
+    verdict = {
+        'ok': True,
+        'reason': None,
+        'warnings': [],
+        'duration': duration,
+        'samples': n,
+        'sample_rate': sample_rate,
+        'rms': rms,
+        'peak': peak,
+        'clipping_ratio': clipping_ratio,
+        'speech_ratio': speech_ratio,
+    }
+
+    if duration < t['min_duration']:
+        verdict.update(ok=False, reason=f"音訊太短（< {t['min_duration']}秒）")
+    elif rms < t['min_rms']:
+        verdict.update(ok=False, reason=f"音訊太安靜（RMS < {t['min_rms']}）")
+    elif peak < t['min_peak']:
+        verdict.update(ok=False, reason=f"音訊振幅太小（< {t['min_peak']}）")
+
+    if duration > t['max_duration']:
+        verdict['warnings'].append(f"音訊太長（> {t['max_duration']}秒）")
+    if clipping_ratio > t['max_clipping_ratio']:
+        verdict['warnings'].append(f"削波比例過高（{clipping_ratio:.1%}）")
+    if verdict['ok'] and speech_ratio < t['min_speech_ratio']:
+        verdict['warnings'].append(f"語音比例偏低（{speech_ratio:.1%}）")
+
+    return verdict
+
+
+def read_wav_pcm(data):
+    """從 WAV 位元組讀取標頭並以 memoryview 取得 PCM（不複製資料），返回 (一維單聲道陣列, 採樣率)"""
+    with wave.open(io.BytesIO(data), 'rb') as w:
+        channels = w.getnchannels()
+        sample_rate = w.getframerate()
+        sample_width = w.getsampwidth()
+        n_frames = w.getnframes()
+
+    # 標準 44 位元組標頭之後即為 PCM；非標準標頭則搜尋 data 區塊
+    offset = 44
+    if data[36:40] != b'data':
+        idx = data.find(b'data', 12)
+        if idx < 0:
+            raise ValueError("找不到 WAV data 區塊")
+        offset = idx + 8
+    payload = memoryview(data)[offset:offset + n_frames * channels * sample_width]
+
+    if sample_width == 2:
+        pcm = np.frombuffer(payload, dtype='<i2')
+    elif sample_width == 4:
+        pcm = np.frombuffer(payload, dtype='<i4').astype(np.float32) / 2147483648.0
+    elif sample_width == 1:
+        pcm = (np.frombuffer(payload, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        raise ValueError(f"不支援的取樣寬度: {sample_width * 8} bits")
+
+    if channels > 1:
+        pcm = pcm.reshape(-1, channels).astype(np.float32).mean(axis=1)
+        if sample_width == 2:
+            pcm = pcm / 32768.0
+    return pcm, sample_rate
+
+
+def analyze_wav_bytes(data, thresholds=None):
+    """分析 WAV 位元組"""
+    pcm, sample_rate = read_wav_pcm(data)
+    return analyze_pcm(pcm, sample_rate, thresholds)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+語音活動偵測（VAD）模組
+以逐幀能量與過零率（向量化計算）判斷語音區段，
+裁掉前後靜音，並可將超過上限的長語句在最安靜處切成數段，減少 STT 上傳量與運算量。
+"""
+
+import numpy as np
+
+FRAME_MS = 30
+PAD_MS = 200            # 語音前後保留的邊界
+HANGOVER_FRAMES = 5     # 語音幀向前後延伸的幀數，避免字尾弱音被判為靜音
+MAX_CHUNK_SECONDS = 30.0
+
+
+def _to_float(pcm):
+    pcm = np.asarray(pcm)
+    if pcm.dtype == np.int16:
+        return pcm.astype(np.float32) * (1.0 / 32768.0)
+    return pcm.astype(np.float32, copy=False)
+
+
+def frame_features(samples, sample_rate, frame_ms=FRAME_MS):
+    """返回 (幀長, 各幀 RMS, 各幀過零率)"""
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return frame_len, np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1 if frame_len > 1 else 1)
+    return frame_len, rms, zcr
+
+
+def speech_mask(rms, zcr, min_rms=0.001):
+    """
+    能量高於噪音底門檻者視為語音；
+    能量略低但過零率高者（如 s、h、tsh 等清擦音）亦視為語音
+    """
+    if len(rms) == 0:
+        return np.zeros(0, dtype=bool)
+    # 噪音底取第 10 百分位；靜音很短時百分位會落在語音上，故門檻不超過最大幀能量的 -20 dB
+    noise_floor = np.percentile(rms, 10)
+    ceiling = float(rms.max()) * 0.1
+    high = max(min(noise_floor * 3.0, ceiling), min_rms * 2.0)
+    low = max(min(noise_floor * 1.5, ceiling * 0.5), min_rms)
+    mask = (rms > high) | ((rms > low) & (zcr > 0.25))
+
+    # 以卷積向前後延伸語音幀（hangover）
+    if mask.any() and HANGOVER_FRAMES:
+        kernel = np.ones(2 * HANGOVER_FRAMES + 1)
+        mask = np.convolve(mask.astype(np.float32), kernel, mode='same') > 0
+    return mask
+
+
+def find_speech_bounds(pcm, sample_rate, pad_ms=PAD_MS):
+    """返回語音區段 (起點樣本, 終點樣本)；找不到語音時返回整段"""
+    samples = _to_float(pcm)
+    frame_len, rms, zcr = frame_features(samples, sample_rate)
+    mask = speech_mask(rms, zcr)
+    if not mask.any():
+        return 0, len(samples)
+    voiced = np.flatnonzero(mask)
+    pad = int(sample_rate * pad_ms / 1000)
+    start = max(0, voiced[0] * frame_len - pad)
+    end = min(len(samples), (voiced[-1] + 1) * frame_len + pad)
+    return int(start), int(end)
+
+
+def split_points(pcm, sample_rate, max_seconds=MAX_CHUNK_SECONDS):
+    """
+    將超過 max_seconds 的語音切成數段，返回 [(起點, 終點), ...]；
+    每段在後半視窗中最後一個非語音幀切開（沒有停頓時取能量最低的幀），讓每段盡量長
+    """
+    n = len(pcm)
+    max_len = int(max_seconds * sample_rate)
+    if n <= max_len:
+        return [(0, n)]
+
+    samples = _to_float(pcm)
+    frame_len, rms, zcr = frame_features(samples, sample_rate)
+    silent = ~speech_mask(rms, zcr)
+    bounds = []
+    start = 0
+    while n - start > max_len:
+        lo = (start + max_len // 2) // frame_len
+        hi = (start + max_len) // frame_len
+        pauses = np.flatnonzero(silent[lo:hi])
+        if len(pauses):
+            cut = (lo + int(pauses[-1])) * frame_len
+        elif hi > lo:
+            cut = (lo + int(np.argmin(rms[lo:hi]))) * frame_len
+        else:
+            cut = start + max_len
+        cut = min(max(cut, start + frame_len), start + max_len)
+        bounds.append((start, cut))
+        start = cut
+    bounds.append((start, n))
+    return bounds
+
+
+def trim_and_split(pcm, sample_rate, trim=True, split=True, max_seconds=MAX_CHUNK_SECONDS):
+    """
+    裁掉前後靜音並視需要切段，返回 dict：
+    pcm（裁切後）、chunks（各段 PCM）、original_duration、trimmed_duration
+    """
+    original_duration = len(pcm) / sample_rate if sample_rate else 0.0
+    if trim:
+        start, end = find_speech_bounds(pcm, sample_rate)
+        pcm = pcm[start:end]
+    if split:
+        chunks = [pcm[s:e] for s, e in split_points(pcm, sample_rate, max_seconds)]
+    else:
+        chunks = [pcm]
+    return {
+        'pcm': pcm,
+        'chunks': chunks,
+        'original_duration': original_duration,
+        'trimmed_duration': len(pcm) / sample_rate if sample_rate else 0.0,
+    }
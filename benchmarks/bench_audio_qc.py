@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音訊品質檢查基準測試：audio_qc（NumPy 直接解析 WAV）vs librosa.load
+
+以合成的 16 kHz / 44.1 kHz WAV 測試不同長度下的延遲；
+librosa 在第一次呼叫時才匯入（只影響第一個量測值，中位數不受影響）。
+
+用法（於專案根目錄執行）:
+    python benchmarks/bench_audio_qc.py
+    python benchmarks/bench_audio_qc.py --repeat 50 --durations 1 5 30
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import importlib.util
+import statistics
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_qc
+import wav_utils
+
+
+def synth_wav(duration, sample_rate):
+    """合成含語音般起伏與前後靜音的測試 WAV 位元組"""
+    rng = np.random.default_rng(0)
+    n = int(duration * sample_rate)
+    t = np.arange(n) / sample_rate
+    envelope = (np.sin(2 * np.pi * 2 * t) > 0).astype(np.float32)
+    signal = 0.3 * np.sin(2 * np.pi * 220 * t) * envelope + 0.002 * rng.standard_normal(n)
+    pcm = np.clip(signal * 32767, -32768, 32767).astype(np.int16)
+    return wav_utils.write_wav_bytes(pcm, sample_rate)
+
+
+def librosa_qc(path):
+    """原本 analyze_audio_quality 的 librosa 做法"""
+    import librosa
+    audio_data, sr = librosa.load(path, sr=16000, mono=True)
+    duration = len(audio_data) / sr
+    rms = np.sqrt(np.mean(audio_data ** 2))
+    max_amplitude = np.max(np.abs(audio_data))
+    return duration, rms, max_amplitude
+
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"  {name:<10} 平均={statistics.mean(samples) * 1000:.3f}ms "
+          f"中位數={statistics.median(samples) * 1000:.3f}ms p95={p95 * 1000:.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='audio_qc vs librosa 音訊品質檢查延遲比較')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--durations', type=float, nargs='+', default=[1.0, 5.0, 15.0, 30.0])
+    parser.add_argument('--sample-rates', type=int, nargs='+', default=[16000, 44100])
+    args = parser.parse_args()
+
+    has_librosa = importlib.util.find_spec('librosa') is not None
+    if not has_librosa:
+        print("未安裝 librosa，僅測試 audio_qc")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for sample_rate in args.sample_rates:
+            for duration in args.durations:
+                data = synth_wav(duration, sample_rate)
+                path = os.path.join(tmp_dir, f"qc_{sample_rate}_{duration}.wav")
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+                verdict = audio_qc.analyze_wav_bytes(data)
+                print(f"\n{duration:g}秒 @ {sample_rate}Hz: ok={verdict['ok']} "
+                      f"rms={verdict['rms']:.4f} peak={verdict['peak']:.4f} "
+                      f"speech_ratio={verdict['speech_ratio']:.2f}")
+
+                qc_samples = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    with open(path, 'rb') as f:
+                        audio_qc.analyze_wav_bytes(f.read())
+                    qc_samples.append(time.perf_counter() - start)
+                summarize('audio_qc', qc_samples)
+
+                if has_librosa:
+                    librosa_samples = []
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        librosa_qc(path)
+                        librosa_samples.append(time.perf_counter() - start)
+                    summarize('librosa', librosa_samples)
+                    print(f"  加速: {statistics.median(librosa_samples) / statistics.median(qc_samples):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
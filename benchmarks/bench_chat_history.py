@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+對話紀錄寫入基準測試：舊版 save_chat_history（find_one + update_one）vs 單次 find_one_and_update
+
+以 pymongo 的命令監聽器計算每輪對話實際送往 MongoDB 的命令數（round trips），
+並量測每輪平均 / p95 延遲；另以多執行緒同時寫入同一 session，檢查是否超過最大輪數。
+測試使用獨立的資料庫（預設 bench_chat_history），結束後刪除。
+
+用法（於專案根目錄執行，需要可連線的 MongoDB）:
+    python benchmarks/bench_chat_history.py
+    python benchmarks/bench_chat_history.py --uri mongodb://localhost:27017 --sessions 200
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import threading
+from datetime import datetime
+
+from pymongo import MongoClient, monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app_local
+
+
+class CommandCounter(monitoring.CommandListener):
+    """計算送出的命令數（每個命令即一次往返）"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def legacy_save_chat_history(db, session_id, user_id, chat_choose_id, title, user_text, ai_response,
+                             max_turns=app_local.MAX_TURNS):
+    """舊版實作（先讀再寫），保留作為比較基準"""
+    chat_history = db.ChatHistory.find_one({"session_id": session_id})
+    if chat_history:
+        current_turn = chat_history.get('turn', 0)
+        if current_turn >= max_turns:
+            db.ChatHistory.update_one({"session_id": session_id}, {"$set": {"finished": True}})
+            return True, True
+        new_turn = current_turn + 1
+        is_finished = new_turn >= max_turns
+        db.ChatHistory.update_one(
+            {"session_id": session_id},
+            {
+                "$push": {"history": {"$each": [
+                    {"role": "user", "text": user_text, "ts": datetime.now()},
+                    {"role": "assistant", "text": ai_response, "ts": datetime.now()}
+                ]}},
+                "$inc": {"turn": 1},
+                "$set": {"finished": is_finished}
+            }
+        )
+        return True, is_finished
+    db.ChatHistory.insert_one({
+        "session_id": session_id, "userId": user_id, "chatChooseId": chat_choose_id, "title": title,
+        "score": 0, "turn": 1, "finished": False,
+        "history": [
+            {"role": "user", "text": user_text, "ts": datetime.now()},
+            {"role": "assistant", "text": ai_response, "ts": datetime.now()}
+        ]
+    })
+    return True, False
+
+
+def run_sequential(name, save, counter, sessions, turns):
+    latencies = []
+    before = counter.count
+    for s in range(sessions):
+        for t in range(turns):
+            start = time.perf_counter()
+            save(f"{name}-{s}", 'bench_user', 'bench_chat', '基準測試', f"第{t}句", '好！')
+            latencies.append(time.perf_counter() - start)
+    calls = len(latencies)
+    latencies.sort()
+    p95 = latencies[min(calls - 1, int(calls * 0.95))]
+    print(f"{name:<8} 每輪命令數={(counter.count - before) / calls:.2f} "
+          f"平均={statistics.mean(latencies) * 1000:.2f}ms p95={p95 * 1000:.2f}ms（{calls} 輪）")
+
+
+def run_race(name, save, db, threads):
+    """多執行緒同時寫入同一 session，返回最終輪數與 history 長度"""
+    session_id = f"{name}-race"
+    barrier = threading.Barrier(threads)
+    errors = []
+
+    def worker(i):
+        barrier.wait()
+        try:
+            save(session_id, 'bench_user', 'bench_chat', '基準測試', f"並行{i}", '好！')
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    docs = list(db.ChatHistory.find({"session_id": session_id}))
+    turns = [d.get('turn') for d in docs]
+    lengths = [len(d.get('history', [])) // 2 for d in docs]
+    print(f"{name:<8} {threads} 個並行寫入 → 文件數={len(docs)} turn={turns} 實際輪數={lengths}"
+          f"（上限 {app_local.MAX_TURNS}）錯誤={len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ChatHistory 寫入往返次數與延遲比較')
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default='bench_chat_history')
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--turns', type=int, default=app_local.MAX_TURNS + 1, help='每個 session 的輪數（含超過上限的一輪）')
+    parser.add_argument('--race-threads', type=int, default=20)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = MongoClient(args.uri, event_listeners=[counter], serverSelectionTimeoutMS=3000)
+    client.admin.command('ping')
+    client.drop_database(args.database)
+    db = client[args.database]
+
+    app_local.db = db
+    app_local.ensure_chat_history_indexes()
+
+    def legacy(*a):
+        return legacy_save_chat_history(db, *a)
+
+    try:
+        run_sequential('舊版', legacy, counter, args.sessions, args.turns)
+        run_sequential('單次更新', app_local.save_chat_history, counter, args.sessions, args.turns)
+        run_race('舊版', legacy, db, args.race_threads)
+        run_race('單次更新', app_local.save_chat_history, db, args.race_threads)
+    finally:
+        client.drop_database(args.database)
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+對話紀錄儲存方式基準測試：ChatHistory 單一文件（history 陣列）vs 分輪儲存（ChatSessions + ChatTurns）
+
+寫入放大：每輪寫入後被改寫的文件大小（BSON 位元組）。單一文件的更新會改寫整份文件，
+文件隨輪數變大；分輪儲存每輪只新增一份固定大小的文件並改寫精簡的摘要。
+讀取延遲：重播整段對話（全部輪次）與只取最近 N 輪（組提示詞時的讀法）的平均 / p95。
+測試使用獨立的資料庫（預設 bench_chat_layout），結束後刪除。
+
+用法（於專案根目錄執行，需要可連線的 MongoDB）:
+    python benchmarks/bench_chat_layout.py
+    python benchmarks/bench_chat_layout.py --turns 100 --sessions 50 --recent 4
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import bson
+from pymongo import MongoClient, ReturnDocument
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_history_store import ChatTurnStore, chat_turn_entries, chat_turn_pipeline
+
+USER_TEXT = "我今仔日佮朋友去夜市食蚵仔煎，閣買一杯珍珠奶茶。"
+AI_RESPONSE = "聽起來真好食！恁佇夜市閣有食啥物？"
+
+
+def summarize(name, latencies, extra=''):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"  {name:<14} 平均={statistics.mean(latencies) * 1000:7.2f}ms p95={p95 * 1000:7.2f}ms {extra}")
+
+
+def bench_embedded(db, sessions, turns, recent):
+    collection = db.ChatHistory
+    collection.create_index("session_id", unique=True)
+    latencies, rewritten = [], []
+    for s in range(sessions):
+        session_id = f"embedded-{s}"
+        for t in range(turns):
+            entries = chat_turn_entries(USER_TEXT, AI_RESPONSE)
+            start = time.perf_counter()
+            doc = collection.find_one_and_update(
+                {"session_id": session_id, "turn": {"$lt": turns}},
+                chat_turn_pipeline('bench_user', 'bench_chat', '基準測試', entries, turns),
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            latencies.append(time.perf_counter() - start)
+            # 更新會改寫整份文件
+            rewritten.append(len(bson.encode(doc)))
+
+    full, last = [], []
+    for s in range(sessions):
+        session_id = f"embedded-{s}"
+        start = time.perf_counter()
+        collection.find_one({"session_id": session_id})
+        full.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        collection.find_one({"session_id": session_id}, {"history": {"$slice": -recent * 2}, "turn": 1})
+        last.append(time.perf_counter() - start)
+    return latencies, rewritten, full, last
+
+
+def bench_turns(db, sessions, turns, recent):
+    store = ChatTurnStore(db, turns)
+    store.ensure_indexes()
+    latencies, rewritten = [], []
+    for s in range(sessions):
+        session_id = f"turns-{s}"
+        for t in range(turns):
+            start = time.perf_counter()
+            store.append_turn(session_id, 'bench_user', 'bench_chat', '基準測試', USER_TEXT, AI_RESPONSE)
+            latencies.append(time.perf_counter() - start)
+        # 每輪改寫的資料：摘要文件 + 新增的單輪文件（兩者大小不隨輪數變化）
+        summary = store.sessions.find_one({"session_id": session_id})
+        turn_doc = store.turns.find_one({"session_id": session_id, "turn": turns})
+        rewritten.extend([len(bson.encode(summary)) + len(bson.encode(turn_doc))] * turns)
+
+    full, last = [], []
+    for s in range(sessions):
+        session_id = f"turns-{s}"
+        start = time.perf_counter()
+        store.get_session(session_id)
+        full.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        store.recent_history(session_id, recent)
+        last.append(time.perf_counter() - start)
+    return latencies, rewritten, full, last
+
+
+def report(name, results, turns):
+    latencies, rewritten, full, last = results
+    print(f"\n{name}")
+    summarize('每輪寫入', latencies)
+    print(f"  {'寫入放大':<14} 平均每輪改寫 {statistics.mean(rewritten) / 1024:7.1f} KB，"
+          f"最後一輪 {rewritten[turns - 1] / 1024:7.1f} KB，"
+          f"整段對話累計 {sum(rewritten[:turns]) / 1024:8.1f} KB")
+    summarize('重播整段', full)
+    summarize('最近幾輪', last)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ChatHistory 單一文件 vs 分輪儲存')
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default='bench_chat_layout')
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--turns', type=int, default=50, help='每個 session 的輪數（自由對話模式的上限）')
+    parser.add_argument('--recent', type=int, default=4, help='組提示詞時讀取的最近輪數')
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=3000)
+    client.admin.command('ping')
+    client.drop_database(args.database)
+    db = client[args.database]
+    print(f"{args.sessions} 個對話 × {args.turns} 輪")
+
+    try:
+        report('單一文件（ChatHistory）', bench_embedded(db, args.sessions, args.turns, args.recent), args.turns)
+        report('分輪儲存（ChatSessions + ChatTurns）', bench_turns(db, args.sessions, args.turns, args.recent), args.turns)
+    finally:
+        client.drop_database(args.database)
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
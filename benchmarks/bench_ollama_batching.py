@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ollama 微批次排程基準測試：每次呼叫直接送出 /api/generate vs OllamaBatchScheduler
+
+模擬一間教室同時送出 --users 個短提示詞（語料中有重複的常見句），
+分別量測兩種呼叫方式的吞吐量、p50/p95 延遲與失敗數。
+
+預設使用內建的模擬 Ollama：--slots 個平行槽、每個請求固定 --latency 秒，
+排隊超過 --server-queue 個時返回 503（與 Ollama 的 OLLAMA_MAX_QUEUE 行為相同）。
+加上 --url 則改測真實的 Ollama 服務（請確認模型已下載）。
+
+用法（於專案根目錄執行）:
+    python benchmarks/bench_ollama_batching.py
+    python benchmarks/bench_ollama_batching.py --users 64 --slots 4 --latency 0.5
+    python benchmarks/bench_ollama_batching.py --url http://localhost:11434 --model gemma3:4b --parallel 4
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_scheduler import OllamaBatchScheduler
+
+# 課堂常見的學生語句（會重複出現）
+CORPUS = [
+    "你好",
+    "多謝",
+    "再見",
+    "食飽未？",
+    "我是台灣人。",
+    "今仔日天氣真好。",
+    "你欲去佗位？",
+    "歹勢，我毋是老師。",
+    "明仔載會落雨無？",
+    "我佮朋友去學校讀冊。",
+]
+
+
+def start_mock_ollama(port, slots, latency, max_queue):
+    """模擬 Ollama：slots 個平行槽，排隊超過 max_queue 時返回 503"""
+    state = {'slots': threading.BoundedSemaphore(slots), 'waiting': 0, 'lock': threading.Lock()}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            with state['lock']:
+                if state['waiting'] >= max_queue:
+                    self._reply(503, {'error': 'server busy, please try again.  maximum pending requests exceeded'})
+                    return
+                state['waiting'] += 1
+            with state['slots']:
+                with state['lock']:
+                    state['waiting'] -= 1
+                time.sleep(latency)
+            self._reply(200, {'model': body.get('model'), 'response': '好！', 'done': True})
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def summarize(name, latencies, failures, wall):
+    latencies = sorted(latencies)
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        p50 = statistics.median(latencies)
+    else:
+        p50 = p95 = float('nan')
+    total = len(latencies) + failures
+    print(f"{name:<12} 成功={len(latencies):<4}/{total:<4} 吞吐量={len(latencies) / wall:7.2f} req/s "
+          f"p50={p50 * 1000:8.1f}ms p95={p95 * 1000:8.1f}ms 失敗={failures}")
+
+
+def run_users(call, prompts):
+    """所有使用者同時送出，返回 (延遲列表, 失敗數, 總時間)"""
+    latencies, failures = [], 0
+    lock = threading.Lock()
+
+    def one(prompt):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            call(prompt)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        except Exception:
+            with lock:
+                failures += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        list(pool.map(one, prompts))
+    return latencies, failures, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ollama 直接呼叫 vs 微批次排程')
+    parser.add_argument('--url', help='真實 Ollama 網址（未指定時使用模擬服務）')
+    parser.add_argument('--model', default='gemma3:4b')
+    parser.add_argument('--users', type=int, default=48, help='同時送出的使用者數')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--parallel', type=int, default=4, help='排程器並行數')
+    parser.add_argument('--window-ms', type=float, default=20)
+    parser.add_argument('--slots', type=int, default=4, help='模擬服務的平行槽數')
+    parser.add_argument('--latency', type=float, default=0.3, help='模擬服務每個請求的秒數')
+    parser.add_argument('--server-queue', type=int, default=16, help='模擬服務的排隊上限')
+    parser.add_argument('--port', type=int, default=5193)
+    args = parser.parse_args()
+
+    url = args.url
+    if not url:
+        start_mock_ollama(args.port, args.slots, args.latency, args.server_queue)
+        url = f'http://127.0.0.1:{args.port}'
+        print(f"模擬 Ollama: {args.slots} 個平行槽, 每個請求 {args.latency:g}s, 排隊上限 {args.server_queue}")
+
+    session = requests.Session()
+
+    def direct(prompt):
+        # 原本的呼叫方式：每個請求各自立即送出
+        response = session.post(f'{url}/api/generate', json={
+            'model': args.model, 'prompt': prompt, 'stream': False
+        }, timeout=60)
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+        return response.json()
+
+    scheduler = OllamaBatchScheduler(url, args.model, window_ms=args.window_ms, parallel=args.parallel, timeout=60)
+    if args.url:
+        scheduler.warm_up()
+
+    rng = random.Random(0)
+    for round_no in range(1, args.rounds + 1):
+        prompts = [rng.choice(CORPUS) for _ in range(args.users)]
+        print(f"\n第 {round_no} 輪：{args.users} 個請求，{len(set(prompts))} 種不同句子")
+        summarize('直接呼叫', *run_users(direct, prompts))
+        summarize('微批次排程', *run_users(lambda p: scheduler.generate(p), prompts))
+
+    stats = scheduler.stats()
+    print(f"\n排程器統計: 批次數={stats['batches']} 平均批次大小={stats['avg_batch_size']:.1f} "
+          f"合併重複={stats['deduplicated']} 實際送出={stats['sent']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+標音延遲基準測試：本地詞庫引擎 vs 意傳標音 API
+
+用法（於專案根目錄執行）:
+    python benchmarks/bench_pronunciation.py
+    python benchmarks/bench_pronunciation.py --local-only --repeat 1000
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_pronunciation import LocalPronunciationEngine
+
+# 固定語料（涵蓋詞庫內與詞庫外的句子）
+CORPUS = [
+    "你好",
+    "多謝",
+    "再見",
+    "食飽未？",
+    "我是台灣人。",
+    "今仔日天氣真好。",
+    "阮阿公足歡喜。",
+    "你欲去佗位？",
+    "歹勢，我毋是老師。",
+    "請問這馬幾點？",
+    "明仔載會落雨無？",
+    "我佮朋友去學校讀冊。",
+]
+
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{name:<10} 次數={len(samples):<6} 平均={statistics.mean(samples) * 1000:.3f}ms "
+          f"中位數={statistics.median(samples) * 1000:.3f}ms p95={p95 * 1000:.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地詞庫 vs 意傳 API 標音延遲比較')
+    parser.add_argument('--lexicon', default='data/taiwanese_lexicon.tsv')
+    parser.add_argument('--repeat', type=int, default=200, help='本地引擎每句重複次數')
+    parser.add_argument('--local-only', action='store_true', help='不呼叫意傳 API')
+    args = parser.parse_args()
+
+    engine = LocalPronunciationEngine(lexicon_paths=[args.lexicon])
+
+    covered = [s for s in CORPUS if engine.lookup(s)]
+    print(f"詞庫涵蓋率: {len(covered)}/{len(CORPUS)}")
+    for s in CORPUS:
+        result = engine.lookup(s)
+        print(f"  {s} -> {result[0] if result else '(詞庫外，需呼叫 API)'}")
+
+    local_samples = []
+    for _ in range(args.repeat):
+        for s in CORPUS:
+            start = time.perf_counter()
+            engine.lookup(s)
+            local_samples.append(time.perf_counter() - start)
+    summarize('本地引擎', local_samples)
+
+    if args.local_only:
+        return
+
+    from app_local import fetch_taiwanese_pronunciation
+    remote_samples = []
+    for s in CORPUS:
+        start = time.perf_counter()
+        fetch_taiwanese_pronunciation(s)
+        remote_samples.append(time.perf_counter() - start)
+    summarize('意傳API', remote_samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多 worker 擴展性基準測試：以不同 worker 數啟動 gunicorn（gunicorn.conf.py），
+量測每秒請求數與 p50/p95 延遲，觀察吞吐量是否隨 CPU 核心數成長。
+
+預設壓測 /process_audio（skip_llm / skip_tts / skip_db），每個請求在服務內做
+音檔解碼、靜音裁切、品質檢查與 WAV 編碼等 CPU 工作；STT 由本腳本啟動的本機模擬服務
+立即回應，避免量到上游延遲。也可用 --path /health 只量測框架本身的開銷。
+
+用法（於專案根目錄執行）:
+    python benchmarks/bench_workers.py
+    python benchmarks/bench_workers.py --workers 1,2,4,8 --clients 32 --duration 20
+    python benchmarks/bench_workers.py --path /health
+
+結果會依機器核心數與音檔長度而不同，請在部署機器上執行；
+worker 數超過實體核心數後吞吐量不再成長屬正常現象。
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import subprocess
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import wav_utils
+
+
+def synthetic_wav(seconds, sample_rate=16000):
+    """產生前後帶靜音的合成語音（220Hz 調幅正弦波）"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pcm = 0.25 * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)) * np.sin(2 * np.pi * 220 * t)
+    pad = np.zeros(sample_rate // 2)
+    pcm = np.concatenate([pad, pcm, pad])
+    return wav_utils.write_wav_bytes((pcm * 32767).astype(np.int16), sample_rate)
+
+
+def percentile(samples, q):
+    if not samples:
+        return float('nan')
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class MockSttHandler(BaseHTTPRequestHandler):
+    """立即回應的 STT 模擬服務"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'success': True, 'transcription': '你好'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_mock_stt(port):
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockSttHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_server(workers, port, stt_port, threads):
+    env = dict(os.environ,
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_THREADS=str(threads),
+               GUNICORN_BIND=f'127.0.0.1:{port}',
+               GUNICORN_ACCESS_LOG='/dev/null',
+               REMOTE_STT_URL=f'http://127.0.0.1:{stt_port}')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/health', timeout=1).status_code == 200:
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    stop_server(proc)
+    raise RuntimeError('gunicorn 啟動逾時')
+
+
+def stop_server(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=30)
+    except Exception:
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+def client_loop(args):
+    """單一壓測行程：在 duration 秒內連續送出請求，返回各請求延遲與錯誤數"""
+    url, path, duration, wav_bytes = args
+    session = requests.Session()
+    latencies, errors = [], 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            if path == '/process_audio':
+                response = session.post(
+                    url + path,
+                    files={'audio': ('bench.wav', wav_bytes, 'audio/wav')},
+                    data={'skip_llm': 'true', 'skip_tts': 'true', 'skip_db': 'true'},
+                    timeout=60,
+                )
+            else:
+                response = session.get(url + path, timeout=60)
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+        except requests.RequestException:
+            errors += 1
+    return latencies, errors
+
+
+def run_level(url, path, clients, duration, wav_bytes):
+    with multiprocessing.Pool(clients) as pool:
+        start = time.time()
+        parts = pool.map(client_loop, [(url, path, duration, wav_bytes)] * clients)
+        wall = time.time() - start
+    latencies = [t for part, _ in parts for t in part]
+    errors = sum(e for _, e in parts)
+    return len(latencies) / wall, percentile(latencies, 0.5), percentile(latencies, 0.95), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gunicorn 多 worker 吞吐量擴展測試')
+    parser.add_argument('--workers', default=f'1,2,4,{multiprocessing.cpu_count()}', help='逐級 worker 數（逗號分隔）')
+    parser.add_argument('--threads', type=int, default=8, help='每個 worker 的執行緒數')
+    parser.add_argument('--clients', type=int, default=16, help='壓測並行行程數')
+    parser.add_argument('--duration', type=float, default=15.0, help='每一級壓測秒數')
+    parser.add_argument('--path', default='/process_audio', choices=['/process_audio', '/health'])
+    parser.add_argument('--audio-seconds', type=float, default=3.0)
+    parser.add_argument('--port', type=int, default=5090)
+    parser.add_argument('--stt-port', type=int, default=5091)
+    args = parser.parse_args()
+
+    levels = sorted({int(x) for x in args.workers.split(',') if x.strip()})
+    wav_bytes = synthetic_wav(seconds=args.audio_seconds)
+    stt_server = start_mock_stt(args.stt_port)
+    url = f'http://127.0.0.1:{args.port}'
+
+    print(f"CPU 核心數: {multiprocessing.cpu_count()}，路徑: {args.path}，壓測行程: {args.clients}")
+    print(f"{'workers':>8} {'req/s':>10} {'倍率':>6} {'p50(ms)':>9} {'p95(ms)':>9} {'錯誤':>6}")
+    baseline = None
+    try:
+        for workers in levels:
+            proc = start_server(workers, args.port, args.stt_port, args.threads)
+            try:
+                run_level(url, args.path, args.clients, 2.0, wav_bytes)  # 暖機
+                rps, p50, p95, errors = run_level(url, args.path, args.clients, args.duration, wav_bytes)
+            finally:
+                stop_server(proc)
+            baseline = baseline or rps
+            print(f"{workers:>8} {rps:>10.1f} {rps / baseline:>6.2f} {p50 * 1000:>9.1f} {p95 * 1000:>9.1f} {errors:>6}")
+    finally:
+        stt_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
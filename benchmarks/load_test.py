@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+並行連線負載測試：Flask 版（app_local.py）vs ASGI 版（app_asgi.py）
+
+逐步提高同時上傳錄音的連線數，記錄每一級的成功率與 p50/p95 延遲，
+用來比較兩個服務在上游回應緩慢時能同時撐住多少個對話。
+為了只量測服務本身，可先啟動 --mock-upstreams 模擬上游（固定延遲）：
+模擬服務監聽 TTS 預設的 5000 埠，再將兩個服務的 REMOTE_STT_URL 與 LOCAL_OLLAMA_URL 指向它；
+模擬 LLM 固定回覆同一句話，標音在第一次呼叫意傳 API 後即由標音快取命中。
+
+用法（於專案根目錄執行）:
+    python benchmarks/load_test.py --mock-upstreams --delay 2
+    python benchmarks/load_test.py --url http://localhost:5050 --levels 1,10,50,100,200
+    python benchmarks/load_test.py --url http://localhost:5050 --url http://localhost:5051
+
+需要 httpx（requirements_voice.txt）；模擬上游需要 quart 與 hypercorn。
+"""
+
+import io
+import sys
+import math
+import time
+import wave
+import asyncio
+import argparse
+
+import httpx
+
+
+def synthetic_wav(seconds=2.0, sample_rate=16000):
+    """產生一段帶靜音前後綴的合成語音（220Hz 調幅正弦波）"""
+    n = int(seconds * sample_rate)
+    pad = sample_rate // 4
+    frames = bytearray()
+    for i in range(n):
+        if pad <= i < n - pad:
+            envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * i / sample_rate)
+            value = int(8000 * envelope * math.sin(2 * math.pi * 220 * i / sample_rate))
+        else:
+            value = 0
+        frames += value.to_bytes(2, 'little', signed=True)
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(bytes(frames))
+    return buf.getvalue()
+
+
+async def one_request(client, url, wav_bytes, timeout):
+    start = time.perf_counter()
+    try:
+        response = await client.post(
+            f"{url}/process_audio",
+            files={'audio': ('load.wav', wav_bytes, 'audio/wav')},
+            data={'skip_db': 'true'},
+            timeout=timeout,
+        )
+        ok = response.status_code == 200
+        error = None if ok else f"HTTP {response.status_code}"
+    except Exception as e:
+        ok, error = False, type(e).__name__
+    return ok, time.perf_counter() - start, error
+
+
+def percentile(samples, q):
+    if not samples:
+        return float('nan')
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def run_level(url, concurrency, wav_bytes, timeout):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            one_request(client, url, wav_bytes, timeout) for _ in range(concurrency)
+        ])
+        wall = time.perf_counter() - start
+
+    latencies = [t for ok, t, _ in results if ok]
+    errors = {}
+    for ok, _, error in results:
+        if not ok:
+            errors[error] = errors.get(error, 0) + 1
+    return {
+        'concurrency': concurrency,
+        'ok': len(latencies),
+        'wall': wall,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'errors': errors,
+    }
+
+
+async def run_load_test(urls, levels, timeout, max_p95):
+    wav_bytes = synthetic_wav()
+    for url in urls:
+        print(f"\n=== {url} ===")
+        print(f"{'並行數':>6} {'成功':>8} {'p50(s)':>8} {'p95(s)':>8} {'總時間(s)':>10}  錯誤")
+        held = 0
+        for level in levels:
+            r = await run_level(url, level, wav_bytes, timeout)
+            print(f"{r['concurrency']:>6} {r['ok']:>4}/{level:<3} {r['p50']:>8.2f} {r['p95']:>8.2f} "
+                  f"{r['wall']:>10.2f}  {r['errors'] or '-'}")
+            if r['ok'] == level and r['p95'] <= max_p95:
+                held = level
+        print(f"全數成功且 p95 ≤ {max_p95:g}s 的最高並行數: {held}")
+
+
+def run_mock_upstreams(port, delay):
+    """以固定延遲模擬 STT、Ollama、意傳標音與 TTS 四個上游"""
+    from quart import Quart, jsonify, request, Response
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    mock = Quart('mock_upstreams')
+    wav_reply = synthetic_wav(seconds=1.0)
+
+    @mock.route('/transcribe', methods=['POST'])
+    async def transcribe():
+        await asyncio.sleep(delay)
+        return jsonify({'success': True, 'transcription': '你好'})
+
+    @mock.route('/api/generate', methods=['POST'])
+    async def generate():
+        await asyncio.sleep(delay)
+        return jsonify({'response': '多謝。'})
+
+    @mock.route('/api/generate', methods=['GET'])
+    async def generate_get():
+        return jsonify({'ok': True})
+
+    @mock.route('/tau', methods=['POST'])
+    async def pronounce():
+        await asyncio.sleep(delay / 2)
+        form = await request.form
+        return jsonify({'分詞': form.get('taibun', ''), 'kiatko': [{'漢字': '多謝', 'KIP': 'To-siā'}]})
+
+    @mock.route('/bangtsam', methods=['GET'])
+    async def bangtsam():
+        await asyncio.sleep(delay)
+        return Response(wav_reply, mimetype='audio/wav')
+
+    config = Config()
+    config.bind = [f"0.0.0.0:{port}"]
+    print(f"模擬上游已啟動: http://0.0.0.0:{port}（延遲 {delay:g}s）")
+    asyncio.run(serve(mock, config))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flask vs ASGI 語音服務並行負載測試')
+    parser.add_argument('--url', action='append', help='服務網址，可重複指定以比較多個服務')
+    parser.add_argument('--levels', default='1,5,10,25,50,100', help='逐級並行數（逗號分隔）')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--max-p95', type=float, default=30.0, help='視為「撐住」的 p95 上限（秒）')
+    parser.add_argument('--mock-upstreams', action='store_true', help='改為啟動模擬上游服務')
+    parser.add_argument('--port', type=int, default=5000, help='模擬上游監聽埠（預設同 TTS 服務）')
+    parser.add_argument('--delay', type=float, default=2.0, help='模擬上游的回應延遲（秒）')
+    args = parser.parse_args()
+
+    if args.mock_upstreams:
+        run_mock_upstreams(args.port, args.delay)
+        return
+
+    urls = args.url or ['http://localhost:5050']
+    levels = [int(x) for x in args.levels.split(',') if x.strip()]
+    try:
+        asyncio.run(run_load_test(urls, levels, args.timeout, args.max_p95))
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
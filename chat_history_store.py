@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+對話紀錄寫入模組
+提供「附加一輪對話」的 MongoDB 管線更新，以及延後寫入（write-behind）的 ChatHistoryWriter：
+每輪對話以一次原子更新取得輪數後，內容放入有界的記憶體佇列立即返回，背景執行緒依數量或時間以 bulk_write 批次寫入；
+MongoDB 無法連線或佇列已滿時寫入本地暫存檔（JSONL），恢復後自動重送。
+
+另提供分輪儲存的 ChatTurnStore：每輪一份文件（ChatTurns，以 session_id + turn 為鍵），
+對話本身只保留精簡的摘要文件（ChatSessions），輪數增加時每次寫入的資料量不會跟著變大。
+"""
+
+import os
+import glob
+import json
+import time
+import uuid
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, PyMongoError
+
+
+def chat_turn_entries(user_text, ai_response, ts=None, turn_id=None):
+    """一輪對話的 history 項目（使用者 + 助理）；turn_id 用於重送時辨識已寫入的輪次"""
+    now = ts or datetime.now()
+    user_entry = {"role": "user", "text": user_text, "ts": now}
+    if turn_id:
+        user_entry["turn_id"] = turn_id
+    return [
+        user_entry,
+        {"role": "assistant", "text": ai_response, "ts": now}
+    ]
+
+
+def chat_turn_pipeline(user_id, chat_choose_id, title, entries, max_turns):
+    """
+    組出「附加一輪對話」的聚合管線更新：新增對話時補上基本欄位，輪數加一，
+    並依新的輪數設定 finished；文字以 $literal 包住，避免以 $ 開頭的內容被當成欄位路徑
+    """
+    return [
+        {"$set": {
+            "userId": {"$ifNull": ["$userId", {"$literal": user_id}]},
+            "chatChooseId": {"$ifNull": ["$chatChooseId", {"$literal": chat_choose_id}]},
+            "title": {"$ifNull": ["$title", {"$literal": title}]},
+            "score": {"$ifNull": ["$score", 0]},
+            "turn": {"$add": [{"$ifNull": ["$turn", 0]}, 1]},
+            "history": {"$concatArrays": [{"$ifNull": ["$history", []]}, {"$literal": entries}]}
+        }},
+        {"$set": {"finished": {"$gte": ["$turn", max_turns]}}}
+    ]
+
+
+def reserve_turn(collection, session_id, max_turns, pipeline):
+    """
+    以一次原子更新遞增對話輪數並取回新的輪數：返回 {turn, finished}，對話已滿時返回 None
+    篩選「輪數未滿」並 upsert，需要 session_id 唯一索引；並行請求也以資料庫中的輪數為準
+    """
+    # 第一次的重複鍵錯誤可能是兩個請求同時新增同一 session，重試一次即可分辨
+    for attempt in range(2):
+        try:
+            return collection.find_one_and_update(
+                {"session_id": session_id, "turn": {"$lt": max_turns}},
+                pipeline,
+                upsert=True,
+                projection={"turn": 1, "finished": 1, "_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            if attempt == 0:
+                continue
+    # 輪數已滿：篩選不到文件，upsert 又撞到唯一索引
+    collection.update_one(
+        {"session_id": session_id, "finished": {"$ne": True}},
+        {"$set": {"finished": True}}
+    )
+    return None
+
+
+class ChatTurnStore:
+    """
+    分輪儲存的對話紀錄
+    ChatSessions：每個 session 一份摘要（userId、chatChooseId、title、score、turn、finished、時間），
+    ChatTurns：每輪一份文件 {session_id, turn, messages, ts}，messages 與 ChatHistory.history 的項目格式相同。
+    第 0 輪保留給開場白等沒有使用者發言的訊息（見 migrate_chat_history.py）。
+    """
+
+    DUPLICATE_KEY = 11000
+
+    def __init__(self, db, max_turns, sessions_collection='ChatSessions', turns_collection='ChatTurns'):
+        self.sessions = db[sessions_collection]
+        self.turns = db[turns_collection]
+        self.max_turns = max_turns
+
+    def ensure_indexes(self):
+        """建立 session_id 與 (session_id, turn) 唯一索引，失敗時返回 False"""
+        try:
+            self.sessions.create_index("session_id", unique=True)
+            self.turns.create_index([("session_id", 1), ("turn", 1)], unique=True)
+            return True
+        except PyMongoError as e:
+            print(f"⚠️ 建立 ChatSessions / ChatTurns 索引失敗: {e}")
+            return False
+
+    def summary_pipeline(self, user_id, chat_choose_id, title, ts):
+        """摘要文件的管線更新：輪數加一並依新的輪數設定 finished"""
+        return [
+            {"$set": {
+                "userId": {"$ifNull": ["$userId", {"$literal": user_id}]},
+                "chatChooseId": {"$ifNull": ["$chatChooseId", {"$literal": chat_choose_id}]},
+                "title": {"$ifNull": ["$title", {"$literal": title}]},
+                "score": {"$ifNull": ["$score", 0]},
+                "turn": {"$add": [{"$ifNull": ["$turn", 0]}, 1]},
+                "createdAt": {"$ifNull": ["$createdAt", {"$literal": ts}]},
+                "updatedAt": {"$max": ["$updatedAt", {"$literal": ts}]}
+            }},
+            {"$set": {"finished": {"$or": [
+                {"$eq": [{"$ifNull": ["$finished", False]}, True]},
+                {"$gte": ["$turn", self.max_turns]}
+            ]}}}
+        ]
+
+    @staticmethod
+    def turn_update(entries):
+        """單輪文件只在新增時寫入；已存在時不變更，重送同一輪不會覆寫"""
+        return {"$setOnInsert": {"messages": entries, "ts": entries[0]["ts"]}}
+
+    def reserve_turn(self, session_id, user_id, chat_choose_id, title, ts):
+        """遞增摘要的輪數並返回 {turn, finished}（本輪的編號即新的輪數），對話已滿時返回 None"""
+        return reserve_turn(self.sessions, session_id, self.max_turns,
+                            self.summary_pipeline(user_id, chat_choose_id, title, ts))
+
+    def append_turn(self, session_id, user_id, chat_choose_id, title, user_text, ai_response, turn_id=None):
+        """同步附加一輪對話，返回 (成功狀態, 是否達到最大輪數)"""
+        entries = chat_turn_entries(user_text, ai_response, turn_id=turn_id)
+        summary = self.reserve_turn(session_id, user_id, chat_choose_id, title, entries[0]["ts"])
+        if summary is None:
+            return True, True
+        # 單輪文件大小固定，不必改寫既有內容
+        self.turns.update_one({"session_id": session_id, "turn": summary["turn"]}, self.turn_update(entries), upsert=True)
+        return True, summary.get("finished", False)
+
+    def _replay_turn(self, record):
+        """無法取得輪數時暫存的整輪紀錄：已寫入（同一 turn_id）則略過，否則補上並分配輪數"""
+        if self.turns.find_one({"session_id": record['session_id'], "messages.turn_id": record['turn_id']}, {"_id": 1}):
+            return
+        self.append_turn(record['session_id'], record['user_id'], record['chat_choose_id'], record['title'],
+                         record['user_text'], record['ai_response'], turn_id=record['turn_id'])
+
+    def write_records(self, records):
+        """
+        寫入 ChatHistoryWriter 的一批紀錄：history 紀錄帶有已在摘要中分配的輪數，只需寫入單輪文件
+        所有操作都可重複套用，因此失敗時整批重送即可；並行 upsert 的重複鍵錯誤可略過
+        """
+        turn_ops, session_ops = [], []
+        for record in records:
+            if record['op'] == 'finish':
+                session_ops.append(UpdateOne(
+                    {"session_id": record['session_id'], "finished": {"$ne": True}},
+                    {"$set": {"finished": True}}
+                ))
+                continue
+            if record['op'] == 'turn':
+                self._replay_turn(record)
+                continue
+            ts = datetime.fromisoformat(record['ts'])
+            entries = chat_turn_entries(record['user_text'], record['ai_response'], ts=ts, turn_id=record['turn_id'])
+            turn_ops.append(UpdateOne(
+                {"session_id": record['session_id'], "turn": record['turn']}, self.turn_update(entries), upsert=True
+            ))
+
+        skipped = 0
+        for collection, operations in ((self.turns, turn_ops), (self.sessions, session_ops)):
+            if not operations:
+                continue
+            try:
+                collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors') or []
+                if any(error.get('code') != self.DUPLICATE_KEY for error in errors):
+                    raise
+                skipped += len(errors)
+        return skipped
+
+    def get_session(self, session_id):
+        """讀取整段對話，返回與 ChatHistory 相同格式的 dict（history 依輪次組回），不存在時返回 None"""
+        summary = self.sessions.find_one({"session_id": session_id}, {"_id": 0})
+        if summary is None:
+            return None
+        history = []
+        for turn in self.turns.find({"session_id": session_id}, {"_id": 0, "messages": 1}).sort("turn", 1):
+            history.extend(turn.get("messages", []))
+        summary["history"] = history
+        return summary
+
+    def recent_history(self, session_id, turns):
+        """最近 turns 輪的 history 項目（依時間先後）"""
+        cursor = self.turns.find({"session_id": session_id}, {"_id": 0, "messages": 1}).sort("turn", -1).limit(turns)
+        history = []
+        for turn in reversed(list(cursor)):
+            history.extend(turn.get("messages", []))
+        return history
+
+
+# 保護本行程的暫存檔（spill.<pid>.jsonl）
+_SPILL_LOCK = threading.Lock()
+
+
+class ChatHistoryWriter:
+    """
+    延後寫入的 ChatHistory 寫入器（需要 session_id 唯一索引）
+    輪數仍以一次同步的原子更新在資料庫中遞增並取回（多 worker 時最大輪數也以資料庫為準），
+    只有對話內容（history 項目）放入佇列延後批次寫入。
+    指定 turn_store 時改寫入分輪儲存（collection 應為 turn_store.sessions），單輪文件以分配到的輪數為鍵。
+    """
+
+    DUPLICATE_KEY = 11000
+
+    def __init__(self, collection, max_turns, max_queue=10000, batch_size=100, flush_interval=0.5,
+                 spill_dir='data/chat_history_spill', replay_interval=30.0, outage_backoff=10.0,
+                 turn_store=None):
+        self.collection = collection
+        self.turn_store = turn_store
+        self.max_turns = max_turns
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self.replay_interval = replay_interval
+        self.outage_backoff = outage_backoff
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        # 暫存檔以行程 ID 命名，同一行程內的寫入器共用一把鎖（認領改名與附加寫入不可交錯）
+        self._spill_lock = _SPILL_LOCK
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._outage_until = 0.0
+        self._next_replay = 0.0
+        self._thread = None
+
+        # 統計
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.duplicates_skipped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.failures = 0
+        self.reserve_failures = 0
+        self.last_error = None
+        self._flush_times = deque(maxlen=200)
+        self._reserve_times = deque(maxlen=200)
+
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+    # ===== 寫入端 =====
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='chat-history-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    def _reserve(self, session_id, user_id, chat_choose_id, title, ts):
+        if self.turn_store is not None:
+            return self.turn_store.reserve_turn(session_id, user_id, chat_choose_id, title, ts)
+        # 只遞增輪數、不附加內容（entries 為空），對話內容由背景執行緒補上
+        return reserve_turn(self.collection, session_id, self.max_turns,
+                            chat_turn_pipeline(user_id, chat_choose_id, title, [], self.max_turns))
+
+    def record_turn(self, session_id, user_id, chat_choose_id, title, user_text, ai_response):
+        """記錄一輪對話：同步取得輪數（一次往返），內容延後寫入；返回 (成功狀態, 是否達到最大輪數)"""
+        now = datetime.now()
+        record = {
+            'op': 'history',
+            'session_id': session_id,
+            'user_id': user_id,
+            'chat_choose_id': chat_choose_id,
+            'title': title,
+            'user_text': user_text,
+            'ai_response': ai_response,
+            'ts': now.isoformat(),
+            'turn_id': uuid.uuid4().hex,
+        }
+
+        summary = None
+        if time.time() >= self._outage_until:
+            start = time.time()
+            try:
+                summary = self._reserve(session_id, user_id, chat_choose_id, title, now)
+            except PyMongoError as e:
+                with self._stats_lock:
+                    self.reserve_failures += 1
+                    self.last_error = str(e)[:200]
+                print(f"⚠️ 取得對話輪數失敗，本輪改為整輪延後寫入: {e}")
+                if isinstance(e, ConnectionFailure):
+                    # 無法連線時暫停同步呼叫，避免每個請求都等到連線逾時
+                    self._outage_until = time.time() + self.outage_backoff
+            else:
+                if summary is None:
+                    # 對話已滿（已標記 finished）：本輪不寫入，與同步寫入時相同
+                    return True, True
+                with self._stats_lock:
+                    self._reserve_times.append(time.time() - start)
+                record['turn'] = summary['turn']
+                self._enqueue(record)
+                return True, summary.get('finished', False)
+
+        # 無法取得輪數：整輪（含輪數遞增）暫存，恢復後以條件更新補上；本輪無法得知是否已滿
+        record['op'] = 'turn'
+        self._enqueue(record)
+        return True, False
+
+    def _enqueue(self, record):
+        with self._stats_lock:
+            self.enqueued += 1
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # 佇列已滿：直接寫入暫存檔，不阻塞請求
+            self._spill([record])
+
+    # ===== 背景寫入 =====
+
+    def _collect_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+            if time.time() >= self._next_replay:
+                self._next_replay = time.time() + self.replay_interval
+                self.replay_spill()
+
+    def _operation(self, record):
+        if record['op'] == 'finish':
+            return UpdateOne(
+                {"session_id": record['session_id'], "finished": {"$ne": True}},
+                {"$set": {"finished": True}}
+            )
+        entries = chat_turn_entries(
+            record['user_text'], record['ai_response'],
+            ts=datetime.fromisoformat(record['ts']), turn_id=record['turn_id']
+        )
+        if record['op'] == 'history':
+            # 輪數已在 record_turn 中遞增，這裡只附加內容；已含此 turn_id 時不重複附加
+            # 各 worker 的批次先後不定，依時間（同時間時使用者在前）排序維持對話順序
+            return UpdateOne(
+                {"session_id": record['session_id'], "history.turn_id": {"$ne": record['turn_id']}},
+                {"$push": {"history": {"$each": entries, "$sort": {"ts": 1, "role": -1}}}}
+            )
+        # 無法取得輪數時暫存的整輪紀錄（op='turn'）：輪數遞增與內容一起補上；
+        # 篩選排除已含此 turn_id 的文件，重送已寫入的輪次時會撞到唯一索引而被略過，不會重複附加
+        return UpdateOne(
+            {"session_id": record['session_id'], "turn": {"$lt": self.max_turns},
+             "history.turn_id": {"$ne": record['turn_id']}},
+            chat_turn_pipeline(record['user_id'], record['chat_choose_id'], record['title'], entries, self.max_turns),
+            upsert=True
+        )
+
+    def _write(self, records):
+        """批次寫入；無法連線時寫入暫存檔，返回是否全部寫入"""
+        if time.time() < self._outage_until:
+            self._spill(records)
+            return False
+
+        pending = list(records)
+        start = time.time()
+        if self.turn_store is not None:
+            # 分輪儲存的操作都可重複套用：失敗時整批暫存，重送時已寫入的部分不會重複
+            try:
+                skipped = self.turn_store.write_records(pending)
+            except PyMongoError as e:
+                self._record_failure(e)
+                if not isinstance(e, BulkWriteError):
+                    self._outage_until = time.time() + self.outage_backoff
+                self._spill(pending)
+                return False
+            with self._stats_lock:
+                self.duplicates_skipped += skipped
+            pending = []
+        while pending:
+            try:
+                self.collection.bulk_write([self._operation(r) for r in pending], ordered=True)
+                break
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors') or [{}]
+                index = errors[0].get('index', 0)
+                if errors[0].get('code') == self.DUPLICATE_KEY:
+                    # 已寫入過（重送）或該對話已滿：略過這一筆，繼續寫入其後的項目
+                    with self._stats_lock:
+                        self.duplicates_skipped += 1
+                    pending = pending[index + 1:]
+                    continue
+                self._record_failure(e)
+                self._spill(pending[index:])
+                return False
+            except PyMongoError as e:
+                self._record_failure(e)
+                self._outage_until = time.time() + self.outage_backoff
+                self._spill(pending)
+                return False
+
+        with self._stats_lock:
+            self.written += len(records)
+            self.batches += 1
+            self.max_batch = max(self.max_batch, len(records))
+            self._flush_times.append(time.time() - start)
+        return True
+
+    def _record_failure(self, error):
+        with self._stats_lock:
+            self.failures += 1
+            self.last_error = str(error)[:200]
+        print(f"⚠️ 對話紀錄批次寫入失敗，改寫入暫存檔: {error}")
+
+    # ===== 暫存檔 =====
+
+    def _spill_path(self):
+        return f"{self.spill_dir}/spill.{os.getpid()}.jsonl"
+
+    def _spill(self, records):
+        try:
+            with self._spill_lock, open(self._spill_path(), 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            with self._stats_lock:
+                self.spilled += len(records)
+        except OSError as e:
+            print(f"❌ 寫入對話紀錄暫存檔失敗（{len(records)} 筆遺失）: {e}")
+
+    @staticmethod
+    def _owner_alive(path):
+        """暫存檔名最後的數字為寫入（或認領）它的行程 ID；該行程仍在執行時由它自己負責重送"""
+        try:
+            pid = int(path.rsplit('.', 2)[-2] if path.endswith('.jsonl') else path.rsplit('.', 1)[-1])
+        except ValueError:
+            return False
+        if pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def replay_spill(self):
+        """
+        重送暫存檔中的紀錄，返回重送筆數
+        先改名認領檔案（同一檔案只會被一個行程認領），全部寫入或重新暫存後才刪除
+        """
+        if time.time() < self._outage_until:
+            return 0
+        replayed = 0
+        # claimed.* 為認領後尚未處理完就中止的行程留下的檔案
+        paths = sorted(glob.glob(f"{self.spill_dir}/spill.*.jsonl")) + sorted(glob.glob(f"{self.spill_dir}/claimed.*"))
+        for path in paths:
+            if self._owner_alive(path):
+                continue
+            claimed = f"{self.spill_dir}/claimed.{uuid.uuid4().hex[:8]}.{os.getpid()}"
+            try:
+                with self._spill_lock:
+                    os.rename(path, claimed)
+            except OSError:
+                continue  # 已被其他行程認領
+            try:
+                with open(claimed, 'r', encoding='utf-8') as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+            except (OSError, ValueError) as e:
+                print(f"❌ 讀取對話紀錄暫存檔失敗: {claimed} {e}")
+                continue
+
+            for i in range(0, len(records), self.batch_size):
+                batch = records[i:i + self.batch_size]
+                if not self._write(batch):
+                    # 再次失敗（該批已重新暫存）：其餘紀錄也放回暫存檔，等下次重送
+                    self._spill(records[i + self.batch_size:])
+                    break
+                replayed += len(batch)
+            os.remove(claimed)
+        if replayed:
+            with self._stats_lock:
+                self.replayed += replayed
+            print(f"✅ 已重送 {replayed} 筆暫存的對話紀錄")
+        return replayed
+
+    def close(self, timeout=10.0):
+        """停止背景執行緒並寫完佇列中剩餘的紀錄"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        remaining = []
+        while True:
+            try:
+                remaining.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # 結束前不理會斷線退避，再試一次寫入；仍失敗時留在暫存檔由其他行程重送
+        self._outage_until = 0.0
+        if remaining:
+            self._write(remaining)
+        self.replay_spill()
+
+    def stats(self):
+        with self._stats_lock:
+            flush_times = sorted(self._flush_times)
+            spill_files = glob.glob(f"{self.spill_dir}/spill.*.jsonl")
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue': self._queue.maxsize,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'batches': self.batches,
+                'avg_batch_size': (self.written / self.batches) if self.batches else 0.0,
+                'max_batch_size': self.max_batch,
+                'flush_latency_avg': (sum(flush_times) / len(flush_times)) if flush_times else 0.0,
+                'flush_latency_p95': flush_times[min(len(flush_times) - 1, int(len(flush_times) * 0.95))] if flush_times else 0.0,
+                'duplicates_skipped': self.duplicates_skipped,
+                'spilled': self.spilled,
+                'replayed': self.replayed,
+                'spill_files': len(spill_files),
+                'failures': self.failures,
+                'last_error': self.last_error,
+                'reserve_failures': self.reserve_failures,
+                'reserve_latency_avg': (sum(self._reserve_times) / len(self._reserve_times)) if self._reserve_times else 0.0,
+            }
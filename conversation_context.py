@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+對話上下文快取模組
+每個 session 在記憶體中保留最近幾輪對話與 Ollama 上一次返回的 context 向量（LRU + TTL），
+組提示詞時不必讀取 MongoDB：
+- context 向量仍在 token 預算內時直接沿用，提示詞只需本輪的句子，先前的對話不必重新處理
+- 否則（換了 worker、快取過期、向量過長）改以文字帶入最近幾輪，依 token 預算從最舊的一輪開始捨去
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """粗估 token 數：中日韓文字與全形標點每字約一個 token，其餘字元約四個一個"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    other = len(text) - cjk - text.count(' ')
+    return cjk + (max(other, 0) + 3) // 4
+
+
+def pair_history(entries):
+    """將 ChatHistory.history 的項目兩兩配成 (使用者, 助理) 輪次；開場白等單獨的助理訊息略過"""
+    turns = []
+    user_text = None
+    for entry in entries or []:
+        if entry.get('role') == 'user':
+            user_text = entry.get('text', '')
+        elif entry.get('role') == 'assistant' and user_text is not None:
+            turns.append((user_text, entry.get('text', '')))
+            user_text = None
+    return turns
+
+
+class _SessionContext:
+    __slots__ = ('turns', 'ollama_context', 'updated')
+
+    def __init__(self, max_turns, turns=()):
+        self.turns = deque(turns, maxlen=max_turns)
+        self.ollama_context = None
+        self.updated = time.time()
+
+
+class ConversationContextCache:
+    """
+    以 session_id 為鍵的最近對話快取（每個行程各自一份）
+    loader(session_id, turns) 在快取未命中時讀取一次既有紀錄（返回 (使用者, 助理) 列表），
+    之後同一 session 的提示詞都由記憶體組成；多 worker 時其他 worker 新增的輪次不會同步進來。
+    """
+
+    def __init__(self, max_turns=4, token_budget=512, max_sessions=2000, ttl=1800,
+                 reuse_ollama_context=True, loader=None):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.reuse_ollama_context = reuse_ollama_context
+        self.loader = loader
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 統計
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.context_reused = 0
+        self.text_prompts = 0
+        self.trimmed_turns = 0
+        self.context_dropped = 0
+        self.evictions = 0
+
+    def _get(self, session_id):
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and now - entry.updated > self.ttl:
+                del self._sessions[session_id]
+                entry = None
+            if entry is not None:
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        turns = []
+        if self.loader:
+            try:
+                turns = self.loader(session_id, self.max_turns) or []
+                with self._lock:
+                    self.loads += 1
+            except Exception as e:
+                print(f"讀取對話上下文失敗（以空白對話處理）: {e}")
+
+        with self._lock:
+            # 讀取期間其他執行緒可能已建立
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = _SessionContext(self.max_turns, turns[-self.max_turns:])
+                self._store(session_id, entry)
+            return entry
+
+    def _store(self, session_id, entry):
+        self._sessions[session_id] = entry
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def prompt_context(self, session_id, reserve_tokens=0):
+        """
+        返回 (history, ollama_context)：
+        可沿用 Ollama context 時 history 為空列表；否則 ollama_context 為 None，history 為預算內的最近幾輪
+        reserve_tokens 為本輪提示詞本身的 token 數
+        """
+        if not session_id or self.max_turns <= 0:
+            return [], None
+        entry = self._get(session_id)
+        budget = self.token_budget - reserve_tokens
+
+        with self._lock:
+            context = entry.ollama_context
+            if context is not None:
+                if self.reuse_ollama_context and len(context) <= budget:
+                    self.context_reused += 1
+                    return [], context
+                # 向量超過預算：捨棄，改以文字帶入最近幾輪（模型從較短的提示詞重新開始）
+                entry.ollama_context = None
+                self.context_dropped += 1
+            turns = list(entry.turns)
+
+        history = []
+        used = 0
+        for user_text, ai_response in reversed(turns):
+            cost = estimate_tokens(user_text) + estimate_tokens(ai_response) + 4
+            if used + cost > budget:
+                break
+            history.append((user_text, ai_response))
+            used += cost
+        history.reverse()
+
+        with self._lock:
+            self.text_prompts += 1
+            self.trimmed_turns += len(turns) - len(history)
+        return history, None
+
+    def record(self, session_id, user_text, ai_response, ollama_context=None):
+        """記錄一輪對話；ollama_context 為本輪回應附帶的 context（沒有時下一輪改用文字提示詞）"""
+        if not session_id or self.max_turns <= 0:
+            return
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = _SessionContext(self.max_turns)
+                self._store(session_id, entry)
+            else:
+                self._sessions.move_to_end(session_id)
+            entry.turns.append((user_text, ai_response))
+            entry.ollama_context = list(ollama_context) if (ollama_context and self.reuse_ollama_context) else None
+            entry.updated = time.time()
+
+    def forget(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'max_turns': self.max_turns,
+                'token_budget': self.token_budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'loads': self.loads,
+                'context_reused': self.context_reused,
+                'context_dropped': self.context_dropped,
+                'text_prompts': self.text_prompts,
+                'trimmed_turns': self.trimmed_turns,
+                'evictions': self.evictions,
+            }
@@ -30,7 +30,9 @@ module.exports = {
     {
       name: 'voice-service',
       cwd: '/home/b310ai/Taiwanese-Learing-Game',
-      script: 'app_local.py',
+      // gunicorn 以 pre-fork 方式啟動多個 worker（worker 數見 gunicorn.conf.py / GUNICORN_WORKERS）
+      script: '/home/b310ai/Taiwanese-Learing-Game/venv/bin/gunicorn',
+      args: '-c gunicorn.conf.py',
       interpreter: '/home/b310ai/Taiwanese-Learing-Game/venv/bin/python',
       env: {
         NODE_ENV: 'production'
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+台語語音服務的 gunicorn 設定（pre-fork，多 worker）
+
+主行程以 preload_app 預先建立格式轉換器、本地標音詞庫、TTS 服務等只讀資源，
+fork 後各 worker 以 copy-on-write 共用；MongoDB、標音快取持久層與上游 HTTP 連線池
+則在 post_fork 中於每個 worker 各自建立，避免多個行程共用同一組 socket。
+
+多 worker 時的跨行程狀態：
+- 准入控制（ADMISSION_MAX_ACTIVE / ADMISSION_MAX_QUEUE）與上游並行上限（UPSTREAM_MAX_CONCURRENCY_*）
+  的計數在主行程載入應用程式時建立於共享記憶體，所有 worker 合計不超過上限。
+  因此 preload_app 必須開啟（on_starting 會拒絕以 --no-preload 啟動多 worker）。
+- worker 被強制終止時未歸還的名額，由主行程在 child_exit 扣回。
+- 非同步工作（async_job）的狀態存在 MongoDB 的 VoiceJobs，任一 worker 都能回應 /jobs/<id>；
+  MongoDB 無法連線時，多 worker 部署的非同步請求返回 503，請改用 GUNICORN_WORKERS=1。
+- worker 數請以 GUNICORN_WORKERS 設定（不要用 -w 覆寫），應用程式依此判斷是否為多 worker。
+
+啟動:
+    gunicorn -c gunicorn.conf.py
+    GUNICORN_WORKERS=8 GUNICORN_THREADS=16 gunicorn -c gunicorn.conf.py
+"""
+
+import os
+import multiprocessing
+
+wsgi_app = 'app_local:create_app(init_worker=False)'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5050')
+
+# 每個 CPU 核心一個 worker；請求大多在等待上游，每個 worker 再以執行緒並行處理
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# 讓應用程式在載入時就知道 worker 數（主行程 preload 時讀取）
+os.environ['VOICE_SERVICE_WORKERS'] = str(workers)
+
+# STT 最長 60 秒、TTS 最長 45 秒，整段對話需保留足夠時間
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '180'))
+graceful_timeout = 30
+keepalive = 5
+
+preload_app = True
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def on_starting(server):
+    """多 worker 的共用計數須在 fork 前建立，且 worker 數須與應用程式讀到的一致"""
+    if server.cfg.workers > 1 and not server.cfg.preload_app:
+        raise RuntimeError('多 worker 部署須開啟 preload_app，准入與上游並行上限才會由所有 worker 共用')
+    if server.cfg.workers != workers:
+        raise RuntimeError('請以 GUNICORN_WORKERS 設定 worker 數，不要用 -w 覆寫')
+
+
+def post_fork(server, worker):
+    """每個 worker fork 之後建立自己的資料庫與 HTTP 連線"""
+    import app_local
+    app_local.init_worker_resources()
+    server.log.info(f"worker {worker.pid} 連線初始化完成")
+
+
+def worker_exit(server, worker):
+    """worker 結束前寫完尚未送出的對話紀錄"""
+    import app_local
+    app_local.shutdown_worker_resources()
+
+
+def child_exit(server, worker):
+    """（主行程）扣回結束的 worker 仍佔用的准入與上游名額"""
+    import app_local
+    app_local.reclaim_worker_slots(worker.pid)
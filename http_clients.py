@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上游 HTTP 連線池模組
+為 STT、Ollama、意傳標音與 TTS 各維護一個共用的 requests.Session，
+保持 keep-alive 連線重複使用，並依上游設定重試與退避策略；
+GPU 上游另有並行數上限，超過時在本機排隊等待，避免同時湧入的請求壓垮上游。
+並行數的計數在模組載入時（gunicorn preload_app 的 fork 之前）建立於共享記憶體，
+多個 worker 合計不超過上限，而不是每個 worker 各自一份。
+"""
+
+import os
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from shared_counters import SharedCounters
+
+# 各上游預設策略（可用環境變數 HTTP_POOL_SIZE_<名稱>、HTTP_RETRIES_<名稱>、HTTP_BACKOFF_<名稱> 覆寫）
+# retry_methods 為允許在 5xx 狀態碼或讀取錯誤時重送的方法；連線失敗則一律可重試
+# max_concurrency 為同時送往該上游的請求上限（0 為不限制，可用 UPSTREAM_MAX_CONCURRENCY_<名稱> 覆寫）
+UPSTREAM_POLICIES = {
+    'stt': {'pool_size': 10, 'retries': 1, 'backoff': 0.5, 'retry_methods': ['GET'], 'max_concurrency': 4},
+    'ollama': {'pool_size': 10, 'retries': 1, 'backoff': 0.5, 'retry_methods': ['GET'], 'max_concurrency': 4},
+    'ithuan': {'pool_size': 10, 'retries': 2, 'backoff': 0.3, 'retry_methods': ['GET', 'POST'], 'max_concurrency': 0},
+    'tts': {'pool_size': 10, 'retries': 1, 'backoff': 0.5, 'retry_methods': ['GET'], 'max_concurrency': 4},
+}
+RETRY_STATUS_CODES = (502, 503, 504)
+# 等待上游並行名額的最長秒數，逾時視同連線失敗
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', '30'))
+
+_sessions = {}
+_request_counts = {}
+_lock = threading.Lock()
+# 各上游跨 worker 共用的處理中請求數（fork 之後重建的 Session 沿用同一組計數）
+_shared_slots = {upstream: SharedCounters(('active',)) for upstream in UPSTREAM_POLICIES}
+
+
+def upstream_policy(upstream):
+    """取得上游的連線池、重試與退避設定（已套用環境變數覆寫）"""
+    policy = dict(UPSTREAM_POLICIES.get(upstream, UPSTREAM_POLICIES['stt']))
+    key = upstream.upper()
+    policy['pool_size'] = int(os.getenv(f'HTTP_POOL_SIZE_{key}', os.getenv('HTTP_POOL_SIZE', policy['pool_size'])))
+    policy['retries'] = int(os.getenv(f'HTTP_RETRIES_{key}', policy['retries']))
+    policy['backoff'] = float(os.getenv(f'HTTP_BACKOFF_{key}', policy['backoff']))
+    policy['max_concurrency'] = int(os.getenv(f'UPSTREAM_MAX_CONCURRENCY_{key}', policy['max_concurrency']))
+    return policy
+
+
+class UpstreamBusy(requests.exceptions.ConnectionError):
+    """等待上游並行名額逾時"""
+
+
+class LimitedSession(requests.Session):
+    """
+    限制同時送往上游請求數的 Session
+    一般請求在收到完整回應後釋放名額；stream=True 的請求保留名額直到 response.close()
+    slots 為跨 worker 共用的計數（SharedCounters），未指定時只在本行程內限制
+    """
+
+    def __init__(self, upstream, max_concurrency, queue_timeout=UPSTREAM_QUEUE_TIMEOUT, slots=None):
+        super().__init__()
+        self.upstream = upstream
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._slots = None
+        if max_concurrency:
+            self._slots = slots or SharedCounters(('active',), shared=False)
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.busy_rejections = 0
+        self.total_wait = 0.0
+        self.admitted = 0
+
+    def _acquire(self):
+        start = time.time()
+        acquired = False
+        with self._cond:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            while True:
+                with self._slots.lock:
+                    if self._slots.get('active') < self.max_concurrency:
+                        self._slots.add('active', 1)
+                        acquired = True
+                        break
+                remaining = self.queue_timeout - (time.time() - start)
+                if remaining <= 0:
+                    break
+                self._cond.wait(self._slots.wait_timeout(remaining))
+            self.waiting -= 1
+            if not acquired:
+                self.busy_rejections += 1
+                raise UpstreamBusy(f"上游 {self.upstream} 忙碌中（等待超過 {self.queue_timeout:g} 秒）")
+            self.active += 1
+            self.admitted += 1
+            self.total_wait += time.time() - start
+
+    def _release(self):
+        with self._cond:
+            self.active -= 1
+            with self._slots.lock:
+                self._slots.add('active', -1)
+            self._cond.notify()
+
+    def request(self, method, url, *args, **kwargs):
+        if self._slots is None:
+            return super().request(method, url, *args, **kwargs)
+
+        self._acquire()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        if not kwargs.get('stream'):
+            self._release()
+            return response
+
+        # 串流回應：上游仍在產生內容，名額保留到呼叫端關閉回應為止
+        original_close = response.close
+        released = []
+
+        def close():
+            try:
+                original_close()
+            finally:
+                if not released:
+                    released.append(True)
+                    self._release()
+        response.close = close
+        return response
+
+    def limit_stats(self):
+        with self._cond:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'active': self.active,
+                'active_all_workers': self._slots.get('active') if self._slots else self.active,
+                'waiting': self.waiting,
+                'peak_waiting': self.peak_waiting,
+                'busy_rejections': self.busy_rejections,
+                'avg_wait': (self.total_wait / self.admitted) if self.admitted else 0.0,
+            }
+
+
+def _create_session(upstream):
+    policy = upstream_policy(upstream)
+    retry = Retry(
+        total=policy['retries'],
+        connect=policy['retries'],
+        read=policy['retries'],
+        status=policy['retries'],
+        backoff_factor=policy['backoff'],
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(policy['retry_methods']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=policy['pool_size'],
+        max_retries=retry,
+    )
+    session = LimitedSession(upstream, policy['max_concurrency'], slots=_shared_slots.get(upstream))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': 'TaiwaneseVoiceChat/1.0'})
+
+    def count_request(response, *args, **kwargs):
+        with _lock:
+            _request_counts[upstream] = _request_counts.get(upstream, 0) + 1
+    session.hooks['response'].append(count_request)
+    return session
+
+
+def get_session(upstream):
+    """取得指定上游的共用 Session（第一次使用時建立）"""
+    session = _sessions.get(upstream)
+    if session is None:
+        with _lock:
+            session = _sessions.get(upstream)
+            if session is None:
+                session = _create_session(upstream)
+                _sessions[upstream] = session
+    return session
+
+
+def reset_sessions():
+    """關閉並丟棄所有 Session（例如 fork 之後，子行程不應沿用父行程的連線）"""
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+        _request_counts.clear()
+    for session in sessions:
+        try:
+            session.close()
+        except Exception:
+            pass
+
+
+def reclaim_shared_slots(pid):
+    """扣回已結束 worker 仍佔用的上游名額，返回 {上游: 扣回數量}"""
+    reclaimed = {}
+    for upstream, slots in _shared_slots.items():
+        held = slots.reclaim(pid).get('active')
+        if held:
+            reclaimed[upstream] = held
+    return reclaimed
+
+
+def _pool_counters(session):
+    """加總 Session 內各連線池的 (新建連線數, 請求數)"""
+    connections = 0
+    requests_sent = 0
+    for adapter in set(session.adapters.values()):
+        pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+        if pools is None:
+            continue
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            connections += getattr(pool, 'num_connections', 0)
+            requests_sent += getattr(pool, 'num_requests', 0)
+    return connections, requests_sent
+
+
+def get_http_client_stats():
+    """返回各上游的連線重用統計"""
+    stats = {}
+    with _lock:
+        items = list(_sessions.items())
+        counts = dict(_request_counts)
+    for upstream, session in items:
+        connections, requests_sent = _pool_counters(session)
+        policy = upstream_policy(upstream)
+        stats[upstream] = {
+            'responses': counts.get(upstream, 0),
+            'requests_sent': requests_sent,
+            'connections_opened': connections,
+            'connection_reuse_rate': (1 - connections / requests_sent) if requests_sent else 0.0,
+            'pool_size': policy['pool_size'],
+            'retries': policy['retries'],
+            'concurrency': session.limit_stats(),
+        }
+    return stats
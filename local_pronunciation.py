@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地台語標音引擎
+載入 漢字→台羅 詞庫到字典樹（trie），以最長匹配法分詞標音，
+返回與意傳標音 API 相同格式的 (羅馬拼音, 分詞, kiatko)；
+遇到詞庫外的字則返回 None，由呼叫端改用意傳 API。
+"""
+
+import os
+import threading
+import unicodedata
+
+# 字典樹節點中代表「詞尾」的鍵（不會與任何漢字衝突）
+_TERMINAL = '\0'
+
+# 標點轉換：斷句類轉為 RomanizationConverter 認得的符號，其餘引號括號直接略過
+_PUNCT_MAP = {
+    '。': '.', '！': '!', '？': '?', '.': '.', '!': '!', '?': '?',
+    '，': ',', ',': ',', '、': ',', '；': ',', ';': ',', '：': ',', ':': ',',
+    '…': '.', '～': ',', '~': ',',
+}
+
+
+class LexiconTrie:
+    """以巢狀 dict 實作的字典樹"""
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def insert(self, word, reading):
+        node = self.root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        if _TERMINAL not in node:
+            self.size += 1
+        node[_TERMINAL] = reading
+
+    def longest_match(self, text, start):
+        """從 start 開始找最長的詞，返回 (結束位置, 讀音)，找不到返回 None"""
+        node = self.root
+        best = None
+        i = start
+        while i < len(text):
+            node = node.get(text[i])
+            if node is None:
+                break
+            i += 1
+            if _TERMINAL in node:
+                best = (i, node[_TERMINAL])
+        return best
+
+
+class LocalPronunciationEngine:
+    """本地詞庫標音引擎"""
+
+    def __init__(self, lexicon_paths=None, learned_path=None):
+        self.trie = LexiconTrie()
+        self.learned_path = learned_path
+        self._lock = threading.Lock()
+
+        # 統計
+        self.hits = 0
+        self.oov = 0
+
+        for path in lexicon_paths or []:
+            self.load(path)
+        if learned_path and os.path.exists(learned_path):
+            self.load(learned_path)
+
+    def load(self, path):
+        """載入 TSV 詞庫（每行: 漢字<TAB>台羅，# 開頭為註解）"""
+        if not os.path.exists(path):
+            print(f"⚠️ 詞庫不存在，跳過: {path}")
+            return 0
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                parts = line.split('\t')
+                if len(parts) < 2 or not parts[0] or not parts[1]:
+                    continue
+                self.trie.insert(unicodedata.normalize('NFC', parts[0]),
+                                 unicodedata.normalize('NFC', parts[1].strip()))
+                count += 1
+        print(f"本地詞庫已載入: {path} ({count} 筆)")
+        return count
+
+    def lookup(self, text):
+        """
+        以最長匹配法標音，返回 (羅馬拼音, 分詞, kiatko)；
+        含詞庫外文字時返回 None。
+        """
+        text = unicodedata.normalize('NFC', text.strip())
+        if not text:
+            return None
+
+        kiatko = []
+        i = 0
+        while i < len(text):
+            ch = text[i]
+            if ch.isspace():
+                i += 1
+                continue
+
+            match = self.trie.longest_match(text, i)
+            if match:
+                end, reading = match
+                kiatko.append({'漢字': text[i:end], 'KIP': reading})
+                i = end
+                continue
+
+            if ch in _PUNCT_MAP:
+                kiatko.append({'漢字': ch, 'KIP': _PUNCT_MAP[ch]})
+                i += 1
+                continue
+            if unicodedata.category(ch).startswith('P'):
+                i += 1
+                continue
+
+            # 詞庫外文字
+            with self._lock:
+                self.oov += 1
+            return None
+
+        if not kiatko:
+            return None
+
+        with self._lock:
+            self.hits += 1
+        romanization = ' '.join(item['KIP'] for item in kiatko)
+        segmented = ' '.join(item['漢字'] for item in kiatko)
+        return romanization, segmented, kiatko
+
+    def learn(self, kiatko):
+        """從意傳 API 的 kiatko 結果學習新詞（並寫入學習詞庫檔）"""
+        new_entries = []
+        with self._lock:
+            for item in kiatko or []:
+                word = unicodedata.normalize('NFC', str(item.get('漢字', '')).strip())
+                reading = unicodedata.normalize('NFC', str(item.get('KIP', '')).strip())
+                if not word or not reading or any(c.isspace() or c in _PUNCT_MAP for c in word):
+                    continue
+                if self.trie.longest_match(word, 0) == (len(word), reading):
+                    continue
+                self.trie.insert(word, reading)
+                new_entries.append((word, reading))
+
+        if new_entries and self.learned_path:
+            try:
+                os.makedirs(os.path.dirname(self.learned_path) or '.', exist_ok=True)
+                with open(self.learned_path, 'a', encoding='utf-8') as f:
+                    for word, reading in new_entries:
+                        f.write(f"{word}\t{reading}\n")
+            except Exception as e:
+                print(f"寫入學習詞庫失敗: {e}")
+        return len(new_entries)
+
+    def stats(self):
+        """返回引擎統計資訊"""
+        with self._lock:
+            return {
+                'entries': self.trie.size,
+                'hits': self.hits,
+                'oov': self.oov,
+            }
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ChatHistory → 分輪儲存（ChatSessions + ChatTurns）遷移工具
+將既有的 ChatHistory 文件拆成一份摘要與每輪一份文件，原始的 ChatHistory 不會被修改或刪除。
+
+輪次編號：開場白等第一句使用者發言之前的訊息為第 0 輪；每句使用者發言開始新的一輪，
+最後一輪的編號等於摘要的 turn，之後新增的對話可接續編號。
+所有寫入皆為 upsert（$setOnInsert / $max），中斷後可直接重新執行，已遷移的資料不會重複。
+
+用法:
+    python migrate_chat_history.py --dry-run
+    python migrate_chat_history.py --uri mongodb://localhost:27017 --database taiwanese_learning
+    python migrate_chat_history.py --verify
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from chat_history_store import ChatTurnStore
+
+
+def split_turns(history, summary_turn):
+    """把 history 陣列依使用者發言分組，返回 [(輪次, messages), ...]"""
+    groups = []
+    opening = []
+    for entry in history or []:
+        if entry.get('role') == 'user' or groups:
+            if entry.get('role') == 'user':
+                groups.append([])
+            groups[-1].append(entry)
+        else:
+            opening.append(entry)
+
+    # BackEnd 建立對話時 turn 從 1 開始，輪數可能大於使用者發言數；以位移讓最後一輪對齊摘要的 turn
+    offset = max(summary_turn - len(groups), 0)
+    turns = [(0, opening)] if opening else []
+    turns.extend((offset + i, messages) for i, messages in enumerate(groups, start=1))
+    return turns
+
+
+def migrate_document(doc):
+    """單一 ChatHistory 文件 → (摘要操作, 單輪操作列表)"""
+    history = doc.get('history') or []
+    turns = split_turns(history, doc.get('turn', 0) or 0)
+    last_turn = max([turn for turn, _ in turns] + [doc.get('turn', 0) or 0])
+
+    timestamps = [entry['ts'] for entry in history if entry.get('ts')]
+    created_at = doc.get('createdAt') or (min(timestamps) if timestamps else None)
+    updated_at = doc.get('updatedAt') or (max(timestamps) if timestamps else created_at)
+
+    summary = {
+        "userId": doc.get('userId'),
+        "chatChooseId": doc.get('chatChooseId'),
+        "title": doc.get('title'),
+        "score": doc.get('score', 0),
+        "createdAt": created_at,
+    }
+    progress = {"turn": last_turn, "finished": bool(doc.get('finished', False))}
+    if updated_at is not None:
+        progress["updatedAt"] = updated_at
+    session_op = UpdateOne(
+        {"session_id": doc['session_id']},
+        {"$setOnInsert": summary, "$max": progress},
+        upsert=True
+    )
+    turn_ops = [
+        UpdateOne(
+            {"session_id": doc['session_id'], "turn": turn},
+            {"$setOnInsert": {"messages": messages, "ts": messages[0].get('ts')}},
+            upsert=True
+        )
+        for turn, messages in turns if messages
+    ]
+    return session_op, turn_ops
+
+
+def bulk_upsert(collection, operations):
+    """無序批次 upsert；並行執行時的重複鍵錯誤（已遷移）可略過"""
+    if not operations:
+        return 0
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        return result.upserted_count
+    except BulkWriteError as e:
+        if any(error.get('code') != ChatTurnStore.DUPLICATE_KEY for error in e.details.get('writeErrors', [])):
+            raise
+        return e.details.get('nUpserted', 0)
+
+
+def migrate(db, store, batch_size=200, dry_run=False, limit=0):
+    source = db.ChatHistory
+    cursor = source.find({"session_id": {"$exists": True}}, batch_size=batch_size)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    sessions = turns = new_sessions = new_turns = 0
+    session_ops, turn_ops = [], []
+    start = time.time()
+
+    def flush():
+        nonlocal new_sessions, new_turns
+        if not dry_run:
+            new_turns += bulk_upsert(store.turns, turn_ops)
+            # 先寫入各輪再寫入摘要：中斷時摘要不會指向尚未存在的輪次
+            new_sessions += bulk_upsert(store.sessions, session_ops)
+        session_ops.clear()
+        turn_ops.clear()
+
+    for doc in cursor:
+        session_op, ops = migrate_document(doc)
+        session_ops.append(session_op)
+        turn_ops.extend(ops)
+        sessions += 1
+        turns += len(ops)
+        if len(session_ops) >= batch_size:
+            flush()
+            print(f"  已處理 {sessions} 個對話、{turns} 輪（{time.time() - start:.1f}s）")
+    flush()
+
+    action = "預計遷移" if dry_run else "遷移完成"
+    print(f"✅ {action}: {sessions} 個對話、{turns} 輪"
+          + ("" if dry_run else f"（新增摘要 {new_sessions}、新增輪次 {new_turns}）")
+          + f"，耗時 {time.time() - start:.1f}s")
+    return sessions, turns
+
+
+def verify(db, store, limit=0):
+    """逐一比對 ChatHistory 與分輪儲存組回的 history，返回不一致的 session 數"""
+    mismatched = checked = 0
+    cursor = db.ChatHistory.find({"session_id": {"$exists": True}}, {"session_id": 1, "history": 1})
+    if limit:
+        cursor = cursor.limit(limit)
+    for doc in cursor:
+        checked += 1
+        migrated = store.get_session(doc['session_id'])
+        expected = [(entry.get('role'), entry.get('text')) for entry in doc.get('history') or []]
+        actual = [(entry.get('role'), entry.get('text')) for entry in (migrated or {}).get('history', [])]
+        # 遷移後新增的輪次只存在於分輪儲存，比對原有的前段即可
+        if migrated is None or actual[:len(expected)] != expected:
+            mismatched += 1
+            print(f"❌ 不一致: session_id={doc['session_id']}")
+    print(f"{'✅' if mismatched == 0 else '⚠️'} 已比對 {checked} 個對話，不一致 {mismatched} 個")
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ChatHistory 遷移至 ChatSessions + ChatTurns')
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default=os.getenv('DATABASE_NAME', 'taiwanese_learning'))
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=0, help='只處理前 N 個對話（0 表示全部）')
+    parser.add_argument('--dry-run', action='store_true', help='只統計，不寫入')
+    parser.add_argument('--verify', action='store_true', help='比對遷移結果')
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+    client.admin.command('ping')
+    db = client[args.database]
+    # 遷移不涉及輪數上限，上限只影響之後的寫入
+    store = ChatTurnStore(db, max_turns=0)
+
+    try:
+        if args.verify:
+            return 1 if verify(db, store, args.limit) else 0
+        if not args.dry_run and not store.ensure_indexes():
+            return 1
+        migrate(db, store, batch_size=args.batch_size, dry_run=args.dry_run, limit=args.limit)
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ollama 微批次排程模組
+同一時間湧入的短提示詞先在短暫視窗內收集成一批，同批中完全相同的請求只送出一次，
+再以固定的並行數送往 /api/generate，讓 Ollama 的平行槽（OLLAMA_NUM_PARALLEL）保持滿載而不超量；
+每個呼叫端透過 Future 取得自己的結果。請求一律帶 keep_alive，讓模型常駐記憶體。
+呼叫端等待逾時即取消自己的 Future；送出前會略過已全數取消的請求，不再佔用 Ollama 的平行槽。
+"""
+
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from http_clients import get_session
+
+
+class OllamaBatchScheduler:
+    """收集並行提示詞、合併重複請求並以固定並行數呼叫 Ollama"""
+
+    def __init__(self, base_url, model, window_ms=20, max_batch=16, parallel=4,
+                 keep_alive='30m', timeout=30):
+        self.base_url = base_url
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.parallel = parallel
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='ollama-batch')
+        self._dispatcher = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        # 統計
+        self.submitted = 0
+        self.sent = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.batched = 0
+        self.max_batch_seen = 0
+        self.failures = 0
+        self.cancelled = 0  # 呼叫端已逾時、送出前略過的請求數
+
+    def _ensure_started(self):
+        # 背景執行緒在第一次使用時才啟動（pre-fork 部署時由各 worker 自己啟動）
+        if self._dispatcher is None:
+            with self._start_lock:
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(target=self._dispatch_loop, name='ollama-dispatch', daemon=True)
+                    self._dispatcher.start()
+
+    def submit(self, prompt, **extra):
+        """送出提示詞，返回 Future（結果為 Ollama 回應的 dict）；extra 為額外的請求欄位（如 context、options）"""
+        future = Future()
+        with self._stats_lock:
+            self.submitted += 1
+        self._ensure_started()
+        self._queue.put((prompt, extra, future))
+        return future
+
+    def generate(self, prompt, timeout=None, **extra):
+        """
+        同步呼叫：等待並返回 Ollama 回應的 dict，失敗時拋出例外
+        等待時間包含在批次視窗與執行緒池中排隊的時間；逾時後取消請求，尚未送出的就不會再送往 Ollama
+        """
+        future = self.submit(prompt, **extra)
+        try:
+            return future.result(timeout=timeout or self.timeout + 5)
+        except FutureTimeoutError:
+            future.cancel()  # 已送出的請求無法取消，結果直接丟棄
+            raise
+
+    def _collect_batch(self):
+        """阻塞等待第一個請求，再於視窗時間內收集後續請求"""
+        batch = [self._queue.get()]
+        deadline = time.time() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._collect_batch()
+
+            # 合併完全相同的請求（同一提示詞與參數只送一次）
+            groups = {}
+            for prompt, extra, future in batch:
+                key = (prompt, json.dumps(extra, sort_keys=True, ensure_ascii=False))
+                groups.setdefault(key, (prompt, extra, []))[2].append(future)
+
+            with self._stats_lock:
+                self.batches += 1
+                self.batched += len(batch)
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+                self.deduplicated += len(batch) - len(groups)
+
+            # 執行緒池大小即並行上限，多出的請求在池中排隊，平行槽不會被塞爆
+            for prompt, extra, futures in groups.values():
+                self._executor.submit(self._run, prompt, extra, futures)
+
+    def _payload(self, prompt, extra):
+        payload = {'model': self.model, 'prompt': prompt, 'stream': False, 'keep_alive': self.keep_alive}
+        payload.update(extra)
+        return payload
+
+    def _run(self, prompt, extra, futures):
+        # 呼叫端已逾時取消的不再等待結果；全部取消時不送出
+        live = [future for future in futures if future.set_running_or_notify_cancel()]
+        if len(live) < len(futures):
+            with self._stats_lock:
+                self.cancelled += len(futures) - len(live)
+        if not live:
+            return
+        futures = live
+        try:
+            response = get_session('ollama').post(
+                f"{self.base_url}/api/generate",
+                json=self._payload(prompt, extra),
+                timeout=self.timeout
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama API 失敗: {response.status_code}")
+            result = response.json()
+        except Exception as e:
+            with self._stats_lock:
+                self.sent += 1
+                self.failures += 1
+            for future in futures:
+                future.set_exception(e)
+            return
+        with self._stats_lock:
+            self.sent += 1
+        for future in futures:
+            future.set_result(result)
+
+    def warm_up(self):
+        """以空提示詞載入模型（Ollama 只載入模型、不產生內容），失敗時返回 False"""
+        try:
+            response = get_session('ollama').post(
+                f"{self.base_url}/api/generate",
+                json={'model': self.model, 'keep_alive': self.keep_alive},
+                timeout=120
+            )
+            return response.status_code == 200
+        except Exception as e:
+            print(f"Ollama 模型預熱失敗: {e}")
+            return False
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'submitted': self.submitted,
+                'sent': self.sent,
+                'deduplicated': self.deduplicated,
+                'batches': self.batches,
+                'avg_batch_size': (self.batched / self.batches) if self.batches else 0.0,
+                'max_batch_size': self.max_batch_seen,
+                'failures': self.failures,
+                'cancelled': self.cancelled,
+                'pending': self._queue.qsize(),
+                'parallel': self.parallel,
+                'window_ms': self.window * 1000,
+                'keep_alive': self.keep_alive,
+            }
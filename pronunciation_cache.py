@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+台語標音快取模組
+以 taibun 原文為鍵，快取 (羅馬拼音, 分詞, kiatko) 結果：
+- 第一層：行程內 LRU
+- 第二層（可選）：SQLite 或 MongoDB 持久化
+並將同時間相同文字的查詢合併為單一上游請求。
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class SqlitePronunciationStore:
+    """以 SQLite 檔案保存標音結果"""
+
+    def __init__(self, db_path='pronunciation_cache.sqlite3'):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pronunciation ("
+            "taibun TEXT PRIMARY KEY, romanization TEXT, segmented TEXT, "
+            "kiatko TEXT, updated_at REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, text):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT romanization, segmented, kiatko FROM pronunciation WHERE taibun = ?",
+                (text,)
+            ).fetchone()
+        if not row:
+            return None
+        return row[0], row[1], json.loads(row[2] or '[]')
+
+    def put(self, text, result):
+        romanization, segmented, kiatko = result
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pronunciation VALUES (?, ?, ?, ?, ?)",
+                (text, romanization, segmented, json.dumps(kiatko, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+
+class MongoPronunciationStore:
+    """以 MongoDB collection 保存標音結果（_id 即 taibun 原文）"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, text):
+        doc = self.collection.find_one({"_id": text})
+        if not doc:
+            return None
+        return doc.get('romanization', text), doc.get('segmented', text), doc.get('kiatko', [])
+
+    def put(self, text, result):
+        romanization, segmented, kiatko = result
+        self.collection.update_one(
+            {"_id": text},
+            {"$set": {
+                "romanization": romanization,
+                "segmented": segmented,
+                "kiatko": kiatko,
+                "updated_at": time.time()
+            }},
+            upsert=True
+        )
+
+
+class PronunciationCache:
+    """標音結果快取（LRU + 可選持久層 + 請求合併）"""
+
+    def __init__(self, max_entries=4096, store=None):
+        self.max_entries = max_entries
+        self.store = store
+
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        # 統計
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _remember_locked(self, text, result):
+        self._entries[text] = result
+        self._entries.move_to_end(text)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, text):
+        """查詢快取（記憶體 → 持久層），未命中返回 None"""
+        with self._lock:
+            result = self._entries.get(text)
+            if result is not None:
+                self._entries.move_to_end(text)
+                self.memory_hits += 1
+                return result
+
+        if self.store:
+            try:
+                result = self.store.get(text)
+            except Exception as e:
+                print(f"標音持久快取讀取失敗: {e}")
+                result = None
+            if result is not None:
+                with self._lock:
+                    self._remember_locked(text, result)
+                    self.store_hits += 1
+                return result
+        return None
+
+    def put(self, text, result):
+        """寫入快取（記憶體與持久層）"""
+        with self._lock:
+            self._remember_locked(text, result)
+        if self.store:
+            try:
+                self.store.put(text, result)
+            except Exception as e:
+                print(f"標音持久快取寫入失敗: {e}")
+
+    def get_or_fetch(self, text, fetch_func, timeout=None):
+        """
+        查詢快取，未命中時呼叫 fetch_func(text) 取得結果；
+        同時間相同文字只會有一個請求送往上游，其餘請求等待其結果。
+
+        fetch_func 失敗時應返回 None，失敗結果不會被快取。
+        """
+        result = self.get(text)
+        if result is not None:
+            return result
+
+        with self._lock:
+            future = self._inflight.get(text)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[text] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            try:
+                return future.result(timeout=timeout)
+            except Exception:
+                return None
+
+        try:
+            result = fetch_func(text)
+            if result is not None:
+                self.put(text, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_result(None)
+            print(f"標音查詢失敗: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(text, None)
+
+    def prewarm(self, texts, fetch_func, max_workers=4):
+        """批次預先載入詞彙表的標音結果，返回統計摘要"""
+        unique_texts = list(dict.fromkeys(t.strip() for t in texts if t and t.strip()))
+        pending = [t for t in unique_texts if self.get(t) is None]
+
+        start = time.time()
+        failed = []
+        if pending:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = executor.map(lambda t: (t, self.get_or_fetch(t, fetch_func)), pending)
+                for t, result in results:
+                    if result is None:
+                        failed.append(t)
+
+        return {
+            'requested': len(unique_texts),
+            'already_cached': len(unique_texts) - len(pending),
+            'fetched': len(pending) - len(failed),
+            'failed': failed,
+            'elapsed': time.time() - start,
+        }
+
+    def stats(self):
+        """返回快取統計資訊"""
+        with self._lock:
+            lookups = self.memory_hits + self.store_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'memory_hits': self.memory_hits,
+                'store_hits': self.store_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': ((self.memory_hits + self.store_hits) / lookups) if lookups else 0.0,
+                'store': type(self.store).__name__ if self.store else None,
+            }
@@ -7,9 +7,18 @@
 
 import os
 import time
+import uuid
 import requests
 import re
 from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import wav_utils
+from audio_decoder import decode_audio_bytes
+from tts_audio_cache import TtsAudioCache
+from http_clients import get_session
 
 # 載入 .env 檔案以確保環境變數可用
 try:
@@ -19,6 +28,29 @@ except ImportError:
     # 如果沒安裝 python-dotenv，繼續執行（但可能無法讀取 .env）
     pass
 
+class SpeechStream:
+    """
+    串流合成音訊的可迭代物件
+    close() 一定會關閉上游回應（釋放連線與 TTS 並行名額），即使從未開始迭代
+    （HEAD 請求、用戶端在第一個區塊前斷線）也一樣
+    """
+
+    def __init__(self, chunks, response=None):
+        self._chunks = chunks
+        self._response = response
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        try:
+            self._chunks.close()
+        finally:
+            if self._response is not None:
+                self._response.close()
+                self._response = None
+
+
 class RemoteTtsService:
     """遠端 TTS 服務類別"""
     
@@ -42,7 +74,63 @@ class RemoteTtsService:
             self.timeout = 45  # 預設45秒，因為要等標音轉換
             print(f"使用預設TTS超時設定: {self.timeout}秒")
         except Exception:
-            self.micro_split_s = 0.2
+            self.timeout = 45
+
+        # 長尾音微調與微分段設定（預設關閉：開啟後合成結果與快取鍵都會改變，既有的 TTS 快取不再命中）
+        self.fix_long_final = os.getenv('TTS_FIX_LONG_FINAL', 'false').lower() == 'true'
+        self.enable_micro_split = os.getenv('TTS_MICRO_SPLIT', 'false').lower() == 'true'
+        self.micro_split_s = float(os.getenv('TTS_MICRO_SPLIT_SECONDS', '0.2'))
+
+        # 分段合成共用的執行緒池與輸出格式（各段在記憶體中統一為此採樣率後合併）
+        self.max_concurrency = int(os.getenv('TTS_MAX_CONCURRENCY', '4'))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='tts')
+        self.output_sample_rate = 44100
+        self._silence_buffers = {}
+        # 分段合成：每段音節上限與段落之間的停頓
+        self.chunk_max_syllables = int(os.getenv('TTS_CHUNK_MAX_SYLLABLES', '40'))
+        self.chunk_gap_s = float(os.getenv('TTS_CHUNK_GAP_SECONDS', '0.2'))
+        self._silence(self.micro_split_s)  # 預先建立微分段用的無聲緩衝
+
+        # 初始化音檔快取（相同文字與語音參數直接返回已合成的音檔）
+        self.audio_cache = None
+        if os.getenv('TTS_CACHE_ENABLED', 'true').lower() == 'true':
+            try:
+                self.audio_cache = TtsAudioCache(
+                    cache_dir=os.getenv('TTS_CACHE_DIR', 'static/tts_cache'),
+                    max_bytes=int(float(os.getenv('TTS_CACHE_MAX_MB', '500')) * 1024 * 1024),
+                    max_age_seconds=int(float(os.getenv('TTS_CACHE_MAX_AGE_DAYS', '30')) * 24 * 3600),
+                )
+            except Exception as e:
+                print(f"TTS快取初始化失敗，停用快取: {e}")
+                self.audio_cache = None
+
+    def _voice_params(self):
+        """影響合成結果的語音參數（用於快取鍵）"""
+        return {
+            'host': f"{self.remote_host}:{self.remote_port}",
+            'endpoint': self.endpoint,
+            'voice': os.getenv('TTS_VOICE', 'default'),
+        }
+
+    def lookup_cached(self, text):
+        """以（已正規化的）數字調文字查詢音檔快取，返回 (快取鍵, 音檔路徑或 None)"""
+        if not self.audio_cache:
+            return None, None
+        cache_key = self.audio_cache.make_key(text, self._voice_params())
+        return cache_key, self.audio_cache.get(cache_key)
+
+    def store_audio(self, cache_key, content, text):
+        """保存合成結果：可快取時寫入快取，否則存為 static 下的一般音檔，返回路徑"""
+        audio_file = None
+        if cache_key:
+            audio_file = self.audio_cache.put(cache_key, content)
+        if not audio_file:
+            audio_file = self._save_audio_file(content, text)
+        return audio_file
+
+    def normalize_text(self, text):
+        """送入 TTS 前的數字調文字正規化（公開介面）"""
+        return self._normalize_for_tts(text)
 
     def _normalize_for_tts(self, text: str) -> str:
         """對送入TTS的數字調字串做微調，避免已知的拉長問題"""
@@ -73,52 +161,44 @@ class RemoteTtsService:
                     return path
         return 'ffmpeg'
 
-    def _convert_to_wav(self, input_path, target_sample_rate=44100):
-        try:
-            ffmpeg = self._get_ffmpeg_path()
-            base = os.path.splitext(os.path.basename(input_path))[0]
-            out_dir = 'static'
-            os.makedirs(out_dir, exist_ok=True)
-            out_path = os.path.join(out_dir, f"{base}_conv.wav")
-            cmd = [ffmpeg, '-y', '-i', input_path, '-ac', '1', '-ar', str(target_sample_rate), '-sample_fmt', 's16', out_path]
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            return out_path
-        except Exception as e:
-            print(f"轉換為 WAV 失敗: {e}")
-            return None
+    # ===== in-memory PCM helpers =====
+    def _silence(self, duration_seconds):
+        """取得（並快取）指定長度的無聲 PCM 緩衝，重複使用不再另行產生"""
+        key = round(duration_seconds, 3)
+        buf = self._silence_buffers.get(key)
+        if buf is None:
+            buf = np.zeros(int(self.output_sample_rate * duration_seconds), dtype=np.int16)
+            buf.setflags(write=False)
+            self._silence_buffers[key] = buf
+        return buf
 
-    def _generate_silence_wav(self, duration_seconds):
-        try:
-            ffmpeg = self._get_ffmpeg_path()
-            out_dir = 'static'
-            os.makedirs(out_dir, exist_ok=True)
-            silence_path = os.path.join(out_dir, f"silence_{duration_seconds}s_{int(time.time()*1000)}.wav")
-            cmd = [ffmpeg, '-y', '-f', 'lavfi', '-i', f'anullsrc=r=44100:cl=mono', '-t', str(duration_seconds), '-ac', '1', '-ar', '44100', '-c:a', 'pcm_s16le', silence_path]
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            return silence_path
-        except Exception as e:
-            print(f"生成無聲音檔失敗: {e}")
-            return None
+    def _load_pcm(self, audio_path):
+        """讀取合成結果並在記憶體中轉為 output_sample_rate 單聲道 int16 PCM"""
+        with open(audio_path, 'rb') as f:
+            data = f.read()
+        return decode_audio_bytes(data, target_rate=self.output_sample_rate, ffmpeg_path=self._get_ffmpeg_path())
 
-    def _concat_wavs(self, paths, out_path):
-        try:
-            ffmpeg = self._get_ffmpeg_path()
-            list_path = os.path.join('static', f"concat_{int(time.time()*1000)}.txt")
-            with open(list_path, 'w', encoding='utf-8') as f:
-                for p in paths:
-                    if p:
-                        abs_path = os.path.abspath(p).replace('\\', '/')
-                        f.write(f"file '{abs_path}'\n")
-            cmd = [ffmpeg, '-y', '-f', 'concat', '-safe', '0', '-i', list_path, '-ac', '1', '-ar', '44100', '-c:a', 'pcm_s16le', out_path]
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            try:
-                os.remove(list_path)
-            except:
-                pass
-            return os.path.exists(out_path) and os.path.getsize(out_path) > 0
-        except Exception as e:
-            print(f"合併 WAV 失敗: {e}")
-            return False
+    def _join_pcm(self, parts, gap_seconds=0.0):
+        """依序合併 PCM 片段，片段之間插入 gap_seconds 無聲，返回 WAV 位元組"""
+        seq = []
+        gap = self._silence(gap_seconds) if gap_seconds > 0 else None
+        for i, pcm in enumerate(parts):
+            if i and gap is not None:
+                seq.append(gap)
+            seq.append(pcm)
+        return wav_utils.write_wav_bytes(np.concatenate(seq), self.output_sample_rate)
+
+    def _save_joined_audio(self, wav_bytes, prefix, cache_key=None):
+        """保存合併後的音檔（可快取時寫入快取），返回路徑"""
+        if cache_key and self.audio_cache:
+            path = self.audio_cache.put(cache_key, wav_bytes)
+            if path:
+                return path
+        os.makedirs('static', exist_ok=True)
+        out_path = f"static/{prefix}_{uuid.uuid4().hex}.wav"
+        with open(out_path, 'wb') as f:
+            f.write(wav_bytes)
+        return out_path
 
     # ===== mitigation: micro split for problematic finals =====
     def _needs_micro_split(self, text: str) -> bool:
@@ -137,7 +217,7 @@ class RemoteTtsService:
         return False
 
     def generate_speech_mitigated(self, text):
-        """對特定尾音（如 te5/te7）做微分段，避免長音。"""
+        """對特定尾音（如 te5/te7）做微分段，避免長音。各段同時合成，在記憶體中插入無聲後合併。"""
         try:
             text = self._normalize_for_tts(text)
             if not self._needs_micro_split(text):
@@ -148,34 +228,97 @@ class RemoteTtsService:
             last = toks[-1]
             print(f"啟用微分段合成: prefix='{prefix}', last='{last}', silence={self.micro_split_s}s")
 
-            parts = []
-            if prefix:
-                p_audio = self.generate_speech(prefix)
-                parts.append(p_audio)
-            l_audio = self.generate_speech(last)
-            parts.append(l_audio)
-
-            # 全轉 WAV 並插入無聲
-            wavs = []
-            for p in parts:
-                if p and os.path.exists(p):
-                    wavs.append(self._convert_to_wav(p) or p)
-            if not wavs:
+            cache_key = None
+            if self.audio_cache:
+                params = dict(self._voice_params(), mode='micro_split', silence=self.micro_split_s)
+                cache_key = self.audio_cache.make_key(text, params)
+                cached_file = self.audio_cache.get(cache_key)
+                if cached_file:
+                    return cached_file
+
+            # 前段與尾音同時合成
+            segments = [prefix, last] if prefix else [last]
+            futures = [self.executor.submit(self.generate_speech, seg) for seg in segments]
+            paths = [f.result() for f in futures]
+            pcms = [self._load_pcm(p) for p in paths if p and os.path.exists(p)]
+            if not pcms:
                 return None
-            seq = []
-            for i, w in enumerate(wavs):
-                seq.append(w)
-                if i < len(wavs) - 1 and self.micro_split_s > 0:
-                    sp = self._generate_silence_wav(self.micro_split_s)
-                    if sp:
-                        seq.append(sp)
-            out_path = os.path.join('static', f"mitigated_{int(time.time())}.wav")
-            ok = self._concat_wavs(seq, out_path)
-            return out_path if ok else (wavs[0] if wavs else None)
+            if len(pcms) == 1:
+                return next(p for p in paths if p and os.path.exists(p))
+
+            wav_bytes = self._join_pcm(pcms, self.micro_split_s)
+            return self._save_joined_audio(wav_bytes, 'mitigated', cache_key)
         except Exception as e:
             print(f"微分段合成失敗，改為一般合成: {e}")
             return self.generate_speech(text)
         
+    def _split_chunks(self, chunks):
+        """整理分段：字串在長停頓（連續空白）處切開，過長的段落再依音節數切開"""
+        if isinstance(chunks, str):
+            chunks = re.split(r'\s{2,}', chunks)
+        result = []
+        for chunk in chunks:
+            toks = chunk.split()
+            for i in range(0, len(toks), self.chunk_max_syllables):
+                result.append(' '.join(toks[i:i + self.chunk_max_syllables]))
+        return [c for c in result if c]
+
+    def generate_speech_chunked(self, chunks):
+        """
+        分段合成長回應：各段以有上限的並行數同時送往 /bangtsam（每段各自快取），
+        依原順序在記憶體中合併（段落之間插入短停頓），不需 ffmpeg
+
+        Args:
+            chunks (list | str): 數字調句子列表，或以長停頓（連續空白）分隔的數字調字串
+
+        Returns:
+            str: 合併後的音檔路徑，全部失敗時返回 None
+        """
+        start = time.time()
+        chunks = self._split_chunks(chunks)
+        if not chunks:
+            return None
+        if len(chunks) == 1:
+            return self.generate_speech(chunks[0])
+
+        full_text = ' '.join(chunks)
+        cache_key = None
+        if self.audio_cache:
+            params = dict(self._voice_params(), mode='chunked', gap=self.chunk_gap_s)
+            cache_key = self.audio_cache.make_key(self._normalize_for_tts(full_text), params)
+            cached_file = self.audio_cache.get(cache_key)
+            if cached_file:
+                print(f"分段TTS快取命中: {cached_file}")
+                return cached_file
+
+        print(f"分段TTS開始: {len(chunks)} 段，並行上限 {self.max_concurrency}")
+        futures = [self.executor.submit(self.generate_speech, chunk) for chunk in chunks]
+        paths = [f.result() for f in futures]
+
+        # 失敗的段落重試一次，仍失敗則略過，不影響其他段落
+        for i, path in enumerate(paths):
+            if not path:
+                print(f"　├─ 第 {i + 1} 段合成失敗，重試: '{chunks[i]}'")
+                paths[i] = self.generate_speech(chunks[i])
+
+        pcms = []
+        for i, path in enumerate(paths):
+            if not path:
+                print(f"　├─ 第 {i + 1} 段略過: '{chunks[i]}'")
+                continue
+            try:
+                pcms.append(self._load_pcm(path))
+            except Exception as e:
+                print(f"　├─ 第 {i + 1} 段音檔解碼失敗: {e}")
+        if not pcms:
+            return None
+
+        wav_bytes = self._join_pcm(pcms, self.chunk_gap_s)
+        # 有段落失敗時不寫入整段快取，下次重新合成
+        out_path = self._save_joined_audio(wav_bytes, 'chunked', cache_key if len(pcms) == len(chunks) else None)
+        print(f"分段TTS完成: {len(pcms)}/{len(chunks)} 段，總耗時: {time.time() - start:.3f}秒，音檔: {out_path}")
+        return out_path
+
     def generate_speech(self, text):
         """
         使用遠端TTS服務生成語音
@@ -194,6 +337,13 @@ class RemoteTtsService:
             text = self._normalize_for_tts(text)
             print(f"遠端TTS開始: '{text}'")
             
+            # 查詢音檔快取
+            cache_key, cached_file = self.lookup_cached(text)
+            if cached_file:
+                total_time = time.time() - total_start
+                print(f"遠端TTS快取命中，總耗時: {total_time:.3f}秒，音檔: {cached_file}")
+                return cached_file
+            
             # 組合API URL和參數
             params_start = time.time()
             params = {"taibun": text}
@@ -206,7 +356,7 @@ class RemoteTtsService:
             
             # 發送請求到遠端TTS服務
             request_start = time.time()
-            response = requests.get(
+            response = get_session('tts').get(
                 full_url, 
                 params=params, 
                 timeout=self.timeout,
@@ -242,7 +392,7 @@ class RemoteTtsService:
                 if is_audio:
                     # 儲存音檔
                     save_start = time.time()
-                    audio_file = self._save_audio_file(response.content, text)
+                    audio_file = self.store_audio(cache_key, response.content, text)
                     save_time = time.time() - save_start
                     
                     if audio_file:
@@ -274,6 +424,107 @@ class RemoteTtsService:
             
         return None
     
+    def open_speech_stream(self, text, chunk_size=8192):
+        """
+        以串流方式取得合成音訊：邊從 /bangtsam 接收邊交給呼叫端，不將整段回應留在記憶體中，
+        同時寫入暫存檔，完整接收後放入音檔快取
+
+        Args:
+            text (str): 要合成的文字（數字調格式）
+            chunk_size (int): 每次讀取的位元組數
+
+        Returns:
+            tuple: (SpeechStream, content_type)，失敗返回 None；使用完畢須呼叫 SpeechStream.close()
+        """
+        text = self._normalize_for_tts(text)
+        cache_key, cached_file = self.lookup_cached(text)
+        if cached_file:
+            print(f"串流TTS快取命中: {cached_file}")
+            return SpeechStream(self._iter_file(cached_file, chunk_size)), 'audio/wav'
+
+        try:
+            response = get_session('tts').get(
+                f"{self.base_url}{self.endpoint}",
+                params={"taibun": text},
+                timeout=self.timeout,
+                stream=True,
+                headers={
+                    'User-Agent': 'TaiwaneseVoiceChat/1.0',
+                    'Accept': 'audio/wav, audio/*, */*',
+                    'Accept-Language': 'zh-TW,zh;q=0.9,en;q=0.8'
+                }
+            )
+        except requests.exceptions.RequestException as e:
+            print(f"串流TTS連線錯誤: {e}")
+            return None
+
+        if response.status_code != 200:
+            print(f"串流TTS請求失敗，狀態碼: {response.status_code}")
+            response.close()
+            return None
+
+        # 先讀第一個區塊確認是音檔，才開始回應（開始串流後就無法再改狀態碼）
+        chunks = response.iter_content(chunk_size=chunk_size)
+        try:
+            first = next(chunks, b'')
+        except requests.exceptions.RequestException as e:
+            print(f"串流TTS讀取失敗: {e}")
+            response.close()
+            return None
+        content_type = response.headers.get('content-type', '').lower()
+        is_audio = 'audio' in content_type or first.startswith((b'RIFF', b'ID3', b'\xff\xfb'))
+        if not first or not is_audio:
+            print(f"串流TTS回應不是音檔格式: {first[:200].decode('utf-8', errors='ignore')}")
+            response.close()
+            return None
+
+        media_type = content_type if 'audio' in content_type else 'audio/wav'
+        return SpeechStream(self._tee_stream(response, first, chunks, cache_key), response), media_type
+
+    def _iter_file(self, path, chunk_size):
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    return
+                yield block
+
+    def _tee_stream(self, response, first, chunks, cache_key):
+        """轉送音訊區塊，並同時寫入快取暫存檔（中途中斷則丟棄暫存檔）"""
+        start = time.time()
+        tmp_path = self.audio_cache.temp_path(cache_key) if cache_key else None
+        tmp_file = None
+        completed = False
+        total = 0
+        try:
+            if tmp_path:
+                try:
+                    tmp_file = open(tmp_path, 'wb')
+                except OSError as e:
+                    print(f"串流TTS無法寫入快取: {e}")
+            for block in ([first], chunks):
+                for data in block:
+                    if not data:
+                        continue
+                    if tmp_file:
+                        tmp_file.write(data)
+                    total += len(data)
+                    yield data
+            completed = True
+        finally:
+            response.close()
+            if tmp_file:
+                tmp_file.close()
+                if completed:
+                    self.audio_cache.put_file(cache_key, tmp_path)
+                else:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+            status = '完成' if completed else '中斷'
+            print(f"串流TTS{status}: {total} bytes，耗時: {time.time() - start:.3f}秒")
+
     def test_with_params(self, text, additional_params=None):
         """
         使用額外參數測試TTS服務
@@ -302,7 +553,7 @@ class RemoteTtsService:
             print(f"完整參數: {params}")
             
             # 發送請求
-            response = requests.get(
+            response = get_session('tts').get(
                 full_url, 
                 params=params, 
                 timeout=self.timeout,
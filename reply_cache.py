@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 回應快取模組
+初學者常說的短句（你好、多謝、再見……）不必每次都讓模型重新生成：
+以「正規化的辨識文字 + 模型 + 提示詞模板」為鍵保存回應，依容量與存活時間做 LRU 淘汰。
+每個鍵可保留數個不同的回應（variants），命中時隨機挑一個，回覆才不會一成不變；
+回應數未滿之前仍會呼叫模型並把新的回應加入。
+"""
+
+import time
+import random
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+class ReplyCache:
+    """以正規化文字為鍵的 LLM 回應快取（每個行程各自一份）"""
+
+    def __init__(self, max_entries=1000, ttl=3600, variants=1, max_text_chars=20):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.max_text_chars = max_text_chars
+
+        # key -> {'replies': [...], 'attempts': n, 'created': t}，順序即 LRU 順序（最舊在前）
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+        # 統計
+        self.hits = 0
+        self.misses = 0
+        self.filling = 0
+        self.stores = 0
+        self.skipped = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize_text(text):
+        """正規化文字：NFKC（全形轉半形）、去除空白、標點與符號、英文字母轉小寫"""
+        text = unicodedata.normalize('NFKC', text or '')
+        return ''.join(ch for ch in text if not ch.isspace() and unicodedata.category(ch)[0] not in 'PS').lower()
+
+    def make_key(self, text, model, template):
+        """正規化文字過長或為空時返回 None（不快取）"""
+        normalized = self.normalize_text(text)
+        if not normalized or len(normalized) > self.max_text_chars:
+            return None
+        return hashlib.sha256('\x1f'.join([normalized, model, template]).encode('utf-8')).hexdigest()
+
+    def get(self, text, model, template):
+        """返回快取的回應；未命中或回應數未滿時返回 None（呼叫端應呼叫模型後 put）"""
+        key = self.make_key(text, model, template)
+        with self._lock:
+            if key is None:
+                self.skipped += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['created'] > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            if len(entry['replies']) < self.variants and entry['attempts'] < self.variants * 2:
+                # 回應數未滿：本次仍由模型生成，增加變化
+                self.filling += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._random.choice(entry['replies'])
+
+    def put(self, text, model, template, reply):
+        """加入一個回應；相同的回應不重複保存"""
+        key = self.make_key(text, model, template)
+        if key is None or not reply:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {'replies': [], 'attempts': 0, 'created': time.time()}
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            entry['attempts'] += 1
+            if reply not in entry['replies'] and len(entry['replies']) < self.variants:
+                entry['replies'].append(reply)
+                self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.filling
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'variants': self.variants,
+                'hits': self.hits,
+                'misses': self.misses,
+                'filling': self.filling,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'stores': self.stores,
+                'skipped': self.skipped,
+                'expired': self.expired,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批次羅馬拼音轉數字調
+匯入課程詞彙時一次處理整欄字串（list、NumPy object 陣列或迭代器）：
+每段文字只切詞一次，所有音節去重後各轉換一次，再依原順序組回結果；
+資料量很大時可用多行程分批處理。
+
+命令列（串流讀寫 CSV / JSONL）:
+    python romanization_bulk.py vocab.csv -o vocab_numeric.csv --column tailo
+    python romanization_bulk.py vocab.jsonl -o - --column tailo --sandhi --processes 4
+    cat vocab.csv | python romanization_bulk.py - --format csv --column tailo > out.csv
+"""
+
+import sys
+import csv
+import json
+import argparse
+from itertools import islice
+from multiprocessing import Pool
+
+import numpy as np
+
+from romanization_converter import RomanizationConverter
+
+DEFAULT_BATCH_SIZE = 5000
+MIN_PARALLEL_SIZE = 20000  # 少於此數量時多行程的啟動與傳輸成本不划算
+
+_worker_converter = None
+
+
+def _get_converter():
+    """每個行程各自建立一個轉換器"""
+    global _worker_converter
+    if _worker_converter is None:
+        _worker_converter = RomanizationConverter()
+    return _worker_converter
+
+
+def _convert_chunk(texts, sandhi=False, variant='chang'):
+    """單一行程內的批次轉換：文字去重 → 切詞 → 音節去重轉換 → 組回"""
+    converter = _get_converter()
+
+    unique_texts = dict.fromkeys(text for text in texts if isinstance(text, str))
+
+    if sandhi:
+        # 變調需依原文標點切群組；音節轉換仍經由轉換器的音節快取，每個音節只算一次
+        results = {text: converter.sandhi.apply(text, variant) for text in unique_texts}
+    else:
+        tokenized = {text: converter.tokenize(text) for text in unique_texts}
+        syllables = set()
+        for tokens in tokenized.values():
+            syllables.update(tokens)
+        table = {syllable: converter._convert_syllable_uncached(syllable) for syllable in syllables}
+        results = {text: ''.join([table[token] for token in tokens]) for text, tokens in tokenized.items()}
+
+    # 非字串（None、NaN 等空值）原樣以 None 返回
+    return [results.get(text) if isinstance(text, str) else None for text in texts]
+
+
+def _batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _convert_chunk_args(args):
+    return _convert_chunk(*args)
+
+
+def convert_bulk(texts, sandhi=False, variant='chang', processes=None, pool=None):
+    """
+    批次轉換整欄文字
+    texts: list / tuple / NumPy 陣列 / 任意迭代器；NumPy 陣列輸入時返回相同形狀的 object 陣列，其餘返回 list
+    processes: 大於 1 且資料量夠大時以多行程處理；pool 可傳入既有的 multiprocessing.Pool 重複使用
+    （傳入 pool 時不論資料量一律分給 pool 處理，呼叫端已付出啟動成本）
+    """
+    shape = None
+    if isinstance(texts, np.ndarray):
+        shape = texts.shape
+        items = texts.ravel().tolist()
+    else:
+        items = list(texts)
+
+    workers = processes or 1
+    if pool is not None and workers <= 1:
+        workers = getattr(pool, '_processes', None) or 1
+    if workers > 1 and (pool is not None or len(items) >= MIN_PARALLEL_SIZE):
+        size = -(-len(items) // workers)
+        chunks = [(items[i:i + size], sandhi, variant) for i in range(0, len(items), size)]
+        if pool is not None:
+            parts = pool.map(_convert_chunk_args, chunks)
+        else:
+            with Pool(workers) as own_pool:
+                parts = own_pool.map(_convert_chunk_args, chunks)
+        results = [r for part in parts for r in part]
+    else:
+        results = _convert_chunk(items, sandhi, variant)
+
+    if shape is not None:
+        out = np.empty(len(results), dtype=object)
+        out[:] = results
+        return out.reshape(shape)
+    return results
+
+
+def iter_convert_bulk(texts, batch_size=DEFAULT_BATCH_SIZE, **kwargs):
+    """串流版本：每次從迭代器取 batch_size 筆批次轉換，逐筆產出結果"""
+    for batch in _batched(texts, batch_size):
+        yield from convert_bulk(batch, **kwargs)
+
+
+# ===== 命令列 =====
+
+def _detect_format(path, fmt):
+    if fmt != 'auto':
+        return fmt
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def _read_rows(stream, fmt):
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        return reader.fieldnames or [], reader
+    return None, (json.loads(line) for line in stream if line.strip())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批次將台羅拼音欄位轉為數字調（CSV / JSONL 串流）')
+    parser.add_argument('input', help="輸入檔案（'-' 為標準輸入）")
+    parser.add_argument('-o', '--output', default='-', help="輸出檔案（預設 '-' 為標準輸出）")
+    parser.add_argument('--column', required=True, help='要轉換的欄位名稱')
+    parser.add_argument('--output-column', help='輸出欄位名稱（預設為 <column>_numeric）')
+    parser.add_argument('--format', choices=['auto', 'csv', 'jsonl'], default='auto')
+    parser.add_argument('--sandhi', action='store_true', help='套用連讀變調')
+    parser.add_argument('--variant', choices=['chang', 'chuan'], default='chang')
+    parser.add_argument('--processes', type=int, default=1, help='多行程數量（大量資料時使用）')
+    parser.add_argument('--batch-size', type=int,
+                        help=f'每批筆數（預設 {DEFAULT_BATCH_SIZE}，多行程時至少 {MIN_PARALLEL_SIZE}）')
+    args = parser.parse_args(argv)
+    if args.batch_size is None:
+        args.batch_size = max(DEFAULT_BATCH_SIZE, MIN_PARALLEL_SIZE) if args.processes > 1 else DEFAULT_BATCH_SIZE
+
+    in_fmt = _detect_format(args.input, args.format)
+    out_fmt = _detect_format(args.output, args.format) if args.output != '-' else in_fmt
+    output_column = args.output_column or f"{args.column}_numeric"
+
+    in_stream = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8-sig', newline='')
+    out_stream = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', newline='')
+    pool = Pool(args.processes) if args.processes > 1 else None
+    count = 0
+    try:
+        fieldnames, rows = _read_rows(in_stream, in_fmt)
+        writer = None
+        for batch in _batched(rows, args.batch_size):
+            values = [row.get(args.column) for row in batch]
+            converted = convert_bulk(values, sandhi=args.sandhi, variant=args.variant,
+                                     processes=args.processes, pool=pool)
+            for row, value in zip(batch, converted):
+                row[output_column] = value
+                if out_fmt == 'csv':
+                    if writer is None:
+                        names = list(fieldnames or row.keys())
+                        if output_column not in names:
+                            names.append(output_column)
+                        writer = csv.DictWriter(out_stream, fieldnames=names, extrasaction='ignore')
+                        writer.writeheader()
+                    writer.writerow(row)
+                else:
+                    out_stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += len(batch)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if in_stream is not sys.stdin:
+            in_stream.close()
+        if out_stream is not sys.stdout:
+            out_stream.close()
+
+    print(f"✅ 已轉換 {count} 筆", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
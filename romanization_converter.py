@@ -2,9 +2,21 @@
 # -*- coding: utf-8 -*-
 import re
 import unicodedata
+from functools import lru_cache
+
+from tone_sandhi import ToneSandhiEngine
+
+# 預先編譯的樣式（標點與空白一次收斂為單一空格，與逐步替換結果相同）
+_PUNCTUATION_PATTERN = re.compile(r'[\s。\.!?！？，,]+')
+_TOKEN_PATTERN = re.compile(r'(\s+|[-])')
+_LONG_PAUSE_PATTERN = re.compile(r'[。\.!?！？]')
+_ENDS_WITH_DIGIT = re.compile(r'\d$')
+_CHECKED_FINALS = ('p', 't', 'k', 'h')
+
+SYLLABLE_CACHE_SIZE = 8192
 
 class RomanizationConverter:
-    def __init__(self):
+    def __init__(self, cache_size=SYLLABLE_CACHE_SIZE):
         # 聲調映射表（組合符號）
         self.tone_map = {
             '\u0301': '2',  # ˊ
@@ -26,125 +38,100 @@ class RomanizationConverter:
             'ńg': ('ng', '2'), 'ǹg': ('ng', '3'), 'n̂g': ('ng', '5'), 'ňg': ('ng', '6'), 'n̄g': ('ng', '7'), 'n̍g': ('ng', '8'), 'n̋g': ('ng', '9'),
         }
         self.o_dot_char = '\u0358'  # o͘
+        self._o_dot = f'o{self.o_dot_char}'
+        # 音節 → 數字調 的有界快取（lru_cache 本身為執行緒安全）
+        self._convert_cached = lru_cache(maxsize=cache_size)(self._convert_syllable_uncached)
+        # 連讀變調引擎（依標點切出變調群組，查表變調）
+        self.sandhi = ToneSandhiEngine(self)
+
+    def tokenize(self, text):
+        """標點前處理後切成音節與分隔符號（空白、連字號）交錯的 token 列表"""
+        return _TOKEN_PATTERN.split(self._preprocess_punctuation(text))
 
     def convert_to_numeric_tone(self, text):
-        text = self._preprocess_punctuation(text)
-        syllables = re.split(r'(\s+|[-])', text)
-        converted = [self._convert_syllable(s) for s in syllables]
-        return ''.join(converted)
+        convert = self._convert_cached
+        return ''.join([convert(s) for s in self.tokenize(text)])
+
+    def split_sentences(self, text):
+        """在長停頓標點（句號類）處切句，返回非空句子列表"""
+        text = unicodedata.normalize('NFC', text)
+        return [s.strip() for s in _LONG_PAUSE_PATTERN.split(text) if s.strip()]
+
+    def convert_to_numeric_tone_chunks(self, text):
+        """依長停頓切句後分別轉數字調（供分段 TTS 使用），合併後與 convert_to_numeric_tone 結果相同"""
+        chunks = [self.convert_to_numeric_tone(s) for s in self.split_sentences(text)]
+        return [c for c in chunks if c]
+
+    def convert_many(self, texts):
+        """批次轉換多段文字，返回與輸入順序相同的 list"""
+        return [self.convert_to_numeric_tone(text) for text in texts]
+
+    def cache_info(self):
+        """音節快取統計"""
+        return self._convert_cached.cache_info()._asdict()
 
     def convert_to_numeric_tone_with_sandhi(self, text, apply_sandhi=True, variant='chang'):
         """
-        先轉數字調（本調），再對非句尾音節套用連讀變調規則。
+        轉數字調並套用連讀變調：每個標點切出的變調群組中，
+        群組末音節與輕聲前音節保留本調，其餘音節變調（多句文字一次處理）。
         variant: 'chang'（漳腔 5→7）或 'chuan'（泉腔 5→3）
         """
-        text = self._preprocess_punctuation(text)
-        tokens = re.split(r'(\s+|[-])', text)
-        # 先本調轉換
-        converted_tokens = [self._convert_syllable(tok) for tok in tokens]
-
         if not apply_sandhi:
-            return ''.join(converted_tokens)
-
-        # 找出所有是音節的索引（最後一個不變調）
-        syllable_indexes = [i for i, tok in enumerate(converted_tokens) if self._is_numeric_syllable(tok)]
-        if len(syllable_indexes) <= 1:
-            return ''.join(converted_tokens)
-
-        last_idx = syllable_indexes[-1]
-        for idx in syllable_indexes:
-            if idx == last_idx:
-                continue  # 句尾保留本調
-            base, tone = self._split_numeric_syllable(converted_tokens[idx])
-            new_tone = self._apply_sandhi_tone(base, tone, variant)
-            converted_tokens[idx] = f"{base}{new_tone}"
-
-        return ''.join(converted_tokens)
+            return self.convert_to_numeric_tone(text)
+        return self.sandhi.apply(text, variant)
 
     def _preprocess_punctuation(self, text):
         """
         標點轉換：句號換兩個空格，逗號換一個空格
         """
         text = unicodedata.normalize('NFC', text)
-        text = re.sub(r'[。\.!?！？]', '  ', text)  # 長停頓
-        text = re.sub(r'[，,]', ' ', text)          # 短停頓
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
+        # 長停頓、短停頓與連續空白最後都收斂為單一空格
+        return _PUNCTUATION_PATTERN.sub(' ', text).strip()
 
     def _convert_syllable(self, syllable):
-        if not syllable or syllable.isspace() or syllable == '-' or re.search(r'\d$', syllable):
+        return self._convert_cached(syllable)
+
+    def _convert_syllable_uncached(self, syllable):
+        if not syllable or syllable.isspace() or syllable == '-' or _ENDS_WITH_DIGIT.search(syllable):
             return syllable
 
         # 輕聲
         if syllable.startswith('--'):
             return syllable[2:] + '0'
 
-        # 直接處理特殊鼻音
-        for full, (base, tone) in self.full_char_map.items():
-            if syllable == full:
-                return base + tone
+        # 直接處理特殊鼻音（整字查表）
+        full = self.full_char_map.get(syllable)
+        if full:
+            return full[0] + full[1]
 
-        # NFD拆分
-        decomposed = unicodedata.normalize('NFD', syllable)
-        base_chars = []
         tone_number = None
-
-        for char in decomposed:
-            if unicodedata.combining(char):
-                if char in self.tone_map and not tone_number:
-                    tone_number = self.tone_map[char]
+        if syllable.isascii():
+            # 無附加符號，不需 NFD 拆分
+            base_syllable = syllable
+        else:
+            # NFD拆分
+            base_chars = []
+            for char in unicodedata.normalize('NFD', syllable):
+                if unicodedata.combining(char):
+                    if char in self.tone_map and not tone_number:
+                        tone_number = self.tone_map[char]
+                    else:
+                        base_chars.append(char)  # 保留o͘的點
                 else:
-                    base_chars.append(char)  # 保留o͘的點
-            else:
-                base_chars.append(char)
+                    base_chars.append(char)
 
-        # o͘ 處理
-        base_syllable = ''.join(base_chars).replace(f'o{self.o_dot_char}', 'oo')
+            # o͘ 處理
+            base_syllable = ''.join(base_chars).replace(self._o_dot, 'oo')
 
-        # 預設聲調判斷
+        # 預設聲調判斷（入聲 4，其餘 1）
         if not tone_number:
-            if base_syllable.lower().endswith(('p', 't', 'k', 'h')):
-                tone_number = '4'
-            elif any(c in 'aeioumn' for c in base_syllable.lower()):
-                tone_number = '1'
-            else:
-                tone_number = '1'  # 保底
+            tone_number = '4' if base_syllable.lower().endswith(_CHECKED_FINALS) else '1'
 
         return base_syllable + tone_number
 
     # ===== Sandhi helpers =====
-    def _is_numeric_syllable(self, token: str) -> bool:
-        return bool(re.fullmatch(r"[A-Za-z\-]+\d", token))
-
-    def _split_numeric_syllable(self, token: str):
-        m = re.fullmatch(r"([A-Za-z\-]+)(\d)", token)
-        if not m:
-            return token, '1'
-        return m.group(1), m.group(2)
-
     def _apply_sandhi_tone(self, base: str, tone: str, variant: str) -> str:
-        b = base.lower()
-        if tone == '1':
-            return '7'
-        if tone == '2':
-            return '1'
-        if tone == '3':
-            return '2'
-        if tone == '5':
-            return '7' if variant == 'chang' else '3'
-        if tone == '7':
-            return '3'
-        if tone == '4':
-            if b.endswith(('p', 't', 'k')):
-                return '8'
-            if b.endswith('h'):
-                return '2'
-        if tone == '8':
-            if b.endswith(('p', 't', 'k')):
-                return '4'
-            if b.endswith('h'):
-                return '3'
-        return tone
+        return self.sandhi.tone_of(base, tone, variant)
 
     def test(self):
         test_cases = [
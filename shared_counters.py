@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨 worker 共用的計數器模組
+gunicorn 以 preload_app 在主行程建立物件後 fork 出多個 worker，一般的 int 在 fork 後各自獨立，
+准入上限與上游並行上限就會變成「每個 worker 各一份」。這裡的計數放在 fork 前配置的共享記憶體中，
+所有 worker 看到的是同一份數字。
+
+每個行程另記錄自己貢獻的數量；worker 被強制終止（逾時、OOM）時來不及歸還名額，
+由主行程在 child_exit 中以 reclaim(pid) 扣回，避免名額永久遺失。
+等待名額時只在本行程內以 threading.Condition 通知，其他 worker 歸還的名額以短間隔輪詢發現
+（multiprocessing.Condition 的等待者若被強制終止，之後的 notify 會永久阻塞，故不採用）。
+注意：必須在 fork 之前建立（模組載入時建立即可），fork 之後才建立的實例只在該行程內有效。
+"""
+
+import os
+import threading
+import multiprocessing
+
+# 同時登記的行程數上限（worker 數加上重啟中的 worker，遠小於此值）
+MAX_PROCESSES = 256
+# 等待其他 worker 歸還名額時的輪詢間隔（秒）
+POLL_INTERVAL = 0.05
+
+
+class SharedCounters:
+    """
+    一組共用同一把鎖的具名計數器
+    get/add 須在 `with counters.lock:` 之內呼叫；shared=False 時退化為單一行程版本（測試、ASGI 單行程）
+    """
+
+    def __init__(self, names, shared=True, max_processes=MAX_PROCESSES):
+        self.names = tuple(names)
+        self.shared = shared
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._width = len(self.names) + 1  # 每列：pid + 各計數
+        self._max_processes = max_processes
+        if shared:
+            self.lock = multiprocessing.Lock()
+            self._totals = multiprocessing.RawArray('l', len(self.names))
+            self._rows = multiprocessing.RawArray('l', max_processes * self._width)
+        else:
+            self.lock = threading.Lock()
+            self._totals = [0] * len(self.names)
+            self._rows = None
+
+    def get(self, name):
+        """目前所有行程的合計（呼叫端須持有 lock）"""
+        return self._totals[self._index[name]]
+
+    def add(self, name, delta):
+        """調整合計並記在本行程名下（呼叫端須持有 lock）"""
+        i = self._index[name]
+        self._totals[i] += delta
+        if self._rows is None:
+            return
+        base = self._row_base(os.getpid())
+        if base is None:
+            return
+        self._rows[base + 1 + i] += delta
+        if not any(self._rows[base + 1:base + self._width]):
+            self._rows[base] = 0  # 已全數歸還，釋出此列
+
+    def wait_timeout(self, remaining):
+        """在本行程 Condition 上等待的秒數：共用時不超過輪詢間隔（remaining 為 None 表示不限時）"""
+        if not self.shared:
+            return remaining
+        return POLL_INTERVAL if remaining is None else min(remaining, POLL_INTERVAL)
+
+    def _row_base(self, pid):
+        """找到 pid 的記錄列（沒有則佔用一個空列），全部佔滿時返回 None"""
+        empty = None
+        for base in range(0, self._max_processes * self._width, self._width):
+            if self._rows[base] == pid:
+                return base
+            if empty is None and self._rows[base] == 0:
+                empty = base
+        if empty is not None:
+            self._rows[empty] = pid
+        return empty
+
+    def reclaim(self, pid):
+        """扣回已結束行程仍佔用的數量，返回 {名稱: 扣回數量}"""
+        if self._rows is None:
+            return {}
+        reclaimed = {}
+        with self.lock:
+            for base in range(0, self._max_processes * self._width, self._width):
+                if self._rows[base] != pid:
+                    continue
+                for name, i in self._index.items():
+                    held = self._rows[base + 1 + i]
+                    if held:
+                        self._totals[i] -= held
+                        reclaimed[name] = held
+                    self._rows[base + 1 + i] = 0
+                self._rows[base] = 0
+        return reclaimed
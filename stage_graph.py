@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+處理階段排程模組
+以有向無環圖（DAG）描述各處理階段的相依關係，
+相依條件滿足的階段立即送到共用執行緒池執行，互不相依的階段即可重疊進行。
+"""
+
+import time
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+class StopPipeline(Exception):
+    """階段主動中止後續處理（例如辨識結果為空），value 會保留給呼叫端"""
+
+    def __init__(self, value=None):
+        super().__init__(value)
+        self.value = value
+
+
+class StageGraph:
+    """處理階段 DAG"""
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.stages = {}       # name -> (func, deps)
+        self.results = {}
+        self.timings = {}      # name -> {'start', 'end', 'duration'}（相對於 run 開始時間）
+        self.stopped = None
+        self._origin = None
+        self._lock = threading.Lock()
+
+    def add(self, name, func, deps=()):
+        """
+        新增階段；func 以 dict(相依階段名稱 -> 結果) 為參數呼叫。
+        相依階段必須先行加入，以確保圖中沒有循環。
+        """
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"階段 {name} 的相依階段 {dep} 尚未加入")
+        self.stages[name] = (func, tuple(deps))
+        return self
+
+    def _run_stage(self, name, func, inputs):
+        start = time.time()
+        try:
+            return func(inputs)
+        finally:
+            end = time.time()
+            with self._lock:
+                self.timings[name] = {
+                    'start': start - self._origin,
+                    'end': end - self._origin,
+                    'duration': end - start,
+                }
+
+    def run(self):
+        """執行所有階段，返回各階段結果；有階段拋出 StopPipeline 時立即停止並返回"""
+        self._origin = time.time()
+        pending = dict(self.stages)
+        running = {}
+
+        while pending or running:
+            if self.stopped is not None:
+                # 已中止：不再排程新階段，也不等待仍在執行的階段（其結果將被忽略）
+                break
+
+            ready = [name for name, (_, deps) in pending.items()
+                     if all(dep in self.results for dep in deps)]
+            for name in ready:
+                func, deps = pending.pop(name)
+                inputs = {dep: self.results[dep] for dep in deps}
+                running[self.executor.submit(self._run_stage, name, func, inputs)] = name
+
+            if not running:
+                if pending:
+                    raise RuntimeError(f"無法排程的階段: {', '.join(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    self.results[name] = future.result()
+                except StopPipeline as stop:
+                    if self.stopped is None:
+                        self.stopped = stop
+                except Exception:
+                    # 等待其餘執行中的階段結束後再拋出
+                    wait(running)
+                    raise
+
+        return self.results
+
+    def timeline(self):
+        """返回各階段時間軸的快照"""
+        with self._lock:
+            return {name: dict(timing) for name, timing in self.timings.items()}
+
+    def critical_path(self):
+        """
+        由最晚結束的階段往回，沿著「最晚完成的相依階段」追溯出關鍵路徑，
+        返回 {'stages': [{'name', 'duration', 'wait'}...], 'total': 秒}
+        """
+        timings = self.timeline()
+        if not timings:
+            return {'stages': [], 'total': 0.0}
+
+        name = max(timings, key=lambda n: timings[n]['end'])
+        path = []
+        while name:
+            timing = timings[name]
+            deps = [d for d in self.stages[name][1] if d in timings]
+            prev = max(deps, key=lambda d: timings[d]['end']) if deps else None
+            ready_at = timings[prev]['end'] if prev else 0.0
+            path.append({
+                'name': name,
+                'duration': timing['duration'],
+                'wait': max(0.0, timing['start'] - ready_at),
+            })
+            name = prev
+
+        path.reverse()
+        return {
+            'stages': path,
+            'total': timings[path[-1]['name']]['end'] if path else 0.0,
+        }
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+准入控制測試：有界佇列的 429/503、跨 worker 共用的計數與強制終止後的名額扣回、
+以及存在 MongoDB 的非同步工作狀態
+"""
+
+import os
+import sys
+import time
+import threading
+import multiprocessing
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission_control import AdmissionController, AdmissionRejected, MongoJobStore
+from http_clients import LimitedSession, UpstreamBusy
+from shared_counters import SharedCounters
+
+fork = multiprocessing.get_context('fork')
+
+
+def test_reserve_rejects_when_queue_full():
+    admission = AdmissionController(max_active=1, max_queue=1)
+    admission.reserve()
+    admission.reserve()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        admission.reserve()
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after >= 1
+    assert admission.stats()['rejected_full'] == 1
+
+
+def test_acquire_timeout_gives_back_queue_position():
+    admission = AdmissionController(max_active=1, max_queue=1)
+    admission.reserve()
+    started = admission.acquire()
+    admission.reserve()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        admission.acquire(timeout=0.05)
+    assert excinfo.value.status == 503
+    assert (admission.active, admission.queued) == (1, 0)
+    admission.release(started)
+    assert admission.active == 0
+
+
+def test_release_wakes_waiter():
+    admission = AdmissionController(max_active=1, max_queue=1)
+    admission.reserve()
+    started = admission.acquire()
+    admission.reserve()
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(admission.acquire(timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    admission.release(started)
+    waiter.join(2)
+    assert waited and admission.active == 1
+
+
+def _hold_slot(admission, ready, done):
+    """子行程：取得名額後通知父行程，之後不歸還直接結束（模擬 worker 被強制終止）"""
+    admission.reserve()
+    admission.acquire()
+    ready.set()
+    done.wait(5)
+    os._exit(0)
+
+
+def test_shared_counts_span_processes_and_reclaim():
+    admission = AdmissionController(max_active=1, max_queue=0, shared=True)
+    ready, done = fork.Event(), fork.Event()
+    child = fork.Process(target=_hold_slot, args=(admission, ready, done))
+    child.start()
+    assert ready.wait(5)
+
+    # 子行程佔用的名額在父行程也看得到
+    assert admission.active == 1
+    with pytest.raises(AdmissionRejected):
+        admission.reserve()
+
+    done.set()
+    child.join(5)
+    assert admission.active == 1  # 未歸還就結束
+    assert admission.reclaim(child.pid) == {'active': 1}
+    assert admission.active == 0
+    admission.reserve()
+    admission.release(admission.acquire())
+
+
+def _release_later(admission, ready):
+    admission.reserve()
+    started = admission.acquire()
+    ready.set()
+    time.sleep(0.2)
+    admission.release(started)
+
+
+def test_waiter_sees_release_from_other_process():
+    admission = AdmissionController(max_active=1, max_queue=1, shared=True)
+    ready = fork.Event()
+    child = fork.Process(target=_release_later, args=(admission, ready))
+    child.start()
+    assert ready.wait(5)
+    admission.reserve()
+    started = admission.acquire(timeout=5)
+    child.join(5)
+    admission.release(started)
+    assert (admission.active, admission.queued) == (0, 0)
+
+
+def test_limited_session_limit_spans_processes():
+    slots = SharedCounters(('active',))
+    ready, done = fork.Event(), fork.Event()
+
+    def hold():
+        session = LimitedSession('tts', 1, slots=slots)
+        session._acquire()
+        ready.set()
+        done.wait(5)
+        os._exit(0)
+
+    child = fork.Process(target=hold)
+    child.start()
+    assert ready.wait(5)
+    session = LimitedSession('tts', 1, queue_timeout=0.1, slots=slots)
+    with pytest.raises(UpstreamBusy):
+        session._acquire()
+    done.set()
+    child.join(5)
+    assert slots.reclaim(child.pid) == {'active': 1}
+    session._acquire()
+    session._release()
+
+
+def test_mongo_job_store_roundtrip():
+    mongomock = pytest.importorskip('mongomock')
+    store = MongoJobStore(mongomock.MongoClient().db.VoiceJobs, ttl=600)
+    assert store.ensure_indexes()
+
+    job_id = store.create()
+    assert store.get(job_id)['status'] == 'queued'
+    store.update(job_id, 'running')
+    store.update(job_id, 'done', {'success': True}, 200)
+
+    job = store.get(job_id)
+    assert job['job_id'] == job_id
+    assert job['result'] == {'success': True}
+    assert job['http_status'] == 200
+    assert store.stats() == {'done': 1}
+    assert store.get('missing') is None
+
+
+def test_mongo_job_store_hides_expired_jobs():
+    mongomock = pytest.importorskip('mongomock')
+    store = MongoJobStore(mongomock.MongoClient().db.VoiceJobs, ttl=0)
+    job_id = store.create()
+    store.update(job_id, 'failed', {'success': False}, 500)
+    assert store.get(job_id) is None
+    assert store.stats() == {}
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI 版 /tts_stream 的上游名額釋放測試（與 Flask 版相同的情境）
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('quart')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['TTS_CACHE_ENABLED'] = 'false'
+
+import app_local
+import app_asgi
+from http_clients import get_session
+from remote_tts_service import RemoteTtsService
+from test_tts_stream import CHUNK, FakeTtsHandler
+
+
+@pytest.fixture(scope='module')
+def client():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTtsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with pytest.MonkeyPatch.context() as mp:
+        # 與 Flask 版相同：不讓啟動清理刪除工作目錄中的音檔
+        mp.setattr(app_local, 'cleanup_temp_files', lambda: None)
+        mp.setattr(app_local, 'remote_tts_service', RemoteTtsService('127.0.0.1', server.server_address[1]))
+        yield app_asgi.app.test_client()
+    server.shutdown()
+
+
+def wait_slots_released(timeout=2.0):
+    """關閉在執行緒池中完成，稍等片刻"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if get_session('tts').limit_stats()['active'] == 0:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def stream_url(i):
+    return f'/tts_stream?numeric=asgi-tai5-gi2-{i}'
+
+
+def test_head_releases_upstream_slot(client):
+    async def run():
+        for i in range(get_session('tts').max_concurrency + 2):
+            response = await client.head(stream_url(i))
+            assert response.status_code == 200
+            assert wait_slots_released()
+    asyncio.run(run())
+
+
+def test_disconnect_mid_stream_releases_upstream_slot(client):
+    async def run():
+        for i in range(get_session('tts').max_concurrency + 2):
+            async with client.request(stream_url(f'mid-{i}')) as connection:
+                await connection.send_complete()
+                assert (await connection.receive()).startswith(b'RIFF')
+            # 離開時連線即中斷，不再讀取其餘區塊
+            assert wait_slots_released()
+    asyncio.run(run())
+
+
+def test_full_stream(client):
+    async def run():
+        response = await client.get(stream_url('full'))
+        assert response.status_code == 200
+        data = await response.get_data()
+        assert data.startswith(b'RIFF')
+        assert len(data) == 4 + len(CHUNK) * 9
+        assert wait_slots_released()
+    asyncio.run(run())
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+對話紀錄延後寫入測試：MongoDB 中斷或佇列已滿時寫入暫存檔，恢復後重送；
+已結束行程留下的暫存檔由其他行程認領重送，仍在執行的行程的暫存檔不動
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import AutoReconnect
+
+from chat_history_store import ChatHistoryWriter
+
+
+class FakeCollection:
+    """記錄批次寫入的 ChatHistory；down=True 時所有操作拋出連線錯誤"""
+
+    def __init__(self):
+        self.down = False
+        self.turns = {}
+        self.written = []   # 已寫入操作的 session_id（依寫入順序）
+
+    def _check(self):
+        if self.down:
+            raise AutoReconnect('connection refused')
+
+    def find_one_and_update(self, filter, update, **kwargs):
+        self._check()
+        session_id = filter['session_id']
+        self.turns[session_id] = self.turns.get(session_id, 0) + 1
+        return {'turn': self.turns[session_id], 'finished': False}
+
+    def update_one(self, filter, update, **kwargs):
+        self._check()
+
+    def bulk_write(self, operations, ordered=True):
+        self._check()
+        self.written.extend(op._filter['session_id'] for op in operations)
+
+
+def make_writer(collection, spill_dir, **kwargs):
+    options = dict(batch_size=10, flush_interval=0.02, spill_dir=str(spill_dir),
+                   replay_interval=0.05, outage_backoff=0.1)
+    options.update(kwargs)
+    return ChatHistoryWriter(collection, 5, **options)
+
+
+def spill_records(spill_dir):
+    records = []
+    for path in glob.glob(f"{spill_dir}/spill.*.jsonl"):
+        with open(path, encoding='utf-8') as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def wait_for(predicate, timeout=3.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_outage_spills_and_replays_after_recovery(tmp_path):
+    collection = FakeCollection()
+    writer = make_writer(collection, tmp_path).start()
+    try:
+        assert writer.record_turn('s1', 'u', 'c', 't', 'q0', 'a0') == (True, False)
+        assert wait_for(lambda: collection.written == ['s1'])
+
+        collection.down = True
+        for i in range(3):
+            # 取得輪數失敗：本輪改為整輪暫存，請求仍立即返回
+            assert writer.record_turn('s2', 'u', 'c', 't', f'q{i}', 'a') == (True, False)
+        assert wait_for(lambda: len(spill_records(tmp_path)) == 3)
+        assert {r['op'] for r in spill_records(tmp_path)} == {'turn'}
+
+        collection.down = False
+        assert wait_for(lambda: collection.written.count('s2') == 3)
+        assert wait_for(lambda: not glob.glob(f"{tmp_path}/*"))
+    finally:
+        writer.close()
+    stats = writer.stats()
+    assert stats['spilled'] == 3 and stats['replayed'] == 3
+    assert stats['spill_files'] == 0
+
+
+def test_full_queue_spills_without_blocking(tmp_path):
+    collection = FakeCollection()
+    writer = make_writer(collection, tmp_path, max_queue=1)  # 未啟動背景執行緒，佇列不會被取走
+    writer.record_turn('s1', 'u', 'c', 't', 'q0', 'a')
+    writer.record_turn('s1', 'u', 'c', 't', 'q1', 'a')
+    assert [r['user_text'] for r in spill_records(tmp_path)] == ['q1']
+
+    writer.close()
+    assert sorted(collection.written) == ['s1', 's1']
+    assert not glob.glob(f"{tmp_path}/*")
+
+
+def test_close_writes_queue_and_replays_despite_backoff(tmp_path):
+    collection = FakeCollection()
+    writer = make_writer(collection, tmp_path, outage_backoff=60)
+    collection.down = True
+    writer.record_turn('s1', 'u', 'c', 't', 'q0', 'a')  # 進入 60 秒的斷線退避
+    assert writer.replay_spill() == 0
+    collection.down = False
+
+    writer.close()
+    assert collection.written == ['s1']
+
+
+def _exit_immediately():
+    pass
+
+
+def _spill_line(session_id):
+    return json.dumps({
+        'op': 'turn', 'session_id': session_id, 'user_id': 'u', 'chat_choose_id': 'c', 'title': 't',
+        'user_text': 'q', 'ai_response': 'a', 'ts': '2024-01-01T00:00:00', 'turn_id': session_id,
+    }) + '\n'
+
+
+def test_replay_claims_only_files_of_exited_processes(tmp_path):
+    child = multiprocessing.get_context('fork').Process(target=_exit_immediately)
+    child.start()
+    child.join(5)
+    with open(tmp_path / f"spill.{child.pid}.jsonl", 'w', encoding='utf-8') as f:
+        f.write(_spill_line('dead'))
+    live_path = tmp_path / f"spill.{os.getppid()}.jsonl"
+    with open(live_path, 'w', encoding='utf-8') as f:
+        f.write(_spill_line('live'))
+
+    collection = FakeCollection()
+    writer = make_writer(collection, tmp_path)
+    assert writer.replay_spill() == 1
+    assert collection.written == ['dead']
+    assert [os.path.basename(p) for p in glob.glob(f"{tmp_path}/*")] == [live_path.name]
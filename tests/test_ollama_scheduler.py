@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Ollama 微批次排程測試：呼叫端等待逾時後，尚未送出的請求不得再送往 Ollama
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_scheduler import OllamaBatchScheduler
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """模擬 /api/generate：記錄收到的提示詞，每個請求耗時 0.3 秒"""
+
+    prompts = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.prompts.append(payload['prompt'])
+        time.sleep(0.3)
+        body = json.dumps({'response': payload['prompt'].upper()}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def scheduler():
+    FakeOllamaHandler.prompts = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield OllamaBatchScheduler(f'http://127.0.0.1:{server.server_address[1]}', 'test', window_ms=5, parallel=1)
+    server.shutdown()
+
+
+def test_generate_returns_result(scheduler):
+    assert scheduler.generate('hello')['response'] == 'HELLO'
+
+
+def test_timed_out_request_is_not_dispatched(scheduler):
+    slow = threading.Thread(target=scheduler.generate, args=('first',))
+    slow.start()
+    time.sleep(0.05)  # 讓第一個請求佔住唯一的平行槽
+
+    with pytest.raises(FutureTimeoutError):
+        scheduler.generate('second', timeout=0.1)
+
+    slow.join(5)
+    time.sleep(0.1)  # 第一個請求結束後，排在後面的已取消請求輪到執行
+    assert FakeOllamaHandler.prompts == ['first']
+    assert scheduler.stats()['cancelled'] == 1
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+批次羅馬拼音轉換測試：結果與逐筆轉換一致、空值與 NumPy 形狀保留、多行程確實使用 pool，以及 CSV 命令列
+"""
+
+import os
+import sys
+import csv
+import multiprocessing
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import romanization_bulk
+from romanization_bulk import convert_bulk, iter_convert_bulk
+from romanization_converter import RomanizationConverter
+
+TEXTS = ['Tâi-gí tsin hó-thiann.', 'Lí hó!', 'tsia̍h-pá--ah', 'Tâi-gí tsin hó-thiann.']
+
+
+class RecordingPool:
+    """包住真正的 Pool，記錄 map 被呼叫的次數"""
+
+    def __init__(self, processes):
+        self._pool = multiprocessing.get_context('fork').Pool(processes)
+        self._processes = processes
+        self.map_calls = 0
+
+    def map(self, func, iterable):
+        self.map_calls += 1
+        return self._pool.map(func, iterable)
+
+    def close(self):
+        self._pool.close()
+
+    def join(self):
+        self._pool.join()
+
+
+@pytest.fixture(scope='module')
+def converter():
+    return RomanizationConverter()
+
+
+def test_matches_single_conversion(converter):
+    assert convert_bulk(TEXTS) == [converter.convert_to_numeric_tone(t) for t in TEXTS]
+
+
+def test_sandhi_matches_engine(converter):
+    assert convert_bulk(TEXTS, sandhi=True) == [converter.sandhi.apply(t) for t in TEXTS]
+
+
+def test_missing_values_and_numpy_shape(converter):
+    values = np.array([['Lí hó', None], [float('nan'), 'hó']], dtype=object)
+    out = convert_bulk(values)
+    assert out.shape == (2, 2)
+    assert out[0, 0] == converter.convert_to_numeric_tone('Lí hó')
+    assert out[0, 1] is None and out[1, 0] is None
+
+
+def test_explicit_pool_is_used_for_small_input(converter):
+    pool = RecordingPool(2)
+    try:
+        result = convert_bulk(TEXTS * 3, pool=pool)
+    finally:
+        pool.close()
+        pool.join()
+    assert pool.map_calls == 1
+    assert result == convert_bulk(TEXTS * 3)
+
+
+def test_iter_convert_bulk_keeps_order():
+    assert list(iter_convert_bulk(iter(TEXTS), batch_size=3)) == convert_bulk(TEXTS)
+
+
+def test_cli_with_processes_uses_pool(tmp_path, monkeypatch, converter):
+    pools = []
+
+    def make_pool(processes):
+        pools.append(RecordingPool(processes))
+        return pools[-1]
+
+    monkeypatch.setattr(romanization_bulk, 'Pool', make_pool)
+    src = tmp_path / 'vocab.csv'
+    dst = tmp_path / 'out.csv'
+    with open(src, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'tailo'])
+        for i, text in enumerate(TEXTS):
+            writer.writerow([i, text])
+
+    romanization_bulk.main([str(src), '-o', str(dst), '--column', 'tailo', '--processes', '2'])
+
+    with open(dst, encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['tailo_numeric'] for row in rows] == [converter.convert_to_numeric_tone(t) for t in TEXTS]
+    assert len(pools) == 1 and pools[0].map_calls == 1
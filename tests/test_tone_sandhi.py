@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+連讀變調測試：變調對照表、片語層級的 kiatko 分組，以及對話/TTS 路徑的設定開關
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from romanization_converter import RomanizationConverter
+from tone_sandhi import SANDHI_TABLE, FINAL_SONORANT, FINAL_STOP, FINAL_GLOTTAL
+
+TAI_GI_TSIN_HO_THIANN = [
+    {'漢字': '台語', 'KIP': 'Tâi-gí'},
+    {'漢字': '真', 'KIP': 'tsin'},
+    {'漢字': '好聽', 'KIP': 'hó-thiann'},
+    {'漢字': '。', 'KIP': '.'},
+]
+
+
+@pytest.fixture(scope='module')
+def converter():
+    return RomanizationConverter()
+
+
+@pytest.mark.parametrize('cls, tone, variant, expected', [
+    (FINAL_SONORANT, '1', 'chang', '7'),
+    (FINAL_SONORANT, '2', 'chang', '1'),
+    (FINAL_SONORANT, '3', 'chang', '2'),
+    (FINAL_SONORANT, '5', 'chang', '7'),
+    (FINAL_SONORANT, '5', 'chuan', '3'),
+    (FINAL_SONORANT, '7', 'chuan', '3'),
+    (FINAL_STOP, '4', 'chang', '8'),
+    (FINAL_STOP, '8', 'chang', '4'),
+    (FINAL_GLOTTAL, '4', 'chang', '2'),
+    (FINAL_GLOTTAL, '8', 'chuan', '3'),
+])
+def test_sandhi_table(cls, tone, variant, expected):
+    assert SANDHI_TABLE[(cls, tone, variant)] == expected
+
+
+def test_table_covers_every_tone():
+    assert len(SANDHI_TABLE) == 2 * 3 * 10
+
+
+def test_string_path_keeps_only_phrase_final_tone(converter):
+    assert converter.sandhi.apply('Tâi-gí tsin hó-thiann.') == 'Tai7-gi1 tsin7 ho1-thiann1'
+
+
+def test_kiatko_groups_whole_phrase(converter):
+    # 台語真好聽：詞與詞之間連讀，只有句末的「聽」保留本調
+    assert converter.sandhi.apply_kiatko(TAI_GI_TSIN_HO_THIANN) == 'Tai7-gi1 tsin7 ho1-thiann1'
+
+
+def test_kiatko_breaks_before_sentence_particle(converter):
+    kiatko = [{'漢字': '我', 'KIP': 'guá'}, {'漢字': '好', 'KIP': 'hó'}, {'漢字': '啦', 'KIP': 'lah'}]
+    assert converter.sandhi.apply_kiatko(kiatko) == 'gua1 ho2 lah4'
+
+
+def test_kiatko_chunks_split_at_sentence_end(converter):
+    kiatko = TAI_GI_TSIN_HO_THIANN + [{'漢字': '食飽', 'KIP': 'tsia̍h-pá'}, {'漢字': '未', 'KIP': 'buē'}, {'漢字': '？', 'KIP': '?'}]
+    chunks = converter.sandhi.apply_kiatko_chunks(kiatko)
+    assert chunks == ['Tai7-gi1 tsin7 ho1-thiann1', 'tsiah3-pa1 bue7']
+    assert converter.sandhi.apply_kiatko(kiatko) == ' '.join(chunks)
+
+
+def test_conversation_path_applies_sandhi_only_when_enabled(converter, monkeypatch):
+    os.environ.setdefault('TTS_CACHE_ENABLED', 'false')
+    import app_local
+    monkeypatch.setattr(app_local, 'romanization_converter', converter)
+    romanization = 'Tâi-gí tsin hó-thiann.'
+
+    monkeypatch.setattr(app_local, 'TONE_SANDHI_ENABLED', False)
+    assert app_local.convert_numeric_tone(romanization, TAI_GI_TSIN_HO_THIANN)[0] == 'Tai5-gi2 tsin1 ho2-thiann1'
+
+    monkeypatch.setattr(app_local, 'TONE_SANDHI_ENABLED', True)
+    text, chunks = app_local.convert_numeric_tone(romanization, TAI_GI_TSIN_HO_THIANN)
+    assert text == 'Tai7-gi1 tsin7 ho1-thiann1'
+    assert chunks == [text]
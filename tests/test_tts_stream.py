@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+/tts_stream 串流回應的上游名額釋放測試
+HEAD 請求、用戶端在第一個區塊前斷線、讀到一半斷線時，TTS 上游的並行名額都必須歸還
+"""
+
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['TTS_CACHE_ENABLED'] = 'false'
+
+import app_local
+from http_clients import get_session
+from remote_tts_service import RemoteTtsService
+
+CHUNK = b'\x00' * 8192
+
+
+class FakeTtsHandler(BaseHTTPRequestHandler):
+    """模擬 /bangtsam：以 chunked 回應送出 WAV 標頭與數個資料區塊"""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/wav')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for block in [b'RIFF' + CHUNK] + [CHUNK] * 8:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(block), block))
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def client():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTtsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with pytest.MonkeyPatch.context() as mp:
+        # 啟動時的清理會刪除工作目錄 static/、uploads/ 中的音檔，測試不可動到使用者的檔案
+        mp.setattr(app_local, 'cleanup_temp_files', lambda: None)
+        app = app_local.create_app(init_worker=False)
+        mp.setattr(app_local, 'remote_tts_service', RemoteTtsService('127.0.0.1', server.server_address[1]))
+        yield app.test_client()
+    server.shutdown()
+
+
+def active_slots():
+    return get_session('tts').limit_stats()['active']
+
+
+def stream_url(i):
+    return f'/tts_stream?numeric=tai5-gi2-{i}'
+
+
+def test_head_releases_upstream_slot(client):
+    max_concurrency = get_session('tts').max_concurrency
+    for i in range(max_concurrency + 2):
+        response = client.head(stream_url(i))
+        assert response.status_code == 200
+        response.close()
+        assert active_slots() == 0
+
+
+def test_disconnect_before_first_chunk_releases_upstream_slot(client):
+    for i in range(get_session('tts').max_concurrency + 2):
+        response = client.get(stream_url(i), buffered=False)
+        assert response.status_code == 200
+        response.close()  # 未讀取任何內容即斷線
+        assert active_slots() == 0
+
+
+def test_disconnect_mid_stream_releases_upstream_slot(client):
+    response = client.get(stream_url('mid'), buffered=False)
+    assert next(iter(response.response)).startswith(b'RIFF')
+    response.close()
+    assert active_slots() == 0
+
+
+def test_full_stream_still_works_after_aborted_requests(client):
+    response = client.get(stream_url('full'))
+    assert response.status_code == 200
+    assert response.data.startswith(b'RIFF')
+    assert len(response.data) == 4 + len(CHUNK) * 9
+    assert active_slots() == 0
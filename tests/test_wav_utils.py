@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+wav_utils 重新取樣測試：降頻時高於新 Nyquist 的成分不得折疊回可聽頻段
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wav_utils
+
+AMPLITUDE = 10000
+
+
+def tone(freq, rate, seconds=1.0):
+    t = np.arange(int(rate * seconds)) / rate
+    return (AMPLITUDE * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+
+
+def relative_level(pcm):
+    """去掉頭尾後的 RMS，相對於原始正弦波"""
+    core = pcm[1000:-1000].astype(np.float64)
+    return np.sqrt(np.mean(core ** 2)) / (AMPLITUDE / np.sqrt(2))
+
+
+@pytest.mark.parametrize('src_rate', [44100, 48000])
+def test_passband_tone_is_kept(src_rate):
+    out = wav_utils.resample(tone(1000, src_rate), src_rate, 16000)
+    assert len(out) == 16000
+    assert relative_level(out) == pytest.approx(1.0, abs=0.05)
+
+
+@pytest.mark.parametrize('src_rate, freq', [(44100, 12000), (48000, 10000), (48000, 20000)])
+def test_tone_above_target_nyquist_does_not_alias(src_rate, freq):
+    out = wav_utils.resample(tone(freq, src_rate), src_rate, 16000)
+    assert relative_level(out) < 0.01  # 低於 -40 dB
+
+
+def test_upsampling_and_same_rate():
+    pcm = tone(440, 8000)
+    assert wav_utils.resample(pcm, 8000, 8000) is pcm
+    out = wav_utils.resample(pcm, 8000, 16000)
+    assert len(out) == 16000
+    assert relative_level(out) == pytest.approx(1.0, abs=0.05)
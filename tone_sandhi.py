@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+台語連讀變調模組
+以標點切出片語層級的變調群組（使用意傳 kiatko 斷詞結果時，句末助詞前也是群組邊界，
+一般詞與詞之間不斷開），每個群組最後一個音節與輕聲前的音節保留本調，其餘音節查表變調；
+整段文字（可含多個句子）由右至左一次掃描完成。
+"""
+
+import re
+import unicodedata
+
+VARIANTS = ('chang', 'chuan')  # 漳腔 5→7、泉腔 5→3
+
+# 韻尾類別：開音節/鼻音（sonorant）、-p -t -k 入聲（stop）、-h 入聲（glottal）
+FINAL_SONORANT = 'sonorant'
+FINAL_STOP = 'stop'
+FINAL_GLOTTAL = 'glottal'
+
+
+def final_class(base):
+    """依音節（不含調號）判斷韻尾類別"""
+    if not base:
+        return FINAL_SONORANT
+    last = base[-1].lower()
+    if last in 'ptk':
+        return FINAL_STOP
+    if last == 'h':
+        return FINAL_GLOTTAL
+    return FINAL_SONORANT
+
+
+def _build_sandhi_table():
+    """預先展開 (韻尾類別, 本調, 腔調) → 變調 對照表"""
+    rules = {
+        '1': '7',
+        '2': '1',
+        '3': '2',
+        '7': '3',
+    }
+    table = {}
+    for variant in VARIANTS:
+        for cls in (FINAL_SONORANT, FINAL_STOP, FINAL_GLOTTAL):
+            for tone in '0123456789':
+                new_tone = rules.get(tone, tone)
+                if tone == '5':
+                    new_tone = '7' if variant == 'chang' else '3'
+                elif tone == '4' and cls == FINAL_STOP:
+                    new_tone = '8'
+                elif tone == '4' and cls == FINAL_GLOTTAL:
+                    new_tone = '2'
+                elif tone == '8' and cls == FINAL_STOP:
+                    new_tone = '4'
+                elif tone == '8' and cls == FINAL_GLOTTAL:
+                    new_tone = '3'
+                table[(cls, tone, variant)] = new_tone
+    return table
+
+
+SANDHI_TABLE = _build_sandhi_table()
+
+# 變調群組的邊界標點（句號類與逗號類都會結束一個群組）
+BOUNDARY_CHARS = '。.!?！？，,、;；:：…～~'
+_TOKEN_PATTERN = re.compile(r'(--|-|\s+|[' + re.escape(BOUNDARY_CHARS) + r']+)')
+_NUMERIC_SYLLABLE = re.compile(r"(\D+)(\d)")
+_WHITESPACE = re.compile(r'\s+')
+# 句尾停頓標點（kiatko 依此切句，供分段 TTS 使用）
+SENTENCE_END_CHARS = '。.!?！？…'
+# 句末助詞：前一個詞為片語末、保留本調，助詞本身自成一個群組
+SENTENCE_PARTICLES = frozenset(('啦', '喔', '矣', '啊', '呢', '囉', '咧', '嘛', '唷', '哩'))
+
+
+class ToneSandhiEngine:
+    """
+    連讀變調引擎
+    converter 需提供 _convert_syllable(音節) → 數字調音節（即 RomanizationConverter）
+    """
+
+    def __init__(self, converter, variant='chang'):
+        self.converter = converter
+        self.variant = variant
+
+    def tone_of(self, base, tone, variant=None):
+        """查表取得非群組末音節的變調"""
+        return SANDHI_TABLE.get((final_class(base), tone, variant or self.variant), tone)
+
+    def apply(self, text, variant=None):
+        """
+        將台羅文字轉為套用連讀變調的數字調文字
+        標點處視為變調群組邊界，輸出時與 convert_to_numeric_tone 相同轉為單一空格
+        """
+        variant = variant or self.variant
+        tokens = _TOKEN_PATTERN.split(unicodedata.normalize('NFC', text))
+        out = [''] * len(tokens)
+        group_end = True   # 右側是否已是群組邊界（下一個遇到的音節保留本調）
+
+        for i in range(len(tokens) - 1, -1, -1):
+            token = tokens[i]
+            if not token:
+                continue
+            if token == '--':
+                # 輕聲前的音節保留本調
+                out[i] = token
+                group_end = True
+                continue
+            if token == '-' or token.isspace():
+                out[i] = token
+                continue
+            if token[0] in BOUNDARY_CHARS:
+                out[i] = ' '
+                group_end = True
+                continue
+
+            converted = self.converter._convert_syllable(token)
+            m = _NUMERIC_SYLLABLE.fullmatch(converted)
+            if m:
+                base, tone = m.group(1), m.group(2)
+                if i >= 1 and tokens[i - 1] == '--':
+                    converted = base + '0'  # -- 之後為輕聲
+                elif not group_end:
+                    converted = base + self.tone_of(base, tone, variant)
+            out[i] = converted
+            group_end = False
+
+        return _WHITESPACE.sub(' ', ''.join(out)).strip()
+
+    def apply_kiatko(self, kiatko, variant=None):
+        """
+        以意傳 kiatko 斷詞結果（[{'漢字', 'KIP'}]）套用變調，輸出與 apply() 相同格式
+        詞與詞之間不是群組邊界（整個片語連讀），只在標點與句末助詞前斷開
+        """
+        return ' '.join(self.apply_kiatko_chunks(kiatko, variant))
+
+    def apply_kiatko_chunks(self, kiatko, variant=None):
+        """同 apply_kiatko，但依句尾停頓標點切句後分別返回（供分段 TTS 使用）"""
+        chunks = []
+        groups = [[]]   # 目前句子中的變調群組（每個群組為 KIP 列表）
+
+        def end_sentence():
+            text = ' '.join(self.apply(' '.join(group), variant) for group in groups if group)
+            text = _WHITESPACE.sub(' ', text).strip()
+            if text:
+                chunks.append(text)
+            groups[:] = [[]]
+
+        for item in kiatko:
+            kip = (item.get('KIP') or '').strip()
+            if not kip:
+                continue
+            if item.get('漢字', '').strip() in SENTENCE_PARTICLES:
+                # 助詞前的詞為片語末；助詞自成一組
+                groups.append([kip])
+                groups.append([])
+            else:
+                groups[-1].append(kip)
+            if all(ch in SENTENCE_END_CHARS for ch in kip):
+                end_sentence()
+        end_sentence()
+        return chunks
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TTS 音檔快取模組
+以「正規化文字 + 語音參數」的雜湊值作為鍵，將合成結果存於磁碟，
+並在記憶體中維護索引，依容量與存活時間做 LRU 淘汰。
+"""
+
+import os
+import re
+import time
+import uuid
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+class TtsAudioCache:
+    """內容定址的 TTS 音檔快取"""
+
+    def __init__(self, cache_dir='static/tts_cache', max_bytes=500 * 1024 * 1024,
+                 max_age_seconds=30 * 24 * 3600, max_entries=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+
+        # 記憶體索引: key -> {'path', 'size', 'created'}，順序即 LRU 順序（最舊在前）
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        # 命中統計
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def normalize_text(text):
+        """正規化文字：NFC、去除頭尾空白、合併連續空白"""
+        text = unicodedata.normalize('NFC', text or '')
+        return re.sub(r'\s+', ' ', text).strip()
+
+    def make_key(self, text, voice_params=None):
+        """以正規化文字與語音參數產生快取鍵"""
+        parts = [self.normalize_text(text)]
+        for k, v in sorted((voice_params or {}).items()):
+            parts.append(f"{k}={v}")
+        return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    def _path_for(self, key):
+        # 使用正斜線，路徑會直接組成 /static/ 下的音檔網址
+        return f"{self.cache_dir}/{key}.wav"
+
+    def _load_index(self):
+        """啟動時掃描快取目錄重建索引（依修改時間排序）"""
+        entries = []
+        try:
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.wav'):
+                    continue
+                path = f"{self.cache_dir}/{name}"
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, name[:-4], path, st.st_size))
+        except OSError as e:
+            print(f"讀取TTS快取目錄失敗: {e}")
+            return
+
+        entries.sort()
+        for mtime, key, path, size in entries:
+            self._index[key] = {'path': path, 'size': size, 'created': mtime}
+            self._total_bytes += size
+
+        with self._lock:
+            self._evict_locked()
+        print(f"TTS快取已載入: {len(self._index)} 筆, {self._total_bytes / 1024 / 1024:.1f} MB")
+
+    def get(self, key):
+        """查詢快取，命中時返回音檔路徑，否則返回 None"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expired = self.max_age_seconds and time.time() - entry['created'] > self.max_age_seconds
+            if expired or not os.path.exists(entry['path']):
+                self._remove_locked(key)
+                self.misses += 1
+                return None
+
+            self._index.move_to_end(key)
+            self.hits += 1
+            return entry['path']
+
+    def temp_path(self, key):
+        """
+        邊下載邊寫入用的暫存檔路徑（完成後以 put_file 放入快取）
+        多個 worker 共用快取目錄，執行緒 ID 在不同行程間會重複，故以 pid 加隨機值區分
+        """
+        return f"{self._path_for(key)}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+
+    def put(self, key, content):
+        """寫入快取，返回音檔路徑，失敗返回 None"""
+        tmp_path = self.temp_path(key)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+        except Exception as e:
+            print(f"寫入TTS快取失敗: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+        return self.put_file(key, tmp_path)
+
+    def put_file(self, key, tmp_path):
+        """將已寫好的暫存檔原子地移入快取，返回音檔路徑，失敗返回 None"""
+        path = self._path_for(key)
+        try:
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"寫入TTS快取失敗: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old:
+                self._total_bytes -= old['size']
+            self._index[key] = {'path': path, 'size': size, 'created': time.time()}
+            self._total_bytes += size
+            self._evict_locked(keep=key)
+        return path
+
+    def _remove_locked(self, key):
+        entry = self._index.pop(key, None)
+        if not entry:
+            return
+        self._total_bytes -= entry['size']
+        try:
+            os.remove(entry['path'])
+        except OSError:
+            pass
+
+    def _evict_locked(self, keep=None):
+        """淘汰過期項目，再依 LRU 順序淘汰直到符合容量與筆數上限"""
+        now = time.time()
+        if self.max_age_seconds:
+            expired = [k for k, e in self._index.items()
+                       if now - e['created'] > self.max_age_seconds and k != keep]
+            for k in expired:
+                self._remove_locked(k)
+                self.evictions += 1
+
+        def over_limit():
+            if self.max_bytes and self._total_bytes > self.max_bytes:
+                return True
+            return bool(self.max_entries) and len(self._index) > self.max_entries
+
+        # 剛寫入的項目位於尾端，至少保留它
+        while over_limit() and len(self._index) > (1 if keep else 0):
+            self._remove_locked(next(iter(self._index)))
+            self.evictions += 1
+
+    def stats(self):
+        """返回快取統計資訊"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._index),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            }
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WAV 音訊工具
+在記憶體中以 NumPy 讀取、合併與輸出 16-bit PCM WAV，避免呼叫 ffmpeg。
+"""
+
+import io
+import wave
+import numpy as np
+
+
+def read_wav_bytes(data):
+    """解析 WAV 位元組，返回 (int16 PCM 陣列 shape=(樣本數, 聲道數), 採樣率)"""
+    with wave.open(io.BytesIO(data), 'rb') as w:
+        channels = w.getnchannels()
+        sample_rate = w.getframerate()
+        sample_width = w.getsampwidth()
+        frames = w.readframes(w.getnframes())
+
+    if sample_width == 2:
+        pcm = np.frombuffer(frames, dtype='<i2')
+    elif sample_width == 1:
+        pcm = ((np.frombuffer(frames, dtype=np.uint8).astype(np.int16) - 128) << 8)
+    elif sample_width == 4:
+        pcm = (np.frombuffer(frames, dtype='<i4') >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"不支援的取樣寬度: {sample_width * 8} bits")
+
+    return pcm.reshape(-1, channels), sample_rate
+
+
+def to_mono(pcm):
+    """多聲道取平均轉為單聲道，返回一維 int16 陣列"""
+    pcm = np.asarray(pcm)
+    if pcm.ndim == 1:
+        return pcm.astype(np.int16, copy=False)
+    if pcm.shape[1] == 1:
+        return pcm[:, 0].astype(np.int16, copy=False)
+    return pcm.astype(np.int32).mean(axis=1).astype(np.int16)
+
+
+def _lowpass_taps(cutoff, half_width):
+    """Hann 窗 sinc 低通濾波器係數（cutoff 為相對於採樣率的截止頻率，0~0.5）"""
+    n = np.arange(-half_width, half_width + 1)
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hanning(2 * half_width + 1)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+def resample(pcm, src_rate, dst_rate):
+    """
+    重新取樣一維 int16 PCM
+    降低採樣率時先以低通濾波濾掉新 Nyquist 頻率以上的成分（否則高頻會折疊成可聽見的雜音），
+    再以線性內插取樣
+    """
+    if src_rate == dst_rate or len(pcm) == 0:
+        return pcm
+    samples = pcm.astype(np.float32)
+    if dst_rate < src_rate:
+        ratio = src_rate / dst_rate
+        # 截止頻率略低於新 Nyquist，讓過渡帶落在其下；濾波器長度隨降頻倍數增加
+        taps = _lowpass_taps(0.45 / ratio, int(np.ceil(16 * ratio)))
+        samples = np.convolve(samples, taps, mode='same')
+    n_out = int(round(len(pcm) * dst_rate / src_rate))
+    positions = np.arange(n_out) * (src_rate / dst_rate)
+    out = np.interp(positions, np.arange(len(pcm)), samples)
+    return np.clip(np.round(out), -32768, 32767).astype(np.int16)
+
+
+def read_wav_file(path):
+    """讀取 WAV 檔案，返回 (int16 PCM 陣列, 採樣率)"""
+    with open(path, 'rb') as f:
+        return read_wav_bytes(f.read())
+
+
+def write_wav_bytes(pcm, sample_rate):
+    """將 int16 PCM 陣列（一維或 (樣本數, 聲道數)）輸出為 WAV 位元組"""
+    pcm = np.asarray(pcm, dtype=np.int16)
+    channels = 1 if pcm.ndim == 1 else pcm.shape[1]
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm.astype('<i2').tobytes())
+    return buf.getvalue()
+
+
+def concat_wav_files(paths, out_path):
+    """
+    依序合併多個 WAV 檔案（需相同採樣率與聲道數），
+    成功返回輸出路徑，失敗返回 None
+    """
+    try:
+        segments = []
+        sample_rate = None
+        for path in paths:
+            pcm, sr = read_wav_file(path)
+            if sample_rate is None:
+                sample_rate = sr
+            elif sr != sample_rate or pcm.shape[1] != segments[0].shape[1]:
+                print(f"WAV 格式不一致，無法合併: {path}")
+                return None
+            segments.append(pcm)
+        if not segments:
+            return None
+
+        with open(out_path, 'wb') as f:
+            f.write(write_wav_bytes(np.concatenate(segments), sample_rate))
+        return out_path
+    except Exception as e:
+        print(f"合併 WAV 失敗: {e}")
+        return None